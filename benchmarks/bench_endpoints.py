@@ -0,0 +1,230 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure cost of the OVSDB interface endpoints as relations grow.
+
+Each operation is run in a simulated hook of its own, against a new endpoint
+instance and with hook scoped caches cleared, and reports wall time, hook tool
+invocations and peak memory allocated.  Results are written as JSON so they
+can be compared between versions.
+
+Operations are measured in two scenarios.  In the ``cold`` scenario the unit
+kv store is empty, as in the first hook after the charm was installed.  In
+the ``warm`` scenario it holds what an earlier hook left behind, measuring the
+steady state of a ``-relation-changed`` hook for a single remote unit.
+
+Usage::
+
+    python3 -m benchmarks.bench_endpoints --units 1,100,5000 --output out.json
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks import fakes
+
+ENDPOINTS = (
+    # module, class, endpoint name, is peer relation
+    ('ovsdb.requires', 'OVSDBRequires', 'ovsdb', False),
+    ('ovsdb_cms.requires', 'OVSDBCMSRequires', 'ovsdb-cms', False),
+    ('ovsdb_cluster.peers', 'OVSDBClusterPeer', 'ovsdb-peer', True),
+)
+
+OPERATIONS = (
+    # name, operation, hook to run in if not the populated one
+    ('joined',
+     lambda ep: ep.joined(), None),
+    ('bound_address_changed',
+     lambda ep: ep.bound_address_changed(), None),
+    ('departed',
+     lambda ep: ep.departed(), 'relation-departed'),
+    ('cluster_remote_addrs',
+     lambda ep: list(ep.cluster_remote_addrs), None),
+    ('connection_strs',
+     lambda ep: (list(ep.db_nb_connection_strs),
+                 list(ep.db_sb_connection_strs)), None),
+    ('expected_units_available',
+     lambda ep: (ep.expected_peers_available()
+                 if hasattr(ep, 'expected_peers_available')
+                 else ep.expected_units_available()), None),
+)
+
+SCENARIOS = ('cold', 'warm')
+
+
+def remote_addr(n):
+    """Synthetic address for remote unit number n, every 4th one IPv6."""
+    if n % 4 == 3:
+        return '2001:db8::{:x}'.format(n + 1)
+    return '10.{}.{}.{}'.format((n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff)
+
+
+def populate(hookenv, endpoint_name, peer, units, relations):
+    """Populate hook environment with relations and remote units."""
+    hookenv.relations.clear()
+    hookenv.goal_state_units = []
+    app = 'ovn-central' if peer else 'ovn-chassis'
+    for r in range(relations):
+        relation_id = '{}:{}'.format(endpoint_name, r)
+        remote_units = {}
+        for n in range(r, units, relations):
+            unit_name = '{}{}/{}'.format(
+                app, '' if peer else '-{}'.format(r), n + 1)
+            remote_units[unit_name] = {
+                'bound-address': json.dumps(remote_addr(n)),
+                'private-address': remote_addr(n),
+            }
+            hookenv.goal_state_units.append(unit_name)
+        hookenv.add_relation(relation_id, remote_units)
+    hookenv.networks[endpoint_name] = {
+        'bind-addresses': [{
+            'interfacename': 'eth0',
+            'addresses': [{'address': '10.0.0.254', 'cidr': '10.0.0.0/24'}],
+        }],
+    }
+    # Simulate a changed hook for the last unit of the first relation.
+    first = next(iter(hookenv.relations))
+    remote = [unit for unit in hookenv.relations[first]
+              if unit != hookenv.local_unit()]
+    hookenv.set_hook('{}-relation-changed'.format(endpoint_name),
+                     relation_id=first,
+                     remote_unit=remote[-1] if remote else None)
+
+
+def run_hook(hookenv, kv, cls, endpoint_name, operation, hook=None,
+             kv_data=None):
+    """Run operation in a simulated hook of its own.
+
+    :param hook: Hook of the same relation and remote unit to run in, e.g.
+                 ``relation-departed``, the populated hook if None
+    :type hook: Optional[str]
+    :param kv_data: Unit kv store contents left by an earlier hook, an empty
+                    store if None
+    :type kv_data: Optional[Dict[str, str]]
+    """
+    hookenv.new_hook()
+    kv.data.clear()
+    if kv_data is None:
+        kv.set('reactive.states.leadership.set.ready', None)
+    else:
+        kv.data.update(kv_data)
+    populated = hookenv.hook
+    if hook:
+        hookenv.hook = '{}-{}'.format(endpoint_name, hook)
+    try:
+        endpoint = cls(endpoint_name, list(hookenv.relations.keys()))
+        operation(endpoint)
+    finally:
+        hookenv.hook = populated
+
+
+def prime(hookenv, kv, cls, endpoint_name):
+    """Run the joined handler in an earlier hook.
+
+    :returns: Unit kv store contents left behind
+    :rtype: Dict[str, str]
+    """
+    run_hook(hookenv, kv, cls, endpoint_name, lambda ep: ep.joined())
+    return dict(kv.data)
+
+
+def measure(hookenv, kv, cls, endpoint_name, operation, repeat, hook=None,
+            scenario='cold'):
+    kv_data = None
+    if scenario == 'warm':
+        kv_data = prime(hookenv, kv, cls, endpoint_name)
+    wall_times = []
+    for _ in range(repeat):
+        hookenv.reset_calls()
+        start = time.perf_counter()
+        run_hook(hookenv, kv, cls, endpoint_name, operation, hook=hook,
+                 kv_data=kv_data)
+        wall_times.append(time.perf_counter() - start)
+    calls = dict(hookenv.calls)
+    tracemalloc.start()
+    run_hook(hookenv, kv, cls, endpoint_name, operation, hook=hook,
+             kv_data=kv_data)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'wall_time': min(wall_times),
+        'hook_tools': calls,
+        'peak_memory': peak_memory,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--units', default='1,10,100,1000,5000',
+                        help='Comma separated numbers of remote units')
+    parser.add_argument('--relations', type=int, default=3,
+                        help='Number of relations to spread units across')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs, the fastest is reported')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Simulated milliseconds per hook tool call')
+    parser.add_argument('--workers', type=int,
+                        help='Maximum number of concurrent relation-get calls')
+    parser.add_argument('--output', help='Write JSON results to file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    hookenv, kv = fakes.install(
+        hookenv=fakes.FakeHookEnv(latency=args.latency / 1000))
+    sys.path.insert(0, 'src')
+    results = []
+    for module, class_name, endpoint_name, peer in ENDPOINTS:
+        module = importlib.import_module(module)
+        cls = getattr(module, class_name)
+        if args.workers:
+            module.ovsdb.RELATION_GET_WORKERS = args.workers
+        for units in (int(n) for n in args.units.split(',')):
+            populate(hookenv, endpoint_name, peer, units, args.relations)
+            for scenario in SCENARIOS:
+                for operation_name, operation, hook in OPERATIONS:
+                    result = {
+                        'endpoint': endpoint_name,
+                        'class': class_name,
+                        'units': units,
+                        'relations': args.relations,
+                        'scenario': scenario,
+                        'operation': operation_name,
+                    }
+                    result.update(measure(hookenv, kv, cls, endpoint_name,
+                                          operation, args.repeat, hook=hook,
+                                          scenario=scenario))
+                    results.append(result)
+    report = {
+        'python': platform.python_version(),
+        'latency': args.latency,
+        'workers': args.workers,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
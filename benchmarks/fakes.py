@@ -0,0 +1,294 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process stand-in for the Juju hook environment.
+
+``install`` replaces ``charmhelpers`` in ``sys.modules`` so that the real
+``charms.reactive`` Endpoint, Relation and RelatedUnit objects, and the
+interface code built on top of them, run against relation data and network
+bindings held in memory.  Every call that would fork a hook tool in a real
+hook is counted per hook tool.
+"""
+
+import atexit
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mock
+
+
+class FakeKV(object):
+    """In-memory stand-in for ``charmhelpers.core.unitdata.Storage``."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None, record=False):
+        if key not in self.data:
+            return default
+        return json.loads(self.data[key])
+
+    def set(self, key, value):
+        self.data[key] = json.dumps(value)
+        return value
+
+    def unset(self, key):
+        self.data.pop(key, None)
+
+    def getrange(self, key_prefix, strip=False):
+        return {(k[len(key_prefix):] if strip else k): json.loads(v)
+                for k, v in self.data.items() if k.startswith(key_prefix)}
+
+    def update(self, mapping, prefix=''):
+        for k, v in mapping.items():
+            self.set('{}{}'.format(prefix, k), v)
+
+    def unsetrange(self, keys=None, prefix=''):
+        if keys is None:
+            keys = [k[len(prefix):] for k in self.data if k.startswith(prefix)]
+        for k in keys:
+            self.unset('{}{}'.format(prefix, k))
+
+    def flush(self, save=True):
+        pass
+
+
+class FakeHookEnv(object):
+    """In-memory stand-in for ``charmhelpers.core.hookenv``.
+
+    Relation data is kept per relation ID and unit name with values in their
+    raw, as published, form.  Hook tool invocations are counted in
+    ``calls``, and results of the hook tools ``charmhelpers`` memoizes are
+    memoized the same way so the counts reflect what a real hook would fork.
+    Each invocation takes ``latency`` seconds, simulating the cost of forking
+    a hook tool, and may be made from worker threads.
+    """
+
+    CRITICAL = 'CRITICAL'
+    ERROR = 'ERROR'
+    WARNING = 'WARNING'
+    INFO = 'INFO'
+    DEBUG = 'DEBUG'
+    TRACE = 'TRACE'
+
+    def __init__(self, local_unit='ovn-central/0', latency=0.0):
+        self._local_unit = local_unit
+        self.latency = latency
+        self.cache = {}
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self.relations = collections.OrderedDict()
+        self.app_data = {}
+        self.leader = False
+        self.networks = {}
+        self.goal_state_units = []
+        self.hook = 'update-status'
+        self.hook_relation_id = None
+        self.hook_remote_unit = None
+
+    # Test setup
+
+    def add_relation(self, relation_id, units, app_data=None):
+        """Add relation with remote units.
+
+        :param relation_id: Relation ID, e.g. ``ovsdb:42``
+        :type relation_id: str
+        :param units: Map of unit name to raw relation data
+        :type units: Dict[str, Dict[str, str]]
+        :param app_data: Map of application name to raw relation data
+        :type app_data: Optional[Dict[str, Dict[str, str]]]
+        """
+        self.relations[relation_id] = collections.OrderedDict(
+            (unit_name, dict(data)) for unit_name, data in units.items())
+        self.relations[relation_id].setdefault(self._local_unit, {})
+        self.app_data[relation_id] = {
+            app: dict(data) for app, data in (app_data or {}).items()}
+
+    def set_hook(self, hook, relation_id=None, remote_unit=None):
+        self.hook = hook
+        self.hook_relation_id = relation_id
+        self.hook_remote_unit = remote_unit
+
+    def new_hook(self):
+        """Forget hook scoped state as a new hook invocation would."""
+        self.cache.clear()
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def _fork(self, tool):
+        with self._lock:
+            self.calls[tool] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _memoize(self, key, tool, func):
+        key = json.dumps(key)
+        if key not in self.cache:
+            self._fork(tool)
+            self.cache[key] = func()
+        return self.cache[key]
+
+    # hookenv API
+
+    def log(self, message, level=None):
+        self._fork('juju-log')
+
+    def flush(self, key):
+        for k in [k for k in self.cache if key in k]:
+            del self.cache[k]
+
+    def atstart(self, callback, *args, **kwargs):
+        pass
+
+    def atexit(self, callback, *args, **kwargs):
+        pass
+
+    def hook_name(self):
+        return self.hook
+
+    def local_unit(self):
+        return self._local_unit
+
+    def is_leader(self):
+        return self._memoize(('is_leader',), 'is-leader',
+                             lambda: self.leader)
+
+    def application_name(self):
+        return self._local_unit.split('/')[0]
+
+    def relation_id(self, relation_name=None, service_or_unit=None):
+        return self.hook_relation_id
+
+    def remote_unit(self):
+        return self.hook_remote_unit
+
+    def relation_type(self):
+        if self.hook_relation_id:
+            return self.hook_relation_id.split(':')[0]
+
+    def role_and_interface_to_relations(self, role, interface_name):
+        # Handlers are invoked directly, they need not be registered.
+        return []
+
+    def relation_ids(self, reltype=None):
+        return self._memoize(
+            ('relation_ids', reltype), 'relation-ids',
+            lambda: [rid for rid in self.relations
+                     if rid.split(':')[0] == reltype])
+
+    def related_units(self, relid=None):
+        return self._memoize(
+            ('related_units', relid), 'relation-list',
+            lambda: [unit for unit in self.relations.get(relid, {})
+                     if unit != self._local_unit])
+
+    def relation_get(self, attribute=None, unit=None, rid=None, app=None):
+        def _get():
+            if app:
+                data = self.app_data.get(rid, {}).get(app, {})
+            else:
+                data = self.relations.get(rid, {}).get(unit)
+            if data is None:
+                return None
+            data = dict(data)
+            if attribute:
+                return data.get(attribute)
+            return data
+        return self._memoize(('relation_get', attribute, unit, rid, app),
+                             'relation-get', _get)
+
+    def relation_set(self, relation_id=None, relation_settings=None,
+                     app=False, **kwargs):
+        self._fork('relation-set')
+        settings = dict(relation_settings or {}, **kwargs)
+        if app:
+            data = self.app_data[relation_id].setdefault(
+                self.application_name(), {})
+        else:
+            data = self.relations[relation_id][self._local_unit]
+        for key, value in settings.items():
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = str(value)
+        self.flush(self.application_name() if app else self._local_unit)
+
+    def network_get(self, endpoint, relation_id=None):
+        # results are looked up per relation first, then per binding
+        self._fork('network-get')
+        if (endpoint, relation_id) in self.networks:
+            return self.networks[(endpoint, relation_id)]
+        return self.networks[endpoint]
+
+    def goal_state(self):
+        self._fork('goal-state')
+        return {'units': {unit: {} for unit in self.goal_state_units}}
+
+    def expected_related_units(self, reltype=None):
+        goal_state = self.goal_state()
+        return (unit for unit in goal_state['units']
+                if unit.split('/')[0] != self.application_name())
+
+    def expected_peer_units(self):
+        goal_state = self.goal_state()
+        return (unit for unit in goal_state['units']
+                if unit != self._local_unit)
+
+
+def install(hookenv=None, kv=None):
+    """Replace ``charmhelpers`` with the stand-in hook environment.
+
+    Must be called before ``charms.reactive`` or any of the interface modules
+    are imported.  Files the endpoints keep in the charm directory are
+    written to a temporary directory removed at exit.
+
+    :param hookenv: Hook environment to install, a new one if None
+    :type hookenv: Optional[FakeHookEnv]
+    :param kv: Unit kv storage to install, a new one if None
+    :type kv: Optional[FakeKV]
+    :returns: Installed hook environment and unit kv storage
+    :rtype: Tuple[FakeHookEnv, FakeKV]
+    :raises: RuntimeError
+    """
+    if 'charms.reactive' in sys.modules:
+        raise RuntimeError('charms.reactive imported before stand-in hook '
+                           'environment was installed')
+    hookenv = hookenv or FakeHookEnv()
+    kv = kv or FakeKV()
+    charmhelpers = mock.MagicMock()
+    charmhelpers.core.hookenv = hookenv
+    charmhelpers.core.unitdata.kv.return_value = kv
+    # keep functions exposed on the command line, e.g. the flag functions,
+    # as they are
+    charmhelpers.cli.cmdline.subcommand.return_value = lambda func: func
+    charmhelpers.cli.cmdline.no_output = lambda func: func
+    charmhelpers.cli.cmdline.test_command = lambda func: func
+    charm_dir = tempfile.mkdtemp(prefix='charm-')
+    atexit.register(shutil.rmtree, charm_dir, ignore_errors=True)
+    os.environ['JUJU_CHARM_DIR'] = charm_dir
+    sys.modules['charmhelpers'] = charmhelpers
+    sys.modules['charmhelpers.cli'] = charmhelpers.cli
+    sys.modules['charmhelpers.core'] = charmhelpers.core
+    sys.modules['charmhelpers.core.hookenv'] = hookenv
+    sys.modules['charmhelpers.core.host'] = charmhelpers.core.host
+    sys.modules['charmhelpers.core.templating'] = charmhelpers.core.templating
+    sys.modules['charmhelpers.core.unitdata'] = charmhelpers.core.unitdata
+    return hookenv, kv
@@ -0,0 +1,147 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Replay relation and network data captured from a deployment.
+
+A capture file is written by a charm that called ``enable_capture()`` on
+one of its endpoints.  Each captured endpoint is replayed against the class
+it was captured from, running the same operations as ``bench_endpoints`` in
+the captured hook, and wall time, hook tool invocations and peak memory
+allocated are reported as JSON.  Like ``bench_endpoints`` each operation is
+measured with an empty unit kv store and with the one an earlier hook left
+behind.  Endpoints implemented by a class ``bench_endpoints`` does not
+benchmark, e.g. the provides side, are skipped.
+
+Usage::
+
+    python3 -m benchmarks.replay capture.json --output out.json
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import sys
+
+from benchmarks import bench_endpoints
+from benchmarks import fakes
+
+# Version of the capture file format understood
+CAPTURE_VERSION = 1
+
+
+def load(path):
+    """Load capture file.
+
+    :param path: Path of capture file
+    :type path: str
+    :returns: Captured data
+    :rtype: Dict
+    :raises: ValueError
+    """
+    with open(path) as f:
+        capture = json.load(f)
+    if capture.get('v') != CAPTURE_VERSION:
+        raise ValueError('Unsupported capture file version {!r}, expected {}'
+                         .format(capture.get('v'), CAPTURE_VERSION))
+    return capture
+
+
+def populate(hookenv, capture, endpoint_name):
+    """Populate hook environment with captured data of an endpoint."""
+    hookenv.relations.clear()
+    # captures of earlier versions of the library have no application data
+    apps = capture.get('apps', {}).get(endpoint_name, {})
+    for relation_id, units in sorted(
+            capture['relations'][endpoint_name].items()):
+        hookenv.add_relation(relation_id, units,
+                             app_data=apps.get(relation_id))
+    hookenv.networks.clear()
+    for binding, networks in capture['networks'].items():
+        for relation_id, data in sorted(networks.items()):
+            hookenv.networks[(binding, relation_id or None)] = data
+            # queries not captured fall back to the first result
+            hookenv.networks.setdefault(binding, data)
+    hookenv.goal_state_units = capture['goal_state_units'] or [
+        unit for units in capture['relations'][endpoint_name].values()
+        for unit in units]
+    relation_id = capture.get('relation_id')
+    if relation_id and relation_id.split(':')[0] != endpoint_name:
+        relation_id = None
+    hookenv.set_hook(capture['hook'], relation_id=relation_id,
+                     remote_unit=capture.get('remote_unit')
+                     if relation_id else None)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='Capture file to replay')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs, the fastest is reported')
+    parser.add_argument('--output', help='Write JSON results to file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    capture = load(args.capture)
+    hookenv, kv = fakes.install(
+        hookenv=fakes.FakeHookEnv(local_unit=capture['local_unit']))
+    sys.path.insert(0, 'src')
+    modules = {class_name: module
+               for module, class_name, _, _ in bench_endpoints.ENDPOINTS}
+    endpoint_classes = capture.get('endpoints') or {}
+    results = []
+    skipped = []
+    for endpoint_name in sorted(capture['relations']):
+        class_name = endpoint_classes.get(endpoint_name)
+        if class_name not in modules:
+            skipped.append(endpoint_name)
+            continue
+        cls = getattr(importlib.import_module(modules[class_name]),
+                      class_name)
+        populate(hookenv, capture, endpoint_name)
+        units = sum(len(units) for units
+                    in capture['relations'][endpoint_name].values())
+        for scenario in bench_endpoints.SCENARIOS:
+            for operation_name, operation, hook in bench_endpoints.OPERATIONS:
+                result = {
+                    'endpoint': endpoint_name,
+                    'class': class_name,
+                    'units': units,
+                    'relations': len(capture['relations'][endpoint_name]),
+                    'scenario': scenario,
+                    'operation': operation_name,
+                }
+                result.update(bench_endpoints.measure(
+                    hookenv, kv, cls, endpoint_name, operation, args.repeat,
+                    hook=hook, scenario=scenario))
+                results.append(result)
+    report = {
+        'python': platform.python_version(),
+        'capture': args.capture,
+        'hook': capture['hook'],
+        'results': results,
+        'skipped': skipped,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# NOTE: Capturing is opt-in, nothing is recorded unless a charm calls
+#       ``enable``.  The captured file can be replayed offline with
+#       ``benchmarks/replay.py``.
+
+import json
+import os
+
+import charmhelpers.core as ch_core
+
+CACHE_KEY = 'charm-interface-ovsdb.capture'
+
+# Version of the capture file format
+CAPTURE_VERSION = 1
+
+
+class Capture(object):
+    """Capture relation and ``network-get`` data seen by endpoints."""
+
+    def __init__(self, path):
+        """Initialize capture.
+
+        :param path: Path of file to write capture to
+        :type path: str
+        """
+        self.path = path
+        self.endpoints = {}
+        self.relations = {}
+        self.apps = {}
+        self.networks = {}
+
+    def record_relations(self, endpoint_name, relations, endpoint_class=None):
+        """Record raw data of remote units and applications of an endpoint.
+
+        :param endpoint_name: Name of endpoint
+        :type endpoint_name: str
+        :param relations: Relations of endpoint
+        :type relations: Iterable[charms.reactive.endpoints.Relation]
+        :param endpoint_class: Name of class implementing the endpoint, used
+                               to replay it against the same class
+        :type endpoint_class: Optional[str]
+        """
+        relations = list(relations)
+        self.endpoints[endpoint_name] = endpoint_class
+        self.relations[endpoint_name] = {
+            relation.relation_id: {
+                unit.unit_name: dict(unit.received_raw)
+                for unit in relation.units}
+            for relation in relations}
+        # the remote application is only known once one of its units joined
+        self.apps[endpoint_name] = {
+            relation.relation_id: {
+                relation.application_name: dict(relation.received_app_raw)}
+            for relation in relations
+            if relation.application_name}
+
+    def record_network(self, binding, relation_id, data):
+        """Record result of ``network-get`` query.
+
+        :param binding: Name of endpoint or extra-binding
+        :type binding: str
+        :param relation_id: Relation ID of query
+        :type relation_id: Optional[str]
+        :param data: Loaded output of query
+        :type data: Dict
+        """
+        self.networks.setdefault(binding, {})[relation_id or ''] = data
+
+    def dump(self):
+        """Captured data in the capture file format.
+
+        :returns: Captured data
+        :rtype: Dict
+        """
+        try:
+            goal_state_units = sorted(
+                ch_core.hookenv.goal_state().get('units', {}).keys())
+        except (NotImplementedError, OSError, ValueError):
+            goal_state_units = None
+        return {
+            'v': CAPTURE_VERSION,
+            'local_unit': ch_core.hookenv.local_unit(),
+            'hook': ch_core.hookenv.hook_name(),
+            'relation_id': ch_core.hookenv.relation_id(),
+            'remote_unit': ch_core.hookenv.remote_unit(),
+            'goal_state_units': goal_state_units,
+            'endpoints': self.endpoints,
+            'relations': self.relations,
+            'apps': self.apps,
+            'networks': self.networks,
+        }
+
+    def write(self):
+        """Atomically write compact capture file."""
+        import tempfile
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.dump(), f, separators=(',', ':'), sort_keys=True)
+        os.chmod(tmp, 0o600)
+        os.rename(tmp, self.path)
+
+    def report(self):
+        """Write capture file, called at the end of the hook."""
+        if self.path is None:
+            return
+        try:
+            self.write()
+        except OSError as e:
+            ch_core.hookenv.log('Unable to write "{}": {}'
+                                .format(self.path, e),
+                                level=ch_core.hookenv.WARNING)
+
+
+def get_capture():
+    """Get capture, shared by all copies of this library in a charm.
+
+    :returns: Capture, None when capturing is not enabled
+    :rtype: Optional[Capture]
+    """
+    return ch_core.hookenv.cache.get(CACHE_KEY)
+
+
+def enable(path):
+    """Enable capturing of relation and network data for the current hook.
+
+    The capture file is written at the end of a successful hook.  It holds
+    the relation data of the remote units, which may be sensitive, and is
+    only readable by its owner.
+
+    :param path: Path of file to write capture to
+    :type path: str
+    :returns: Capture
+    :rtype: Capture
+    """
+    capture = get_capture()
+    if capture is not None:
+        capture.path = path
+        return capture
+    capture = Capture(path)
+    ch_core.hookenv.cache[CACHE_KEY] = capture
+    ch_core.hookenv.atexit(capture.report)
+    return capture
+
+
+def disable():
+    """Disable capturing, nothing is written at the end of the hook."""
+    capture = ch_core.hookenv.cache.pop(CACHE_KEY, None)
+    if capture is not None:
+        capture.path = None
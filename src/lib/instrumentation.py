@@ -0,0 +1,258 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# NOTE: Instrumentation is opt-in, nothing is recorded unless a charm calls
+#       ``enable``.  Hook tools are instrumented by wrapping the functions in
+#       ``charmhelpers.core.hookenv`` so that calls made on our behalf by
+#       ``charms.reactive``, e.g. ``relation-get`` when reading
+#       ``unit.received``, are accounted for too.
+
+import collections
+import functools
+import os
+import threading
+import time
+
+import charmhelpers.core as ch_core
+
+CACHE_KEY = 'charm-interface-ovsdb.instrumentation'
+
+# Map of ``charmhelpers.core.hookenv`` function to hook tool name
+HOOK_TOOLS = collections.OrderedDict((
+    ('network_get', 'network-get'),
+    ('relation_get', 'relation-get'),
+    ('relation_set', 'relation-set'),
+    ('expected_related_units', 'expected-related-units'),
+    ('expected_peer_units', 'expected-peer-units'),
+))
+
+# Upper bounds of latency histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+METRIC = 'charm_interface_ovsdb_hook_tool_duration_seconds'
+
+
+class Histogram(object):
+    """Latency histogram with cumulative buckets as used by Prometheus."""
+
+    __slots__ = ('buckets', 'count', 'sum')
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for n, upper_bound in enumerate(BUCKETS):
+            if value <= upper_bound:
+                self.buckets[n] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Recorder(object):
+    """Record hook tool calls per endpoint, method and hook tool."""
+
+    def __init__(self, textfile=None):
+        """Initialize recorder.
+
+        :param textfile: Path to Prometheus textfile collector file, the file
+                         is not written if None
+        :type textfile: Optional[str]
+        """
+        self.textfile = textfile
+        self.histograms = collections.OrderedDict()
+        self.context = []
+        self.originals = {}
+        # hook tools may be called from worker threads
+        self._lock = threading.Lock()
+
+    def observe(self, tool, duration, endpoint=None):
+        """Record a hook tool call.
+
+        The call is attributed to the innermost instrumented method being
+        executed, if any.
+
+        :param tool: Name of hook tool
+        :type tool: str
+        :param duration: Duration of call in seconds
+        :type duration: float
+        :param endpoint: Name of endpoint, used when the call is not made
+                         from an instrumented method
+        :type endpoint: Optional[str]
+        """
+        if self.context:
+            endpoint, method = self.context[-1]
+        else:
+            method = None
+        key = (endpoint or '-', method or '-', tool)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(duration)
+
+    def summary(self):
+        """Summary of recorded calls, one line per endpoint, method and tool.
+
+        :returns: Lines of summary
+        :rtype: List[str]
+        """
+        return ['{} {} {}: {} calls, {:.3f}s'
+                .format(endpoint, method, tool, histogram.count,
+                        histogram.sum)
+                for (endpoint, method, tool), histogram
+                in self.histograms.items()]
+
+    def prometheus(self):
+        """Render recorded calls in Prometheus text exposition format.
+
+        :returns: Metrics
+        :rtype: str
+        """
+        unit = ch_core.hookenv.local_unit()
+        hook = ch_core.hookenv.hook_name()
+        lines = [
+            '# HELP {} Duration of hook tool calls made by OVSDB endpoints '
+            'in the last hook.'.format(METRIC),
+            '# TYPE {} histogram'.format(METRIC),
+        ]
+        for (endpoint, method, tool), histogram in self.histograms.items():
+            labels = ('unit="{}",hook="{}",endpoint="{}",method="{}",'
+                      'tool="{}"'.format(unit, hook, endpoint, method, tool))
+            for upper_bound, count in zip(BUCKETS, histogram.buckets):
+                lines.append('{}_bucket{{{},le="{}"}} {}'
+                             .format(METRIC, labels, upper_bound, count))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'
+                         .format(METRIC, labels, histogram.count))
+            lines.append('{}_sum{{{}}} {}'
+                         .format(METRIC, labels, histogram.sum))
+            lines.append('{}_count{{{}}} {}'
+                         .format(METRIC, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self):
+        """Atomically write metrics to Prometheus textfile collector file."""
+        import tempfile
+        directory = os.path.dirname(self.textfile) or '.'
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.prometheus())
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, self.textfile)
+
+    def report(self):
+        """Log summary and write textfile, called at the end of the hook."""
+        for line in self.summary():
+            ch_core.hookenv.log('hook tool calls: {}'.format(line),
+                                level=ch_core.hookenv.DEBUG)
+        if self.textfile:
+            try:
+                self.write_textfile()
+            except OSError as e:
+                ch_core.hookenv.log('Unable to write "{}": {}'
+                                    .format(self.textfile, e),
+                                    level=ch_core.hookenv.WARNING)
+
+
+def get_recorder():
+    """Get recorder, shared by all copies of this library in a charm.
+
+    :returns: Recorder, None when instrumentation is not enabled
+    :rtype: Optional[Recorder]
+    """
+    return ch_core.hookenv.cache.get(CACHE_KEY)
+
+
+def _endpoint_from_args(tool, args, kwargs):
+    if tool == 'network-get':
+        return args[0] if args else kwargs.get('endpoint')
+    if tool == 'expected-related-units':
+        return args[0] if args else kwargs.get('reltype')
+    if tool == 'relation-set':
+        relation_id = args[0] if args else kwargs.get('relation_id')
+    else:
+        relation_id = kwargs.get('rid')
+    if relation_id:
+        return relation_id.split(':')[0]
+
+
+def _wrap(func, tool):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        recorder = get_recorder()
+        if recorder is None:
+            return func(*args, **kwargs)
+        start = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            recorder.observe(tool, time.monotonic() - start,
+                             endpoint=_endpoint_from_args(tool, args, kwargs))
+    return wrapper
+
+
+def enable(textfile=None):
+    """Enable instrumentation of hook tool calls for the current hook.
+
+    A summary is written to the Juju log, and optionally a Prometheus
+    textfile collector file, at the end of a successful hook.
+
+    :param textfile: Path to Prometheus textfile collector file, e.g.
+                     ``/var/lib/prometheus/node-exporter/ovsdb.prom``
+    :type textfile: Optional[str]
+    :returns: Recorder
+    :rtype: Recorder
+    """
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.textfile = textfile or recorder.textfile
+        return recorder
+    recorder = Recorder(textfile=textfile)
+    for name, tool in HOOK_TOOLS.items():
+        recorder.originals[name] = getattr(ch_core.hookenv, name)
+        setattr(ch_core.hookenv, name, _wrap(recorder.originals[name], tool))
+    ch_core.hookenv.cache[CACHE_KEY] = recorder
+    ch_core.hookenv.atexit(recorder.report)
+    return recorder
+
+
+def disable():
+    """Disable instrumentation and restore ``charmhelpers`` functions."""
+    recorder = ch_core.hookenv.cache.pop(CACHE_KEY, None)
+    if recorder is None:
+        return
+    for name, func in recorder.originals.items():
+        setattr(ch_core.hookenv, name, func)
+
+
+def instrumented(func):
+    """Attribute hook tool calls made while executing method to it.
+
+    :param func: Endpoint method
+    :type func: Callable
+    :returns: Wrapped method
+    :rtype: Callable
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        recorder = get_recorder()
+        if recorder is None:
+            return func(self, *args, **kwargs)
+        recorder.context.append((self.endpoint_name, func.__name__))
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            recorder.context.pop()
+    return wrapper
@@ -18,18 +18,736 @@
 #       Consume the shared code from the interface specific files and declare
 #       which flags to react to there.
 
-import inspect
-import ipaddress
+# NOTE: This module is loaded in every hook of a charm consuming the
+#       interfaces, modules only needed when processing relation data are
+#       imported where they are used.
+
+import collections
+import json
+import time
 
 import charmhelpers.core as ch_core
 
 import charms.reactive as reactive
 
+# NOTE: ``instrumentation`` provides the decorator used on methods below and
+#       is needed at import time, the other modules of this library are
+#       imported where they are used.
+from . import instrumentation
+
+
+# NOTE: In a built charm each interface gets its own copy of this library, the
+#       ``ovsdb``, ``ovsdb-cms`` and ``ovsdb-cluster`` endpoints will as such
+#       not share module level state.  Hook scoped data meant to be shared
+#       among them is kept in the ``charmhelpers`` hook environment cache.
+CACHE_NAMESPACE = 'charm-interface-ovsdb'
+
+
+def _hook_cache(name):
+    """Get hook scoped cache shared by all copies of this library.
+
+    :param name: Name of cache
+    :type name: str
+    :returns: Cache
+    :rtype: Dict
+    """
+    return ch_core.hookenv.cache.setdefault(
+        CACHE_NAMESPACE, {}).setdefault(name, {})
+
+
+def network_get(binding, relation_id=None):
+    """Retrieve network details for binding, memoized for the hook invocation.
+
+    :param binding: Name of endpoint or extra-binding
+    :type binding: str
+    :param relation_id: Relation ID for the current context
+    :type relation_id: Optional[str]
+    :returns: Loaded YAML output of the ``network-get`` query
+    :rtype: Dict
+    """
+    cache = _hook_cache('network-get')
+    key = (binding, relation_id)
+    if key not in cache:
+        cache[key] = ch_core.hookenv.network_get(
+            binding, relation_id=relation_id)
+        from . import capture
+        recorder = capture.get_capture()
+        if recorder:
+            recorder.record_network(binding, relation_id, cache[key])
+    return cache[key]
+
+
+def invalidate_network_get(binding=None, relation_id=None):
+    """Invalidate memoized ``network-get`` results.
+
+    :param binding: Only invalidate results for this binding, all if None
+    :type binding: Optional[str]
+    :param relation_id: Only invalidate results for this relation ID, all if
+                        None
+    :type relation_id: Optional[str]
+    """
+    cache = _hook_cache('network-get')
+    for key in list(cache.keys()):
+        cached_binding, cached_relation_id = key
+        if binding not in (None, cached_binding):
+            continue
+        if relation_id not in (None, cached_relation_id):
+            continue
+        del cache[key]
+
+
+# Maximum number of addresses kept in the address cache
+ADDR_CACHE_SIZE = 8192
+
+AddrCacheInfo = collections.namedtuple(
+    'AddrCacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+def _parse_addr(addr):
+    import ipaddress
+    ipaddr = ipaddress.ip_address(addr)
+    if ipaddr.version == 6:
+        fmt = '[{}]'
+    else:
+        fmt = '{}'
+    return ipaddr, fmt.format(ipaddr)
+
+
+class AddrCache(object):
+    """Bounded LRU cache of parsed and formatted addresses.
+
+    Invalid addresses are cached too, so that repeatedly encountering the
+    same invalid value does not result in repeated parsing attempts.
+    """
+
+    def __init__(self, maxsize=ADDR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def parse(self, addr):
+        """Validate and format IP address
+
+        :param addr: IPv6 or IPv4 address
+        :type addr: str
+        :returns: Parsed address and address string, optionally encapsulated
+                  in brackets ([]), None if address is invalid
+        :rtype: Optional[Tuple[Union[ipaddress.IPv4Address,
+                                     ipaddress.IPv6Address], str]]
+        """
+        try:
+            result = self._data[addr]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable, not an address anyway
+            self.misses += 1
+            return None
+        else:
+            self._data.move_to_end(addr)
+            self.hits += 1
+            return result
+        self.misses += 1
+        try:
+            result = _parse_addr(addr)
+        except ValueError:
+            result = None
+        self._data[addr] = result
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return result
+
+    def info(self):
+        """Get cache statistics.
+
+        :returns: Cache statistics
+        :rtype: AddrCacheInfo
+        """
+        return AddrCacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._data))
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = 0
+
+
+def get_addr_cache():
+    """Get address cache shared by all copies of this library.
+
+    :returns: Address cache
+    :rtype: AddrCache
+    """
+    cache = _hook_cache('addr')
+    if 'lru' not in cache:
+        cache['lru'] = AddrCache()
+    return cache['lru']
+
+
+def parse_addr(addr):
+    """Validate and format IP address
+
+    :param addr: IPv6 or IPv4 address
+    :type addr: str
+    :returns: Parsed address and address string, optionally encapsulated in
+              brackets ([])
+    :rtype: Tuple[Union[ipaddress.IPv4Address, ipaddress.IPv6Address], str]
+    :raises: ValueError
+    """
+    result = get_addr_cache().parse(addr)
+    if result is None:
+        raise ValueError('{!r} does not appear to be an IPv4 or IPv6 address'
+                         .format(addr))
+    return result
+
+
+def parse_addrs(addrs):
+    """Validate and format IP addresses in bulk.
+
+    :param addrs: IPv6 or IPv4 addresses
+    :type addrs: Iterable[str]
+    :returns: Parsed address and address string for each address, None for
+              invalid addresses
+    :rtype: List[Optional[Tuple[Union[ipaddress.IPv4Address,
+                                      ipaddress.IPv6Address], str]]]
+    """
+    cache = get_addr_cache()
+    return [cache.parse(addr) for addr in addrs]
+
+
+def format_addrs(addrs):
+    """Validate and format IP addresses in bulk, dropping invalid addresses.
+
+    :param addrs: IPv6 or IPv4 addresses
+    :type addrs: Iterable[str]
+    :returns: Address strings, optionally encapsulated in brackets ([])
+    :rtype: List[str]
+    """
+    return [result[1] for result in parse_addrs(addrs) if result]
+
+
+def parse_zones(zones):
+    """Parse map of CIDR to zone name.
+
+    :param zones: Map of CIDR to zone name
+    :type zones: Dict[str, str]
+    :returns: Networks and zone names, most specific network first
+    :rtype: List[Tuple[Union[ipaddress.IPv4Network, ipaddress.IPv6Network],
+                       str]]
+    :raises: ValueError
+    """
+    import ipaddress
+    networks = [(ipaddress.ip_network(cidr, strict=False), zone)
+                for cidr, zone in (zones or {}).items()]
+    return sorted(networks, key=lambda x: x[0].prefixlen, reverse=True)
+
+
+def _in_network(ipaddr, network):
+    return network.version == ipaddr.version and ipaddr in network
+
+
+def _zone_of(ipaddr, networks):
+    for network, zone in networks:
+        if _in_network(ipaddr, network):
+            return zone
+
+
+def _shared_prefixlen(a, b):
+    if a.version != b.version:
+        return 0
+    return a.max_prefixlen - (int(a) ^ int(b)).bit_length()
+
+
+def locality_key(local_addr, local_network=None, zones=None):
+    """Get sort key ranking addresses by how close they are to local address.
+
+    Addresses in the local network rank first, followed by addresses in the
+    same zone as the local address, followed by the rest.  Within each of
+    these tiers addresses sharing the longest prefix with the local address
+    rank first.
+
+    :param local_addr: Local address
+    :type local_addr: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+    :param local_network: Local network
+    :type local_network: Optional[Union[ipaddress.IPv4Network,
+                                        ipaddress.IPv6Network]]
+    :param zones: Networks and zone names as returned by ``parse_zones``
+    :type zones: Optional[List[Tuple[Union[ipaddress.IPv4Network,
+                                           ipaddress.IPv6Network], str]]]
+    :returns: Key function for use with ``sorted``
+    :rtype: Callable[[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]],
+                     Tuple[int, int]]
+    """
+    zones = zones or []
+    local_zone = _zone_of(local_addr, zones)
+
+    def _key(ipaddr):
+        if local_network and _in_network(ipaddr, local_network):
+            tier = 0
+        elif local_zone is not None and _zone_of(ipaddr, zones) == local_zone:
+            tier = 1
+        else:
+            tier = 2
+        return tier, -_shared_prefixlen(local_addr, ipaddr)
+
+    return _key
+
+
+def rendezvous_key(client):
+    """Get sort key ranking servers by rendezvous hashing weight for client.
+
+    Each client gets its own, stable, order of servers, spreading clients
+    evenly over servers.  When a server is added or removed only the clients
+    ranking that server first move.
+
+    :param client: Client identifier, e.g. the name of the local unit
+    :type client: str
+    :returns: Key function for use with ``sorted``, taking a server
+              identifier, e.g. the name of the remote unit
+    :rtype: Callable[[str], int]
+    """
+    import hashlib
+    prefix = '{}\0'.format(client).encode('utf-8')
+
+    def _key(server):
+        digest = hashlib.sha256(prefix + server.encode('utf-8')).digest()
+        # highest weight first
+        return -int.from_bytes(digest[:8], 'big')
+
+    return _key
+
+
+# Upper bound of concurrent ``relation-get`` calls when loading relation data
+RELATION_GET_WORKERS = 8
+
+
+def prefetch_received(units, max_workers=None):
+    """Load data received from remote units in bulk.
+
+    Juju has no hook tool returning the data of more than one unit, each unit
+    costs one ``relation-get`` call returning all of its keys.  Those calls
+    are made concurrently, with at most ``max_workers`` in flight, for the
+    units whose data has not been loaded yet.  Reading ``unit.received``
+    afterwards does not invoke any hook tools.
+
+    :param units: Remote units
+    :type units: Iterable[charms.reactive.endpoints.RelatedUnit]
+    :param max_workers: Maximum number of concurrent calls, defaults to
+                        ``RELATION_GET_WORKERS``
+    :type max_workers: Optional[int]
+    :returns: Number of units data was loaded for
+    :rtype: int
+    """
+    # NOTE: ``RelatedUnit`` loads its data lazily on first access and keeps
+    #       it in ``_data``, which is what is filled in here.
+    pending = [unit for unit in units if unit._data is None]
+    if not pending:
+        return 0
+
+    def _fetch(unit):
+        return ch_core.hookenv.relation_get(unit=unit.unit_name,
+                                            rid=unit.relation.relation_id)
+
+    workers = min(max_workers or RELATION_GET_WORKERS, len(pending))
+    if workers < 2:
+        results = map(_fetch, pending)
+    else:
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(_fetch, pending))
+    for unit, data in zip(pending, results):
+        unit._data = reactive.endpoints.JSONUnitDataView(data)
+    return len(pending)
+
+
+class UnitRecord(collections.namedtuple('UnitRecord', (
+        'relation_id', 'unit_name', 'bound_address', 'address',
+        'formatted_address', 'valid', 'raft', 'profile', 'addresses',
+        'ports', 'cluster_address', 'relay_upstream'))):
+    """Data published by a single remote unit.
+
+    ``bound_address`` holds the raw value as received, ``address`` and
+    ``formatted_address`` are None unless ``valid`` is True.  ``raft`` maps
+    database to the Raft status published by the unit, and ``profile`` holds
+    its connection profile, if any.  ``addresses`` holds all valid addresses
+    the unit published and ``ports`` maps database to client port.
+    ``cluster_address`` holds the formatted address the unit uses for Raft
+    cluster traffic if it published a separate one.  ``relay_upstream`` is
+    None for Raft cluster members and holds the SB connection strings of the
+    cluster for OVSDB relay units.
+    """
+    __slots__ = ()
+
+    @property
+    def is_relay(self):
+        return self.relay_upstream is not None
+
+
+UnitRecord.__new__.__defaults__ = (None, None, (), None, None, None)
+
+
+def _parse_relay(data):
+    if not isinstance(data, dict):
+        return None
+    upstream = data.get('sb-upstream')
+    if not isinstance(upstream, list):
+        return ()
+    return tuple(str(connection_str) for connection_str in upstream)
+
+
+class UnitAddress(collections.namedtuple('UnitAddress', (
+        'interface', 'address', 'formatted_address', 'cidr'))):
+    """Address a unit bound its OVSDB Servers to."""
+    __slots__ = ()
+
+
+# Version of the payload published in the ``addresses`` relation key
+ADDRESSES_VERSION = 1
+
+
+def addresses_payload(bind_addrs, ports):
+    """Build compact payload announcing all addresses of a unit.
+
+    :param bind_addrs: Interface name, address and CIDR of each address
+    :type bind_addrs: Iterable[Tuple[str, str, str]]
+    :param ports: Map of database to client port
+    :type ports: Dict[str, int]
+    :returns: Payload
+    :rtype: Dict
+    """
+    return {
+        'v': ADDRESSES_VERSION,
+        'a': [[interface or '', address, cidr or '']
+              for interface, address, cidr in bind_addrs],
+        'p': ports,
+    }
+
+
+def _parse_addresses_payload(data):
+    if not isinstance(data, dict) or data.get('v') != ADDRESSES_VERSION:
+        return (), None
+    entries = data.get('a')
+    ports = data.get('p')
+    if not isinstance(entries, list):
+        return (), None
+    entries = [entry for entry in entries
+               if isinstance(entry, list) and len(entry) == 3]
+    if not isinstance(ports, dict):
+        return entries, None
+    return entries, {db: port for db, port in ports.items()
+                     if type(port) is int and 0 < port < 65536}
+
+
+class ConnectionProfile(collections.namedtuple('ConnectionProfile', (
+        'protocols', 'unix_sockets'))):
+    """Ways of connecting to a provider unit for co-located consumers.
+
+    ``protocols`` lists the protocols the provider allows local clients to
+    use and ``unix_sockets`` maps database to the path of its unix socket.
+    """
+    __slots__ = ()
+
+
+def _parse_connection_profile(data):
+    if not isinstance(data, dict):
+        return None
+    from . import raft
+    protocols = data.get('protocols')
+    unix_sockets = data.get('unix-sockets') or {}
+    if not isinstance(protocols, list) or not isinstance(unix_sockets, dict):
+        return None
+    return ConnectionProfile(
+        tuple(str(protocol) for protocol in protocols),
+        {db: str(path) for db, path in unix_sockets.items()
+         if db in raft.DATABASES and path})
+
+
+def _parse_raft_status(data):
+    if not isinstance(data, dict):
+        return None
+    from . import raft
+    statuses = {}
+    for db in raft.DATABASES:
+        try:
+            statuses[db] = raft.RaftStatus(str(data[db]['role']),
+                                           int(data[db]['term']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return statuses or None
+
+
+def _split_connection_str(connection_str):
+    return tuple(s for s in (connection_str or '').split(',') if s)
+
+
+def _connection_str_addr(connection_str):
+    """Formatted address of a ``proto:addr:port`` connection string."""
+    _, _, addr_port = connection_str.partition(':')
+    return addr_port.rpartition(':')[0]
+
+
+class ConnectionStrs(collections.namedtuple('ConnectionStrs', (
+        'relation_id', 'generation', 'nb', 'sb'))):
+    """Connection strings pre-rendered and published by a provider."""
+    __slots__ = ()
+
+
+class RelationSnapshot(collections.namedtuple('RelationSnapshot', (
+        'units', 'remote_addrs', 'tuning_hints'))):
+    """Immutable snapshot of data published by remote units of an endpoint.
+
+    The snapshot is built in a single pass over relations and units of an
+    endpoint, and is meant to be shared by all consumers of that data for the
+    duration of a hook invocation.
+
+    ``remote_addrs`` holds the formatted addresses of valid Raft cluster
+    members, OVSDB relay units are left out.  ``tuning_hints`` holds the
+    first valid tuning hints published, None if no unit published any.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_relations(cls, relations, exclude=None):
+        """Build snapshot from relations.
+
+        :param relations: Relations of an endpoint
+        :type relations: Iterable[charms.reactive.endpoints.Relation]
+        :param exclude: Relation ID and unit name of units to leave out
+        :type exclude: Optional[Set[Tuple[str, str]]]
+        :returns: Snapshot
+        :rtype: RelationSnapshot
+        """
+        from . import tuning
+        exclude = exclude or set()
+        received = []
+        tuning_hints = None
+        for relation in relations:
+            for unit in relation.units:
+                if (relation.relation_id, unit.unit_name) in exclude:
+                    continue
+                data = unit.received
+                received.append((relation.relation_id, unit.unit_name, data))
+                if tuning_hints is None:
+                    tuning_hints = tuning.from_payload(
+                        data.get('tuning-hints'))
+        units = []
+        bound_addresses = []
+        payloads = []
+        for _, _, data in received:
+            entries, ports = _parse_addresses_payload(data.get('addresses'))
+            payloads.append((entries, ports))
+            bound_address = data.get('bound-address', '')
+            if not bound_address and entries:
+                bound_address = entries[0][1]
+            bound_addresses.append(bound_address)
+        cluster_addresses = parse_addrs(data.get('cluster-address', '')
+                                        for _, _, data in received)
+        for (relation_id, unit_name, data), bound_address, result, (
+                entries, ports), cluster_address in zip(
+                    received, bound_addresses, parse_addrs(bound_addresses),
+                    payloads, cluster_addresses):
+            if cluster_address:
+                cluster_address = cluster_address[1]
+            raft_status = _parse_raft_status(data.get('raft-status'))
+            profile = _parse_connection_profile(
+                data.get('connection-profile'))
+            relay_upstream = _parse_relay(data.get('ovsdb-relay'))
+            addresses = tuple(
+                UnitAddress(entry[0] or None, parsed[0], parsed[1],
+                            entry[2] or None)
+                for entry, parsed in zip(
+                    entries, parse_addrs(entry[1] for entry in entries))
+                if parsed)
+            if result:
+                if not addresses:
+                    addresses = (UnitAddress(None, result[0], result[1],
+                                             None),)
+                units.append(UnitRecord(relation_id, unit_name, bound_address,
+                                        result[0], result[1], True,
+                                        raft_status, profile, addresses,
+                                        ports, cluster_address,
+                                        relay_upstream))
+            else:
+                units.append(UnitRecord(relation_id, unit_name, bound_address,
+                                        None, None, False, raft_status,
+                                        profile, addresses, ports,
+                                        cluster_address, relay_upstream))
+        return cls(
+            tuple(units),
+            tuple(unit.formatted_address for unit in units
+                  if unit.valid and not unit.is_relay),
+            tuning_hints)
+
+
+AVAILABILITY_ALL = 'all'
+AVAILABILITY_MAJORITY = 'majority'
+AVAILABILITY_MINIMUM = 'minimum'
+AVAILABILITY_POLICIES = (AVAILABILITY_ALL, AVAILABILITY_MAJORITY,
+                         AVAILABILITY_MINIMUM)
+
+
+class PeerAvailability(collections.namedtuple('PeerAvailability', (
+        'expected', 'joined', 'published'))):
+    """Number of Raft cluster members, the local unit included.
+
+    ``expected`` is the number of members according to goal state,
+    ``joined`` how many have joined the peer relation and ``published`` how
+    many of those have published their address.
+    """
+    __slots__ = ()
+
+    @property
+    def majority(self):
+        return self.expected // 2 + 1
+
+    @property
+    def quorum(self):
+        """Whether a majority of expected members published their address."""
+        return self.published >= self.majority
+
+    @property
+    def full(self):
+        """Whether all expected members joined and published their address."""
+        return self.joined == self.expected == self.published
+
+    def available(self, policy=AVAILABILITY_ALL, minimum=None):
+        """Whether the cluster is available according to policy.
+
+        :param policy: One of ``AVAILABILITY_POLICIES``
+        :type policy: str
+        :param minimum: Number of members for ``AVAILABILITY_MINIMUM``
+        :type minimum: Optional[int]
+        :returns: True if available
+        :rtype: bool
+        """
+        if policy == AVAILABILITY_MAJORITY:
+            return self.quorum
+        if policy == AVAILABILITY_MINIMUM:
+            return self.published >= minimum
+        return self.full
+
+
+# Seconds to reuse results of probing remote servers
+PROBE_TTL = 60
+
+# Hooks in which network bindings of the unit may have changed
+BINDING_HOOKS = ('install', 'start', 'config-changed', 'upgrade-charm',
+                 'post-series-upgrade')
+
+
+# Version of how ``EndpointState`` is derived, part of the digest of its
+# inputs so state kept by a previous version is not reused
+ENDPOINT_STATE_VERSION = 5
+
+# Number of ``endpoint_state`` results kept per endpoint, one for each set of
+# connection settings, so the interface handlers using the defaults and a
+# consumer that changed them do not evict each other
+STATE_CACHE_ENTRIES = 4
+
+
+class EndpointState(collections.namedtuple('EndpointState', (
+        'cluster_local_addr', 'remote_addrs', 'nb_connection_strs',
+        'sb_connection_strs'))):
+    """Values derived from relation data and network bindings."""
+    __slots__ = ()
+
+
+def _digest(data):
+    import hashlib
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
 
 class OVSDB(reactive.Endpoint):
     DB_NB_PORT = 6641
     DB_SB_PORT = 6642
 
+    ORDER_RELATION = 'relation'
+    ORDER_LOCALITY = 'locality'
+    ORDER_LEADER = 'leader'
+    ORDER_RENDEZVOUS = 'rendezvous'
+    CONNECTION_ORDERS = (ORDER_RELATION, ORDER_LOCALITY, ORDER_LEADER,
+                         ORDER_RENDEZVOUS)
+
+    # Availability flags recorded in the state file read by ``query``
+    QUERY_FLAGS = ('available',)
+
+    def __init__(self, endpoint_name, relation_ids=None):
+        super().__init__(endpoint_name, relation_ids=relation_ids)
+        self._relation_snapshot = None
+        self._connection_order = self.ORDER_RELATION
+        self._zones = []
+        self._subset = None
+        self._address_family = None
+        self._state_cache_hit = None
+
+    @staticmethod
+    def enable_instrumentation(textfile=None):
+        """Enable instrumentation of hook tool calls for the current hook.
+
+        See ``instrumentation.enable`` for details.
+
+        :param textfile: Path to Prometheus textfile collector file
+        :type textfile: Optional[str]
+        :returns: Recorder
+        :rtype: instrumentation.Recorder
+        """
+        return instrumentation.enable(textfile=textfile)
+
+    @staticmethod
+    def enable_capture(path):
+        """Capture relation and network data seen by endpoints in this hook.
+
+        See ``capture.enable`` for details.
+
+        :param path: Path of file to write capture to
+        :type path: str
+        :returns: Capture
+        :rtype: capture.Capture
+        """
+        from . import capture
+        return capture.enable(path)
+
+    @property
+    def addr_cache_info(self):
+        """Statistics of the address cache shared by all endpoints.
+
+        :returns: Cache statistics
+        :rtype: AddrCacheInfo
+        """
+        return get_addr_cache().info()
+
+    def set_connection_order(self, order, zones=None, subset=None):
+        """Set order of addresses in NB and SB connection strings.
+
+        ``ORDER_RELATION`` retains the order of the units on the relation,
+        ``ORDER_LOCALITY`` puts the servers closest to ``cluster_local_addr``
+        first, see ``locality_key`` for details.  ``ORDER_LEADER`` puts the
+        server announcing itself as Raft leader of the respective database
+        first.  ``ORDER_RENDEZVOUS`` gives each local unit its own order of
+        servers, spreading clients evenly, see ``rendezvous_key`` for
+        details.
+
+        :param order: One of ``CONNECTION_ORDERS``
+        :type order: str
+        :param zones: Map of CIDR to zone name, e.g. ``{'10.0.1.0/24':
+                      'rack1', '10.0.2.0/24': 'rack2'}``
+        :type zones: Optional[Dict[str, str]]
+        :param subset: Only use this many servers first in order, all if None
+        :type subset: Optional[int]
+        :raises: ValueError
+        """
+        if order not in self.CONNECTION_ORDERS:
+            raise ValueError('Unknown connection order "{}", valid orders: {}'
+                             .format(order, self.CONNECTION_ORDERS))
+        if subset is not None:
+            if not isinstance(subset, int) or subset < 1:
+                raise ValueError('Subset must be a positive integer, got "{}"'
+                                 .format(subset))
+        self._zones = parse_zones(zones)
+        self._subset = subset
+        self._connection_order = order
+
     def _format_addr(self, addr):
         """Validate and format IP address
 
@@ -39,33 +757,119 @@ class OVSDB(reactive.Endpoint):
         :rtype: str
         :raises: ValueError
         """
-        ipaddr = ipaddress.ip_address(addr)
-        if isinstance(ipaddr, ipaddress.IPv6Address):
-            fmt = '[{}]'
-        else:
-            fmt = '{}'
-        return fmt.format(ipaddr)
+        return parse_addr(addr)[1]
 
     @property
-    def cluster_local_addr(self):
+    @instrumentation.instrumented
+    def relation_snapshot(self):
+        """Snapshot of data published by remote units.
+
+        Built once and reused for the remainder of the hook invocation.  The
+        remote unit of a ``-relation-departed`` hook for this endpoint is left
+        out, so that a departing server stops appearing in connection strings
+        straight away.
+
+        :returns: Snapshot
+        :rtype: RelationSnapshot
+        """
+        if self._relation_snapshot is None:
+            self.prefetch_received()
+            self._relation_snapshot = RelationSnapshot.from_relations(
+                self.relations, exclude=self.departing_units())
+            from . import capture
+            recorder = capture.get_capture()
+            if recorder:
+                recorder.record_relations(self.endpoint_name, self.relations,
+                                          endpoint_class=type(self).__name__)
+        return self._relation_snapshot
+
+    @instrumentation.instrumented
+    def prefetch_received(self, max_workers=None):
+        """Load data received from all remote units of the endpoint in bulk.
+
+        See ``prefetch_received`` of this module for details.
+
+        :param max_workers: Maximum number of concurrent calls, defaults to
+                            ``RELATION_GET_WORKERS``
+        :type max_workers: Optional[int]
+        :returns: Number of units data was loaded for
+        :rtype: int
+        """
+        return prefetch_received(
+            (unit for relation in self.relations for unit in relation.units),
+            max_workers=max_workers)
+
+    def departing_units(self):
+        """Remote unit departing in the current hook, if any.
+
+        :returns: Relation ID and unit name of departing units
+        :rtype: Set[Tuple[str, str]]
+        """
+        if not ch_core.hookenv.hook_name().endswith('-relation-departed'):
+            return set()
+        relation_id = self.hook_relation_id()
+        remote_unit = ch_core.hookenv.remote_unit()
+        if not relation_id or not remote_unit:
+            return set()
+        return {(relation_id, remote_unit)}
+
+    def invalidate_relation_snapshot(self):
+        """Discard snapshot so that it is rebuilt on next access."""
+        self._relation_snapshot = None
+
+    @instrumentation.instrumented
+    def _cluster_local_bind_addrs(self):
         for relation in self.relations:
-            ng_data = ch_core.hookenv.network_get(
+            ng_data = network_get(
                 self.expand_name('{endpoint_name}'),
                 relation_id=relation.relation_id)
-            for interface in ng_data.get('bind-addresses', []):
-                for addr in interface.get('addresses', []):
-                    return self._format_addr(addr['address'])
+            addrs = [(interface.get('interfacename'), addr)
+                     for interface in ng_data.get('bind-addresses', [])
+                     for addr in interface.get('addresses', [])]
+            if addrs:
+                return addrs
+        return []
+
+    def _cluster_local_bind_addr(self):
+        for _, addr in self._cluster_local_bind_addrs():
+            return addr
+
+    @property
+    def cluster_local_addrs(self):
+        """All addresses of the binding of this endpoint.
+
+        :returns: Interface name, address and CIDR of each address
+        :rtype: List[Tuple[Optional[str], str, Optional[str]]]
+        """
+        return [(interface, addr['address'], addr.get('cidr'))
+                for interface, addr in self._cluster_local_bind_addrs()
+                if addr.get('address')]
+
+    @property
+    def cluster_local_addr(self):
+        addr = self._cluster_local_bind_addr()
+        if addr:
+            return self._format_addr(addr['address'])
+
+    @property
+    def cluster_local_network(self):
+        """Network of ``cluster_local_addr``.
+
+        :returns: Network, None if not known
+        :rtype: Optional[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]
+        """
+        addr = self._cluster_local_bind_addr()
+        if addr and addr.get('cidr'):
+            import ipaddress
+            try:
+                return ipaddress.ip_network(addr['cidr'], strict=False)
+            except ValueError:
+                pass
 
     @property
     def cluster_remote_addrs(self):
-        for relation in self.relations:
-            for unit in relation.units:
-                try:
-                    addr = self._format_addr(
-                        unit.received.get('bound-address', ''))
-                    yield addr
-                except ValueError:
-                    continue
+        for addr in self.relation_snapshot.remote_addrs:
+            yield addr
 
     @property
     def db_nb_port(self):
@@ -88,54 +892,913 @@ class OVSDB(reactive.Endpoint):
         for addr in addrs:
             yield ':'.join((proto, addr, str(port)))
 
+    @staticmethod
+    def _unit_port(unit, db, port):
+        return (unit.ports or {}).get(db, port)
+
+    def _db_unit_connection_strs(self, units, db, port, proto='ssl'):
+        """Provide connection strings on the client ports units published.
+
+        :param units: Remote units
+        :type units: Iterable[UnitRecord]
+        :param db: One of ``raft.DATABASES``
+        :type db: str
+        :param port: Port number for units that did not publish one
+        :type port: int
+        :param proto: Protocol
+        :type proto: str
+        :returns: List of connection strings
+        :rtype: Generator[str, None, None]
+        """
+        for unit in units:
+            yield ':'.join((proto, unit.formatted_address,
+                            str(self._unit_port(unit, db, port))))
+
+    def _cluster_local_ipaddr(self):
+        try:
+            ipaddr, _ = parse_addr(self._cluster_local_bind_addr()['address'])
+        except (TypeError, KeyError, ValueError):
+            return None
+        return ipaddr
+
+    def set_address_family(self, family=None):
+        """Set address family to prefer for remote servers.
+
+        Remote units that published addresses of both families through the
+        ``addresses`` payload are connected to on an address of the
+        preferred family, the others on their ``bound-address``.
+
+        :param family: 4 or 6, None to always use ``bound-address``
+        :type family: Optional[int]
+        :raises: ValueError
+        """
+        if family not in (None, 4, 6):
+            raise ValueError('Unknown address family "{}"'.format(family))
+        self._address_family = family
+
+    def _preferred_address(self, unit):
+        if unit.address.version == self._address_family:
+            return unit
+        for addr in unit.addresses:
+            if addr.address.version == self._address_family:
+                return unit._replace(address=addr.address,
+                                     formatted_address=addr.formatted_address)
+        return unit
+
+    def _ordered_units(self, db=None, relays=False):
+        # relay units only serve the SB database, and are kept apart so they
+        # can be put before the Raft cluster members
+        units = [unit for unit in self.relation_snapshot.units
+                 if unit.valid and unit.is_relay == (relays and db == 'sb')]
+        if self._address_family:
+            units = [self._preferred_address(unit) for unit in units]
+        if self._connection_order == self.ORDER_LOCALITY:
+            local_ipaddr = self._cluster_local_ipaddr()
+            if local_ipaddr is not None:
+                key = locality_key(local_ipaddr,
+                                   local_network=self.cluster_local_network,
+                                   zones=self._zones)
+                units.sort(key=lambda unit: key(unit.address))
+        elif self._connection_order == self.ORDER_LEADER and db:
+            # compare by name, units may be copies with another address
+            leader = self.raft_leaders.get(db)
+            leader_key = None
+            if leader:
+                leader_key = (leader.relation_id, leader.unit_name)
+            units.sort(key=lambda unit: (
+                unit.relation_id, unit.unit_name) != leader_key)
+        elif self._connection_order == self.ORDER_RENDEZVOUS:
+            key = rendezvous_key(ch_core.hookenv.local_unit())
+            units.sort(key=lambda unit: key(unit.unit_name))
+        return units[:self._subset]
+
+    @property
+    def ordered_remote_addrs(self):
+        """Remote addresses in the order set by ``set_connection_order``.
+
+        :returns: Formatted addresses
+        :rtype: List[str]
+        """
+        return [unit.formatted_address for unit in self._ordered_units()]
+
+    def db_ordered_remote_addrs(self, db):
+        """Remote addresses in order set by ``set_connection_order`` for db.
+
+        :param db: One of ``raft.DATABASES``
+        :type db: str
+        :returns: Formatted addresses
+        :rtype: List[str]
+        """
+        return [unit.formatted_address for unit in self._ordered_units(db)]
+
+    @property
+    def published_connection_strs(self):
+        """Connection strings pre-rendered by the remote provider.
+
+        Taken from the application data of the first relation the leader of
+        the remote provider published them on.  Strings for servers that are
+        not among the remote units currently joined, e.g. a unit departing in
+        this hook, are left out.  Only used for relation order without a
+        subset or preferred address family, anything else needs the
+        individual addresses.
+
+        :returns: Connection strings, None if not published or not usable
+        :rtype: Optional[ConnectionStrs]
+        """
+        if self._connection_order != self.ORDER_RELATION:
+            return None
+        if self._subset or self._address_family:
+            return None
+        for relation in self.relations:
+            data = relation.received_app
+            generation = data.get('connection-str-generation')
+            if not isinstance(generation, int):
+                continue
+            addrs = set()
+            for unit in self.relation_snapshot.units:
+                if unit.relation_id != relation.relation_id or not unit.valid:
+                    continue
+                addrs.add(unit.formatted_address)
+                addrs.update(addr.formatted_address
+                             for addr in unit.addresses)
+            nb, sb = (
+                tuple(connection_str
+                      for connection_str in _split_connection_str(
+                          data.get(key))
+                      if _connection_str_addr(connection_str) in addrs)
+                for key in ('nb-connection-str', 'sb-connection-str'))
+            if nb or sb:
+                return ConnectionStrs(relation.relation_id, generation,
+                                      nb, sb)
+
+    @property
+    def colocated_unit(self):
+        """Remote unit sharing the local address that published a profile.
+
+        :returns: Unit, None if no co-located provider published a connection
+                  profile
+        :rtype: Optional[UnitRecord]
+        """
+        local_ipaddr = None
+        for unit in self.relation_snapshot.units:
+            if not unit.valid or not unit.profile:
+                continue
+            local_ipaddr = local_ipaddr or self._cluster_local_ipaddr()
+            if unit.address == local_ipaddr:
+                return unit
+
+    def _local_connection_strs(self, connection_strs, db, port):
+        """Replace connection string of co-located server with a fast path.
+
+        A unix socket is used if the provider allows it and published one,
+        plain TCP to the local address if it allows that.
+        """
+        unit = self.colocated_unit
+        if unit is None:
+            return connection_strs
+        profile = unit.profile
+        local_suffix = ':{}:{}'.format(unit.formatted_address,
+                                       self._unit_port(unit, db, port))
+        if 'unix' in profile.protocols and db in profile.unix_sockets:
+            local_connection_str = 'unix:{}'.format(profile.unix_sockets[db])
+        elif 'tcp' in profile.protocols:
+            local_connection_str = 'tcp{}'.format(local_suffix)
+        else:
+            return connection_strs
+        return (local_connection_str if connection_str.endswith(local_suffix)
+                else connection_str
+                for connection_str in connection_strs)
+
     @property
     def db_nb_connection_strs(self):
-        return self.db_connection_strs(self.cluster_remote_addrs,
-                                       self.db_nb_port)
+        published = self.published_connection_strs
+        if published:
+            connection_strs = iter(published.nb)
+        else:
+            connection_strs = self._db_unit_connection_strs(
+                self._ordered_units('nb'), 'nb', self.db_nb_port)
+        return self._local_connection_strs(connection_strs, 'nb',
+                                           self.db_nb_port)
 
     @property
     def db_sb_connection_strs(self):
-        return self.db_connection_strs(self.cluster_remote_addrs,
-                                       self.db_sb_port)
+        published = self.published_connection_strs
+        if published:
+            cluster = list(published.sb)
+        else:
+            cluster = list(self._db_unit_connection_strs(
+                self._ordered_units('sb'), 'sb', self.db_sb_port))
+        relays = list(self._db_unit_connection_strs(
+            self._ordered_units('sb', relays=True), 'sb', self.db_sb_port))
+        fallback = [upstream
+                    for upstream in self.relay_upstream_sb_connection_strs
+                    if upstream not in cluster]
+        return self._local_connection_strs(iter(relays + cluster + fallback),
+                                           'sb', self.db_sb_port)
+
+    @property
+    def relay_upstream_sb_connection_strs(self):
+        """SB connection strings of the Raft cluster published by relays.
+
+        Used as fallback after the relays themselves in
+        ``db_sb_connection_strs`` for clients not related to the cluster.
+
+        :returns: Connection strings
+        :rtype: List[str]
+        """
+        connection_strs = []
+        for unit in self.relation_snapshot.units:
+            for connection_str in unit.relay_upstream or ():
+                if connection_str not in connection_strs:
+                    connection_strs.append(connection_str)
+        return connection_strs
+
+    def publish_connection_profile(self, protocols=('ssl',),
+                                   unix_sockets=None):
+        """Publish how co-located consumers may connect to this unit.
+
+        :param protocols: Protocols local clients may use, e.g. ``unix``,
+                          ``tcp`` and ``ssl``
+        :type protocols: Iterable[str]
+        :param unix_sockets: Map of database to unix socket path, e.g.
+                             ``{'nb': '/var/run/ovn/ovnnb_db.sock'}``
+        :type unix_sockets: Optional[Dict[str, str]]
+        :returns: Number of skipped writes
+        :rtype: int
+        :raises: ValueError
+        """
+        from . import raft
+        unix_sockets = unix_sockets or {}
+        for db in unix_sockets:
+            if db not in raft.DATABASES:
+                raise ValueError('Unknown database "{}"'.format(db))
+        return self.publish_relation_data({'connection-profile': {
+            'protocols': list(protocols),
+            'unix-sockets': unix_sockets,
+        }})
+
+    @property
+    def _probe_results_key(self):
+        return '{}.{}.probe-results'.format(CACHE_NAMESPACE,
+                                            self.endpoint_name)
+
+    @staticmethod
+    def _probe_candidates(unit, port):
+        candidates = [(str(unit.address), port)]
+        for addr in unit.addresses:
+            candidate = (str(addr.address), port)
+            if candidate not in candidates:
+                candidates.append(candidate)
+        return candidates
+
+    def probe_db_connection_strs(self, port, proto='ssl', ttl=PROBE_TTL,
+                                 prober=None):
+        """Connection strings for reachable Raft cluster members by RTT.
+
+        Servers are probed concurrently by establishing a TCP connection to
+        ``port``, racing all addresses a server published so a server
+        reachable on only one family of a dual-stack deployment is found
+        either way.  The connection string uses the address that won the
+        race.  Results, including failures, are kept in the unit kv store and
+        reused for ``ttl`` seconds so subsequent hooks do not probe again.
+        Servers with equal RTT retain the order set by
+        ``set_connection_order``.
+
+        :param port: Port to probe and put in connection strings
+        :type port: int
+        :param proto: Protocol to put in connection strings
+        :type proto: str
+        :param ttl: Seconds to reuse probe results
+        :type ttl: float
+        :param prober: Prober to use, defaults to ``probe.Prober``
+        :type prober: Optional[probe.Prober]
+        :returns: Connection strings
+        :rtype: List[str]
+        """
+        units = self._ordered_units()
+        kv = ch_core.unitdata.kv()
+        now = time.time()
+        cached = kv.get(self._probe_results_key) or {}
+        results = {target: entry for target, entry in cached.items()
+                   if len(entry) == 3 and now - entry[0] < ttl}
+        targets = ['{}:{}'.format(unit.formatted_address, port)
+                   for unit in units]
+        stale = [(target, unit) for target, unit in zip(targets, units)
+                 if target not in results]
+        if stale:
+            from . import probe
+            prober = prober or probe.Prober()
+            probed = prober.probe([self._probe_candidates(unit, port)
+                                   for _, unit in stale])
+            for (target, _), result in zip(stale, probed):
+                if result:
+                    _, formatted = parse_addr(result.address)
+                    results[target] = (now, result.rtt, formatted)
+                else:
+                    results[target] = (now, None, None)
+        kv.set(self._probe_results_key, results)
+        reachable = []
+        for target in targets:
+            _, rtt, formatted = results[target]
+            if rtt is not None:
+                reachable.append((rtt, '{}:{}:{}'.format(proto, formatted,
+                                                         port)))
+        reachable.sort(key=lambda item: item[0])
+        return [connection_str for _, connection_str in reachable]
+
+    @property
+    def raft_leaders(self):
+        """Remote units announcing themselves as Raft leader.
+
+        Should more than one unit claim leadership of a database, e.g. while
+        an election is in progress, the one with the highest term is used.
+
+        :returns: Map of database to unit
+        :rtype: Dict[str, UnitRecord]
+        """
+        leaders = {}
+        for unit in self.relation_snapshot.units:
+            for db, status in (unit.raft or {}).items():
+                if not status.is_leader:
+                    continue
+                if db not in leaders or (
+                        status.term > leaders[db].raft[db].term):
+                    leaders[db] = unit
+        return leaders
+
+    def update_leader_changed(self):
+        """Set ``{endpoint_name}.leader-changed`` flag when leader changed.
+
+        The consumer is expected to clear the flag once it has reacted to it.
+        """
+        leaders = {db: (unit.unit_name, unit.raft[db].term)
+                   for db, unit in self.raft_leaders.items()}
+        if reactive.helpers.data_changed(
+                self.expand_name('{endpoint_name}.raft-leaders'), leaders):
+            reactive.set_flag(
+                self.expand_name('{endpoint_name}.leader-changed'))
+
+    def raft_status_changed(self):
+        """Re-evaluate the Raft leaders after ``raft-status`` changed.
+
+        Meant to be called from handlers reacting to the
+        ``endpoint.{endpoint_name}.changed.raft-status`` flag, so the leaders
+        are only looked at when a provider published a new status.  The
+        changed flag is cleared afterwards.
+        """
+        self.update_leader_changed()
+        reactive.clear_flag(self.expand_name(
+            'endpoint.{endpoint_name}.changed.raft-status'))
+
+    def publish_raft_status(self, probe=None):
+        """Publish Raft role and term of the local database servers.
+
+        :param probe: Probe for Raft status, defaults to
+                      ``raft.AppctlRaftProbe``
+        :type probe: Optional[raft.RaftProbe]
+        :returns: Number of skipped writes
+        :rtype: int
+        """
+        from . import raft
+        probe = probe or raft.AppctlRaftProbe()
+        statuses = {}
+        for db in raft.DATABASES:
+            status = probe.status(db)
+            if status:
+                statuses[db] = {'role': status.role, 'term': status.term}
+        return self.publish_relation_data({'raft-status': statuses})
+
+    @property
+    def tuning_hints(self):
+        """Connection tuning hints published by the remote providers.
+
+        :returns: Tuning hints, defaults if no provider published any
+        :rtype: tuning.TuningHints
+        """
+        from . import tuning
+        return self.relation_snapshot.tuning_hints or tuning.make_hints()
+
+    def publish_tuning_hints(self, **kwargs):
+        """Publish connection tuning hints for clients.
+
+        Hints not given are published with their default value, see
+        ``tuning.TuningHints`` for the available hints.
+
+        :param kwargs: Hints by ``tuning.TuningHints`` field name
+        :type kwargs: Dict[str, Union[int, float, bool]]
+        :returns: Number of skipped writes
+        :rtype: int
+        :raises: ValueError
+        """
+        from . import tuning
+        return self.publish_relation_data({
+            'tuning-hints': tuning.to_payload(tuning.make_hints(**kwargs))})
+
+    @property
+    def _state_cache_key(self):
+        return '{}.{}.state'.format(CACHE_NAMESPACE, self.endpoint_name)
+
+    def _state_settings(self):
+        return [self._connection_order,
+                [(str(network), zone) for network, zone in self._zones],
+                self._subset, self._address_family]
+
+    def _joined_digest(self):
+        return _digest([
+            (relation.relation_id,
+             sorted(unit.unit_name for unit in relation.units))
+            for relation in self.relations])
+
+    def _unit_digests(self, cached=None):
+        """Digest of the data received from each remote unit.
+
+        In a relation hook of this endpoint only the data of the remote unit
+        of the hook can have changed, given the digests of the other units in
+        ``cached`` just the data of that unit is read.  Otherwise the data of
+        all units is loaded.
+
+        :param cached: Digests from an earlier hook by unit key
+        :type cached: Optional[Dict[str, str]]
+        :returns: Digests by unit key
+        :rtype: Dict[str, str]
+        """
+        departing = self.departing_units()
+        units = [('{} {}'.format(relation.relation_id, unit.unit_name), unit)
+                 for relation in self.relations
+                 for unit in relation.units
+                 if (relation.relation_id, unit.unit_name) not in departing]
+        relation_id = self.hook_relation_id()
+        remote_unit = ch_core.hookenv.remote_unit()
+        if cached is not None and relation_id and remote_unit:
+            remote_key = '{} {}'.format(relation_id, remote_unit)
+            digests = {}
+            for key, unit in units:
+                if key == remote_key:
+                    digests[key] = _digest(dict(unit.received_raw))[:16]
+                elif key in cached:
+                    digests[key] = cached[key]
+                else:
+                    break
+            else:
+                return digests
+        self.prefetch_received()
+        return {key: _digest(dict(unit.received_raw))[:16]
+                for key, unit in units}
+
+    @instrumentation.instrumented
+    def endpoint_state(self):
+        """Local address, remote addresses and connection strings.
+
+        The values are kept in the unit kv store.  In hooks that can not have
+        changed the relation data or network bindings, i.e. hooks other than
+        relation hooks of this endpoint and ``BINDING_HOOKS``, they are
+        reused as long as the same units are joined, without ``network-get``
+        calls or reading relation data.  Otherwise they are only recomputed
+        when the digest of relation data and network bindings changed.  In
+        relation hooks of this endpoint only the data of the remote unit is
+        read for that, and network bindings are only looked at in
+        ``BINDING_HOOKS``.  Values are kept separately for each set of
+        connection settings, up to ``STATE_CACHE_ENTRIES`` of them.
+
+        :returns: Derived state
+        :rtype: EndpointState
+        """
+        kv = ch_core.unitdata.kv()
+        settings = _digest(self._state_settings())
+        entries = kv.get(self._state_cache_key)
+        if not isinstance(entries, list):
+            entries = []
+        cached = {}
+        for entry in entries:
+            if entry.get('settings') == settings:
+                cached = entry
+        joined = self._joined_digest()
+        binding_hook = ch_core.hookenv.hook_name() in BINDING_HOOKS
+        relation_hook = self.hook_relation_id() is not None
+        unchanged = not (binding_hook or relation_hook)
+        if unchanged and cached.get('joined') == joined:
+            self._state_cache_hit = True
+            return EndpointState(*cached['state'])
+        units = self._unit_digests(cached.get('units'))
+        bindings = cached.get('bindings')
+        if binding_hook or bindings is None:
+            bindings = _digest(self._cluster_local_bind_addrs())
+        inputs = _digest([ENDPOINT_STATE_VERSION, joined, units, bindings])
+        if cached.get('inputs') == inputs:
+            self._state_cache_hit = True
+            return EndpointState(*cached['state'])
+        self._state_cache_hit = False
+        state = EndpointState(self.cluster_local_addr,
+                              list(self.cluster_remote_addrs),
+                              list(self.db_nb_connection_strs),
+                              list(self.db_sb_connection_strs))
+        entries = [entry for entry in entries
+                   if entry.get('settings') != settings]
+        kv.set(self._state_cache_key, [{
+            'settings': settings,
+            'joined': joined,
+            'units': units,
+            'bindings': bindings,
+            'inputs': inputs,
+            'state': list(state),
+        }] + entries[:STATE_CACHE_ENTRIES - 1])
+        return state
 
+    @property
+    def state_cache_hit(self):
+        """Whether the last call to ``endpoint_state`` was served from cache.
+
+        :returns: None if ``endpoint_state`` was not called in this hook
+        :rtype: Optional[bool]
+        """
+        return self._state_cache_hit
+
+    def invalidate_endpoint_state(self):
+        """Forget cached state, next call to ``endpoint_state`` recomputes."""
+        ch_core.unitdata.kv().unset(self._state_cache_key)
+
+    @instrumentation.instrumented
+    def update_query_state(self, path=None):
+        """Update state file read by the ``query`` module.
+
+        Meant to be called at the end of handlers that may have changed the
+        state or availability of the endpoint.  The file is only written
+        when the state changed.
+
+        :param path: Path of state file, defaults to ``query.default_path()``
+        :type path: Optional[str]
+        :returns: Whether the file was written
+        :rtype: bool
+        """
+        from . import query
+        state = self.endpoint_state()
+        return query.update(self.endpoint_name, {
+            'cluster_local_addr': state.cluster_local_addr,
+            'remote_addrs': state.remote_addrs,
+            'nb_connection_strs': state.nb_connection_strs,
+            'sb_connection_strs': state.sb_connection_strs,
+            'availability': {
+                flag: reactive.is_flag_set(
+                    self.expand_name('{{endpoint_name}}.{}'.format(flag)))
+                for flag in self.QUERY_FLAGS},
+        }, path=path)
+
+    def connection_strs_changed(self):
+        """Whether the connection strings published by providers changed.
+
+        Compares the generation of connection strings published by the
+        remote provider on each relation, and the remote units joined, with
+        what they were the last time this method was called, allowing a
+        consumer to skip recomputing connection strings and re-rendering its
+        configuration when nothing changed.  Only the application data of
+        each relation is read, not the data of the individual units.
+
+        :returns: True if changed since last call
+        :rtype: bool
+        """
+        departing = self.departing_units()
+        generations = []
+        for relation in self.relations:
+            generation = relation.received_app.get(
+                'connection-str-generation')
+            if not isinstance(generation, int):
+                generation = None
+            generations.append((
+                relation.relation_id, generation,
+                sorted(unit.unit_name for unit in relation.units
+                       if (relation.relation_id, unit.unit_name)
+                       not in departing)))
+        return reactive.helpers.data_changed(
+            self.expand_name('{endpoint_name}.connection-str-generations'),
+            generations)
+
+    def publish_connection_strs(self, nb_connection_strs, sb_connection_strs):
+        """Publish pre-rendered connection strings in application data.
+
+        Only the leader publishes, so that consumers get the connection
+        strings from a single authority.  The generation number published
+        along with the connection strings on each relation is incremented
+        each time they change, and carries over to a new leader as it is
+        kept in the relation data itself.
+
+        :param nb_connection_strs: NB connection strings
+        :type nb_connection_strs: Iterable[str]
+        :param sb_connection_strs: SB connection strings
+        :type sb_connection_strs: Iterable[str]
+        :returns: Highest generation of published connection strings, None
+                  if this unit is not the leader
+        :rtype: Optional[int]
+        """
+        if not ch_core.hookenv.is_leader():
+            return None
+        nb = ','.join(nb_connection_strs)
+        sb = ','.join(sb_connection_strs)
+        highest = 0
+        for relation in self.relations:
+            published = relation.to_publish_app
+            generation = published.get('connection-str-generation')
+            if not isinstance(generation, int):
+                generation = 0
+            last = (published.get('nb-connection-str'),
+                    published.get('sb-connection-str'))
+            if generation == 0 or last != (nb, sb):
+                generation += 1
+                published['nb-connection-str'] = nb
+                published['sb-connection-str'] = sb
+                published['connection-str-generation'] = generation
+            highest = max(highest, generation)
+        return highest
+
+    @instrumentation.instrumented
     def expected_units_available(self):
         """Whether expected units have joined and published data on a relation
 
+        The decision is made from the tracked units maintained by
+        ``update_published_units``, a full rescan of the relation data is
+        only done when the tracked units are missing or inconsistent with the
+        units currently joined.
+
         NOTE: This does not work for the peer relation, see separate method
               for that in the peer relation implementation.
         """
-        if len(self.all_joined_units) == len(
-                list(ch_core.hookenv.expected_related_units(
-                    self.expand_name('{endpoint_name}')))):
-            for relation in self.relations:
-                for unit in relation.units:
-                    if not unit.received.get('bound-address'):
-                        break
-                else:
+        expected_units = len(list(ch_core.hookenv.expected_related_units(
+            self.expand_name('{endpoint_name}'))))
+        joined_units = set(unit.unit_name for unit in self.all_joined_units)
+        count = self.published_units_count(joined_units)
+        return count == len(joined_units) == expected_units
+
+    def published_units_count(self, joined_units):
+        """Number of joined units that have published ``bound-address``.
+
+        Taken from the tracked units maintained by ``update_published_units``
+        unless they are missing or were tracked for a different set of joined
+        units, e.g. because a unit joined or departed in a hook the tracking
+        did not run in, in which case the relation data is rescanned.
+
+        :param joined_units: Names of units currently joined
+        :type joined_units: Set[str]
+        :returns: Number of units
+        :rtype: int
+        """
+        tracked = self._load_published_units()
+        if tracked is not None:
+            units, tracked_joined = tracked
+            if tracked_joined != joined_units:
+                ch_core.hookenv.log('{}: tracked units inconsistent with '
+                                    'relation, rescanning'
+                                    .format(self.endpoint_name),
+                                    level=ch_core.hookenv.DEBUG)
+                tracked = None
+        if tracked is None:
+            units = self.rescan_published_units()
+        return len(units)
+
+    @property
+    def _published_units_key(self):
+        return '{}.{}.published-units'.format(CACHE_NAMESPACE,
+                                              self.endpoint_name)
+
+    def _load_published_units(self):
+        """Load tracked units.
+
+        :returns: Names of units that have published ``bound-address`` and
+                  names of joined units they were tracked for, None if not
+                  tracked
+        :rtype: Optional[Tuple[Set[str], Set[str]]]
+        """
+        data = ch_core.unitdata.kv().get(self._published_units_key)
+        if not data or 'joined' not in data:
+            return None
+        return set(data['units']), set(data['joined'])
+
+    def _save_published_units(self, units, joined):
+        ch_core.unitdata.kv().set(self._published_units_key, {
+            'units': sorted(units),
+            'joined': sorted(joined),
+        })
+
+    def reset_published_units(self):
+        """Forget tracked units, next check will do a full rescan."""
+        ch_core.unitdata.kv().unset(self._published_units_key)
+
+    @instrumentation.instrumented
+    def rescan_published_units(self):
+        """Rebuild tracked units from a full scan of the relation data.
+
+        :returns: Names of units that have published ``bound-address``
+        :rtype: Set[str]
+        """
+        units = set(unit.unit_name
+                    for unit in self.relation_snapshot.units
+                    if unit.bound_address)
+        self._save_published_units(
+            units, set(unit.unit_name
+                       for unit in self.relation_snapshot.units))
+        return units
+
+    @instrumentation.instrumented
+    def update_published_units(self):
+        """Update tracked units from the remote unit of the current hook.
+
+        Only the remote unit of a relation hook for this endpoint is looked
+        at, outside of such hooks this is a noop.  Handlers reacting to the
+        ``joined`` flag run in every hook while units are joined, calling this
+        from them keeps the tracked units current through the joined, changed
+        and departed hooks of each individual unit.
+        """
+        relation_id = self.hook_relation_id()
+        remote_unit = ch_core.hookenv.remote_unit()
+        if not relation_id or not remote_unit:
+            return
+        tracked = self._load_published_units()
+        if tracked is None:
+            self.rescan_published_units()
+            return
+        units, joined = tracked
+        published = False
+        present = False
+        if not ch_core.hookenv.hook_name().endswith('-relation-departed'):
+            try:
+                unit = self.relations[relation_id].units[remote_unit]
+                present = True
+                published = bool(unit.received.get('bound-address'))
+            except KeyError:
+                pass
+        updated = (units - {remote_unit}) | (
+            {remote_unit} if published else set())
+        updated_joined = (joined - {remote_unit}) | (
+            {remote_unit} if present else set())
+        if (updated, updated_joined) == (units, joined):
+            return
+        self._save_published_units(updated, updated_joined)
+
+    @instrumentation.instrumented
+    def bound_address_changed(self):
+        """Process units whose ``bound-address`` changed.
+
+        Meant to be called from handlers reacting to the
+        ``endpoint.{endpoint_name}.changed.bound-address`` flag.  In a relation
+        hook for this endpoint only the remote unit of the hook can have
+        changed, and only that unit is looked at.  In other hooks, e.g. the
+        first one after an upgrade of the charm, all units are rescanned.
+        The changed flag is cleared afterwards.
+
+        :returns: Names of units processed
+        :rtype: List[str]
+        """
+        relation_id = self.hook_relation_id()
+        remote_unit = ch_core.hookenv.remote_unit()
+        if relation_id and remote_unit:
+            self.update_published_units()
+            changed = [remote_unit]
+        else:
+            changed = sorted(self.rescan_published_units())
+        ch_core.hookenv.log('{}: processed bound-address change of {} units'
+                            .format(self.endpoint_name, len(changed)),
+                            level=ch_core.hookenv.DEBUG)
+        reactive.clear_flag(self.expand_name(
+            'endpoint.{endpoint_name}.changed.bound-address'))
+        return changed
+
+    def hook_relation_id(self):
+        """Get relation ID of current hook if it is a hook for this endpoint.
+
+        :returns: Relation ID
+        :rtype: Optional[str]
+        """
+        relation_id = ch_core.hookenv.relation_id()
+        if relation_id and relation_id.split(':')[0] == self.endpoint_name:
+            return relation_id
+
+    @property
+    def _published_data_key(self):
+        return '{}.{}.published-data'.format(CACHE_NAMESPACE,
+                                             self.endpoint_name)
+
+    @instrumentation.instrumented
+    def publish_relation_data(self, data, relation_id=None):
+        """Publish data on relations where it differs from what we published.
+
+        What was last published on each relation is recorded in unit kv
+        storage, which is committed together with the relation data at the
+        end of a successful hook, so writes of unchanged values can be
+        skipped without reading back our own relation data.
+
+        :param data: Keys and values to publish
+        :type data: Dict[str, any]
+        :param relation_id: Only publish on this relation, all if None
+        :type relation_id: Optional[str]
+        :returns: Number of skipped writes
+        :rtype: int
+        """
+        kv = ch_core.unitdata.kv()
+        published = kv.get(self._published_data_key) or {}
+        relation_ids = set(relation.relation_id
+                           for relation in self.relations)
+        for stale in set(published.keys()) - relation_ids:
+            del published[stale]
+        skipped = 0
+        for relation in self.relations:
+            if relation_id and relation.relation_id != relation_id:
+                continue
+            last = published.setdefault(relation.relation_id, {})
+            for key, value in data.items():
+                encoded = json.dumps(value, sort_keys=True)
+                if last.get(key) == encoded:
+                    skipped += 1
                     continue
-                break
-            else:
-                return True
-        return False
+                relation.to_publish[key] = value
+                last[key] = encoded
+        kv.set(self._published_data_key, published)
+        ch_core.hookenv.log('{}: skipped {} unchanged relation writes'
+                            .format(self.endpoint_name, skipped),
+                            level=ch_core.hookenv.DEBUG)
+        return skipped
 
-    def publish_cluster_local_addr(self, addr=None):
+    def publish_cluster_local_addr(self, addr=None, relation_id=None):
         """Announce the address we bound our OVSDB Servers to.
 
         This will be used by our peers and clients to build a connection
         string to the remote cluster.
+
+        :param addr: Address to publish, defaults to ``cluster_local_addr``
+        :type addr: Optional[str]
+        :param relation_id: Only publish on this relation, all if None
+        :type relation_id: Optional[str]
+        :returns: Number of skipped writes
+        :rtype: int
         """
-        for relation in self.relations:
-            relation.to_publish['bound-address'] = (
-                addr or self.cluster_local_addr)
+        if addr:
+            bind_addrs = [(None, addr.strip('[]'), None)]
+        else:
+            bind_addrs = self.cluster_local_addrs
+            addr = self.cluster_local_addr
+        return self.publish_relation_data({
+            'bound-address': addr,
+            'addresses': addresses_payload(
+                bind_addrs, {'nb': self.db_nb_port, 'sb': self.db_sb_port}),
+        }, relation_id=relation_id)
+
+    def local_addr_published(self):
+        """Whether we published our ``bound-address`` on all relations.
+
+        Looked up in what ``publish_relation_data`` recorded, without reading
+        back our own relation data.
+
+        :returns: True if published
+        :rtype: bool
+        """
+        published = ch_core.unitdata.kv().get(self._published_data_key) or {}
+        relation_ids = [relation.relation_id for relation in self.relations]
+        if not relation_ids:
+            return False
+        for relation_id in relation_ids:
+            encoded = published.get(relation_id, {}).get('bound-address')
+            if not encoded or not json.loads(encoded):
+                return False
+        return True
 
+    @instrumentation.instrumented
     def joined(self):
         ch_core.hookenv.log('{}: {} -> {}'
                             .format(self._endpoint_name,
                                     type(self).__name__,
-                                    inspect.currentframe().f_code.co_name),
+                                    'joined'),
                             level=ch_core.hookenv.INFO)
         reactive.set_flag(self.expand_name('{endpoint_name}.connected'))
 
+    @instrumentation.instrumented
+    def departed(self):
+        """Forget departed units and re-evaluate state without them.
+
+        Meant to be called from handlers reacting to the
+        ``endpoint.{endpoint_name}.departed`` flag.  The flag and the list of
+        departed units are left to the consumer to clear, so handlers keep
+        running in later hooks until it does; only the unit departing in a
+        ``-relation-departed`` hook for this endpoint is returned.
+
+        :returns: Name of unit departing in this hook, if any
+        :rtype: List[str]
+        """
+        relation_id = self.hook_relation_id()
+        remote_unit = ch_core.hookenv.remote_unit()
+        hook_name = ch_core.hookenv.hook_name()
+        if not relation_id or not remote_unit:
+            return []
+        if not hook_name.endswith('-relation-departed'):
+            return []
+        ch_core.hookenv.log('{}: {} -> departed: {}'
+                            .format(self.endpoint_name, type(self).__name__,
+                                    remote_unit),
+                            level=ch_core.hookenv.INFO)
+        self.update_published_units()
+        self.invalidate_relation_snapshot()
+        return [remote_unit]
+
+    @instrumentation.instrumented
     def broken(self):
+        from . import query
+        self.reset_published_units()
+        query.remove(self.endpoint_name)
         reactive.clear_flag(self.expand_name('{endpoint_name}.available'))
         reactive.clear_flag(self.expand_name('{endpoint_name}.connected'))
@@ -0,0 +1,139 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# NOTE: ``asyncio`` is comparatively expensive to import and only needed when
+#       a consumer asks for probing, it is imported where it is used.
+
+import collections
+import time
+
+# Seconds to wait for a TCP connection to be established
+PROBE_TIMEOUT = 1.0
+
+# Seconds to wait before racing the next candidate address of a target,
+# RFC 8305 recommends 250 ms
+PROBE_STAGGER = 0.25
+
+
+class ProbeResult(collections.namedtuple('ProbeResult', (
+        'address', 'port', 'rtt'))):
+    """Outcome of probing a target.
+
+    ``address`` and ``port`` identify the candidate that won the race,
+    ``rtt`` is the time in seconds it took to establish a TCP connection.
+    """
+    __slots__ = ()
+
+
+def interleave_families(candidates):
+    """Order candidate addresses alternating between address families.
+
+    The relative order of addresses within a family is retained and the
+    family of the first candidate goes first, as described in RFC 8305.
+
+    :param candidates: Address and port pairs
+    :type candidates: Iterable[Tuple[str, int]]
+    :returns: Address and port pairs
+    :rtype: List[Tuple[str, int]]
+    """
+    families = collections.OrderedDict()
+    for address, port in candidates:
+        family = 6 if ':' in address else 4
+        families.setdefault(family, []).append((address, port))
+    result = []
+    queues = list(families.values())
+    while any(queues):
+        for queue in queues:
+            if queue:
+                result.append(queue.pop(0))
+    return result
+
+
+class Prober(object):
+    """Probe TCP reachability and round trip time of targets concurrently.
+
+    A target is a list of candidate addresses for the same server, e.g. its
+    IPv4 and IPv6 address.  Candidates are raced Happy Eyeballs style, a
+    connection attempt to the next candidate is started as soon as the
+    previous attempt failed or ``stagger`` seconds after it was started,
+    whichever comes first, until one succeeds.
+    """
+
+    def __init__(self, timeout=PROBE_TIMEOUT, stagger=PROBE_STAGGER):
+        """Initialize prober.
+
+        :param timeout: Seconds to wait for each connection attempt
+        :type timeout: float
+        :param stagger: Seconds to wait for an attempt before starting one to
+                        the next candidate of the same target
+        :type stagger: float
+        """
+        self.timeout = timeout
+        self.stagger = stagger
+
+    async def _connect(self, address, port):
+        import asyncio
+        start = time.monotonic()
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(address, port), self.timeout)
+        rtt = time.monotonic() - start
+        writer.close()
+        return ProbeResult(address, port, rtt)
+
+    async def _race(self, candidates):
+        import asyncio
+        candidates = interleave_families(candidates)
+        running = set()
+        try:
+            while candidates or running:
+                if candidates:
+                    address, port = candidates.pop(0)
+                    running.add(asyncio.ensure_future(
+                        self._connect(address, port)))
+                # wait for the stagger timer or the first attempt to finish,
+                # a failed attempt starts the next one straight away
+                done, running = await asyncio.wait(
+                    running, timeout=self.stagger if candidates else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        return task.result()
+                    except (OSError, asyncio.TimeoutError):
+                        continue
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def _probe(self, targets):
+        import asyncio
+        return await asyncio.gather(*(self._race(candidates)
+                                      for candidates in targets))
+
+    def probe(self, targets):
+        """Probe targets concurrently.
+
+        :param targets: Candidate address and port pairs for each target
+        :type targets: List[List[Tuple[str, int]]]
+        :returns: Result for each target in order, None if unreachable
+        :rtype: List[Optional[ProbeResult]]
+        """
+        import asyncio
+        if not targets:
+            return []
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._probe(targets))
+        finally:
+            loop.close()
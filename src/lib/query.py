@@ -0,0 +1,193 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Query endpoint state without loading the reactive framework.
+
+The endpoints keep a compact state file in the charm directory up to date
+with the addresses, connection strings and availability they derived, which
+actions and scripts can read with this module, only depending on the
+standard library.  It can also be run as a script::
+
+    python3 hooks/relations/ovsdb/lib/query.py connection-strs --db sb
+"""
+
+# NOTE: Do not import anything but the standard library here, and keep it
+#       to what is cheap to import.
+
+import argparse
+import json
+import os
+import sys
+
+# Version of the state file format
+STATE_VERSION = 1
+
+# Name of the state file, relative to the charm directory
+STATE_FILE = '.charm-interface-ovsdb.state.json'
+
+COMMANDS = ('show', 'addresses', 'connection-strs', 'availability')
+
+
+def default_path():
+    """Path of the state file in the charm directory.
+
+    :returns: Path
+    :rtype: str
+    """
+    charm_dir = os.environ.get('JUJU_CHARM_DIR', os.environ.get('CHARM_DIR'))
+    return os.path.join(charm_dir or '.', STATE_FILE)
+
+
+def load(path=None):
+    """Load state of all endpoints.
+
+    :param path: Path of state file, defaults to ``default_path()``
+    :type path: Optional[str]
+    :returns: Map of endpoint name to state, empty if file is missing or of
+              an unknown version
+    :rtype: Dict[str, Dict]
+    """
+    try:
+        with open(path or default_path()) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('v') != STATE_VERSION:
+        return {}
+    return data.get('endpoints') or {}
+
+
+def _write(path, endpoints):
+    import tempfile
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'v': STATE_VERSION, 'endpoints': endpoints}, f,
+                      separators=(',', ':'), sort_keys=True)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def update(endpoint_name, state, path=None):
+    """Update state of endpoint, the file is only written when it changed.
+
+    :param endpoint_name: Name of endpoint
+    :type endpoint_name: str
+    :param state: State of endpoint, must be serializable to JSON
+    :type state: Optional[Dict]
+    :param path: Path of state file, defaults to ``default_path()``
+    :type path: Optional[str]
+    :returns: Whether the file was written
+    :rtype: bool
+    """
+    path = path or default_path()
+    endpoints = load(path)
+    if state is None:
+        if endpoint_name not in endpoints:
+            return False
+        del endpoints[endpoint_name]
+    elif endpoints.get(endpoint_name) == state:
+        return False
+    else:
+        endpoints[endpoint_name] = state
+    _write(path, endpoints)
+    return True
+
+
+def remove(endpoint_name, path=None):
+    """Remove state of endpoint.
+
+    :param endpoint_name: Name of endpoint
+    :type endpoint_name: str
+    :param path: Path of state file, defaults to ``default_path()``
+    :type path: Optional[str]
+    :returns: Whether the file was written
+    :rtype: bool
+    """
+    return update(endpoint_name, None, path=path)
+
+
+def _select(command, state, db):
+    if command == 'addresses':
+        return state.get('remote_addrs', [])
+    if command == 'connection-strs':
+        return state.get('{}_connection_strs'.format(db), [])
+    if command == 'availability':
+        return state.get('availability', {})
+    return state
+
+
+def _lines(value):
+    if isinstance(value, dict):
+        return ['{}: {}'.format(key, json.dumps(item))
+                for key, item in sorted(value.items())]
+    return [str(item) for item in value]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', nargs='?', choices=COMMANDS,
+                        default='show')
+    parser.add_argument('--state', help='Path of state file, defaults to '
+                                        '{} in the charm directory'
+                                        .format(STATE_FILE))
+    parser.add_argument('--endpoint', help='Only show this endpoint')
+    parser.add_argument('--db', choices=('nb', 'sb'), default='sb',
+                        help='Database of connection strings')
+    parser.add_argument('--format', choices=('text', 'json'),
+                        default='text')
+    return parser.parse_args(argv)
+
+
+def main(argv=None, out=None):
+    """Print state of endpoints.
+
+    :param argv: Command line arguments, defaults to ``sys.argv[1:]``
+    :type argv: Optional[List[str]]
+    :param out: Stream to print to, defaults to ``sys.stdout``
+    :type out: Optional[TextIO]
+    :returns: Exit code, 1 if no state was found
+    :rtype: int
+    """
+    args = parse_args(argv)
+    out = out or sys.stdout
+    endpoints = load(args.state)
+    if args.endpoint:
+        endpoints = {name: state for name, state in endpoints.items()
+                     if name == args.endpoint}
+    if not endpoints:
+        sys.stderr.write('No endpoint state found\n')
+        return 1
+    if args.format == 'json':
+        json.dump({name: _select(args.command, state, args.db)
+                   for name, state in endpoints.items()},
+                  out, indent=2, sort_keys=True)
+        out.write('\n')
+        return 0
+    for name, state in sorted(endpoints.items()):
+        lines = _lines(_select(args.command, state, args.db))
+        if len(endpoints) > 1:
+            out.write('{}:\n'.format(name))
+            lines = ['  {}'.format(line) for line in lines]
+        for line in lines:
+            out.write('{}\n'.format(line))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import collections
+
+ROLE_LEADER = 'leader'
+ROLE_FOLLOWER = 'follower'
+ROLE_CANDIDATE = 'candidate'
+
+DATABASES = ('nb', 'sb')
+
+
+class RaftStatus(collections.namedtuple('RaftStatus', ('role', 'term'))):
+    """Raft role and term of a clustered database server."""
+    __slots__ = ()
+
+    @property
+    def is_leader(self):
+        return self.role == ROLE_LEADER
+
+
+def parse_cluster_status(output):
+    """Parse output of the ``cluster/status`` unixctl command.
+
+    :param output: Output of ``ovs-appctl ... cluster/status DB``
+    :type output: str
+    :returns: Raft status, None if role or term could not be found
+    :rtype: Optional[RaftStatus]
+    """
+    role = term = None
+    for line in output.splitlines():
+        key, _, value = line.partition(':')
+        key = key.strip().lower()
+        if key == 'role':
+            role = value.strip().lower()
+        elif key == 'term':
+            try:
+                term = int(value.strip())
+            except ValueError:
+                pass
+    if role is None or term is None:
+        return None
+    return RaftStatus(role, term)
+
+
+class RaftProbe(abc.ABC):
+    """Get Raft status of the local database servers."""
+
+    @abc.abstractmethod
+    def status(self, db):
+        """Get Raft status of database server.
+
+        :param db: One of ``DATABASES``
+        :type db: str
+        :returns: Raft status, None if not available
+        :rtype: Optional[RaftStatus]
+        """
+
+
+class AppctlRaftProbe(RaftProbe):
+    """Get Raft status through the unixctl socket of the database servers."""
+
+    CTL_SOCKETS = {
+        'nb': ('/var/run/ovn/ovnnb_db.ctl', 'OVN_Northbound'),
+        'sb': ('/var/run/ovn/ovnsb_db.ctl', 'OVN_Southbound'),
+    }
+
+    def __init__(self, ctl_sockets=None):
+        """Initialize probe.
+
+        :param ctl_sockets: Map of database to unixctl socket path and schema
+                            name, defaults to ``CTL_SOCKETS``
+        :type ctl_sockets: Optional[Dict[str, Tuple[str, str]]]
+        """
+        self.ctl_sockets = ctl_sockets or self.CTL_SOCKETS
+
+    def status(self, db):
+        import subprocess
+        ctl_socket, schema = self.ctl_sockets[db]
+        try:
+            output = subprocess.check_output(
+                ['ovs-appctl', '-t', ctl_socket, 'cluster/status', schema],
+                stderr=subprocess.STDOUT, universal_newlines=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return parse_cluster_status(output)
+
+
+class StaticRaftProbe(RaftProbe):
+    """Stand-in probe returning preset Raft status, for use in tests."""
+
+    def __init__(self, statuses):
+        """Initialize probe.
+
+        :param statuses: Map of database to Raft status
+        :type statuses: Dict[str, RaftStatus]
+        """
+        self.statuses = statuses
+
+    def status(self, db):
+        return self.statuses.get(db)
@@ -0,0 +1,124 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+# Version of the payload published in the ``tuning-hints`` relation key
+TUNING_VERSION = 1
+
+# Relation key, type, minimum, maximum and default of each hint.  Intervals
+# are in milliseconds, defaults are those of OVS and OVN.
+SCHEMA = (
+    ('remote-probe-interval', int, 0, 3600000, 5000),
+    ('inactivity-probe', int, 0, 3600000, 5000),
+    ('max-backoff', int, 1000, 3600000, 8000),
+    ('jitter', float, 0.0, 1.0, 0.0),
+    ('monitor-cond-since', bool, None, None, True),
+)
+
+# Hints where 0 disables probing and other values must be at least 1000 ms
+PROBE_INTERVALS = ('remote-probe-interval', 'inactivity-probe')
+
+
+def _field(key):
+    return key.replace('-', '_')
+
+
+class TuningHints(collections.namedtuple('TuningHints', tuple(
+        _field(key) for key, _, _, _, _ in SCHEMA))):
+    """Connection tuning hints published by a provider.
+
+    ``remote_probe_interval`` is the interval at which clients should probe
+    the server, ``inactivity_probe`` the interval at which the server probes
+    clients, both in milliseconds with 0 meaning disabled.  ``max_backoff``
+    is the maximum reconnect backoff in milliseconds and ``jitter`` the
+    fraction of it clients should randomize their backoff by to avoid
+    reconnect storms.  ``monitor_cond_since`` tells whether the servers
+    support the ``monitor_cond_since`` method, allowing clients to resume
+    monitoring without downloading the whole database after reconnecting.
+    """
+    __slots__ = ()
+
+
+def _validate(key, value_type, minimum, maximum, value):
+    if value_type is float and isinstance(value, int):
+        value = float(value)
+    if type(value) is not value_type:
+        raise ValueError('Tuning hint "{}" must be of type {}, got {!r}'
+                         .format(key, value_type.__name__, value))
+    if minimum is not None and not minimum <= value <= maximum:
+        raise ValueError('Tuning hint "{}" must be between {} and {}, got {}'
+                         .format(key, minimum, maximum, value))
+    if key in PROBE_INTERVALS and 0 < value < 1000:
+        raise ValueError('Tuning hint "{}" must be 0 or at least 1000, got {}'
+                         .format(key, value))
+    return value
+
+
+def make_hints(**kwargs):
+    """Validate tuning hints, filling in defaults for the ones not given.
+
+    :param kwargs: Hints by ``TuningHints`` field name
+    :type kwargs: Dict[str, Union[int, float, bool]]
+    :returns: Tuning hints
+    :rtype: TuningHints
+    :raises: ValueError
+    """
+    unknown = set(kwargs.keys()) - set(TuningHints._fields)
+    if unknown:
+        raise ValueError('Unknown tuning hints: {}'
+                         .format(', '.join(sorted(unknown))))
+    return TuningHints(*(
+        _validate(key, value_type, minimum, maximum,
+                  kwargs.get(_field(key), default))
+        for key, value_type, minimum, maximum, default in SCHEMA))
+
+
+def to_payload(hints):
+    """Build versioned payload for publishing tuning hints.
+
+    :param hints: Tuning hints
+    :type hints: TuningHints
+    :returns: Payload
+    :rtype: Dict
+    """
+    return {
+        'v': TUNING_VERSION,
+        'hints': {key: getattr(hints, _field(key))
+                  for key, _, _, _, _ in SCHEMA},
+    }
+
+
+def from_payload(data):
+    """Parse published tuning hints.
+
+    Hints unknown to this version are ignored, missing ones get their
+    default value.
+
+    :param data: Payload as received
+    :type data: any
+    :returns: Tuning hints, None if payload is missing or invalid
+    :rtype: Optional[TuningHints]
+    """
+    if not isinstance(data, dict) or data.get('v') != TUNING_VERSION:
+        return None
+    hints = data.get('hints')
+    if not isinstance(hints, dict):
+        return None
+    try:
+        return make_hints(**{_field(key): hints[key]
+                             for key, _, _, _, _ in SCHEMA
+                             if key in hints})
+    except ValueError:
+        return None
@@ -16,8 +16,6 @@
 # with decorators on class instance methods, so we have to revert to `from ...`
 # imports
 
-import inspect
-
 import charmhelpers.core as ch_core
 
 from charms.reactive import (
@@ -34,10 +32,14 @@ class OVSDBProvides(ovsdb.OVSDB):
         ch_core.hookenv.log('{}: {} -> {}'
                             .format(self._endpoint_name,
                                     type(self).__name__,
-                                    inspect.currentframe().f_code.co_name),
+                                    'joined'),
                             level=ch_core.hookenv.INFO)
         super().joined()
 
+    @when('endpoint.{endpoint_name}.departed')
+    def departed(self):
+        super().departed()
+
     @when('endpoint.{endpoint_name}.broken')
     def broken(self):
         super().broken()
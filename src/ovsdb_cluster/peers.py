@@ -23,6 +23,7 @@ from charms.reactive import (
     when,
 )
 
+from .lib import instrumentation as instrumentation
 from .lib import ovsdb as ovsdb
 
 
@@ -30,6 +31,8 @@ class OVSDBClusterPeer(ovsdb.OVSDB):
     DB_NB_CLUSTER_PORT = 6643
     DB_SB_CLUSTER_PORT = 6644
 
+    QUERY_FLAGS = ('available', 'quorum-available', 'fully-available')
+
     @property
     def db_nb_cluster_port(self):
         return self.DB_NB_CLUSTER_PORT
@@ -38,24 +41,198 @@ class OVSDBClusterPeer(ovsdb.OVSDB):
     def db_sb_cluster_port(self):
         return self.DB_SB_CLUSTER_PORT
 
+    @property
+    def _cluster_binding_key(self):
+        return '{}.{}.cluster-binding'.format(ovsdb.CACHE_NAMESPACE,
+                                              self.endpoint_name)
+
+    def set_cluster_binding(self, binding=None):
+        """Set binding to use for Raft cluster traffic.
+
+        By default the binding of this endpoint is used for both Raft cluster
+        and client traffic.  The binding is kept in the unit kv store and
+        applies to subsequent hooks.
+
+        :param binding: Name of endpoint or extra-binding, None to use the
+                        binding of this endpoint
+        :type binding: Optional[str]
+        """
+        ch_core.unitdata.kv().set(self._cluster_binding_key, binding)
+
+    @property
+    def cluster_binding(self):
+        """Binding used for Raft cluster traffic, None if not separate.
+
+        :rtype: Optional[str]
+        """
+        return ch_core.unitdata.kv().get(self._cluster_binding_key)
+
+    @property
+    def cluster_local_cluster_addr(self):
+        """Local address for Raft cluster traffic.
+
+        :returns: Formatted address
+        :rtype: Optional[str]
+        """
+        binding = self.cluster_binding
+        if not binding:
+            return self.cluster_local_addr
+        ng_data = ovsdb.network_get(binding)
+        for interface in ng_data.get('bind-addresses', []):
+            for addr in interface.get('addresses', []):
+                return self._format_addr(addr['address'])
+
+    def publish_cluster_local_cluster_addr(self, relation_id=None):
+        """Announce the address to use for Raft cluster traffic.
+
+        Nothing is published unless a separate cluster binding is set.
+
+        :param relation_id: Only publish on this relation, all if None
+        :type relation_id: Optional[str]
+        :returns: Number of skipped writes
+        :rtype: int
+        """
+        addr = None
+        if self.cluster_binding:
+            addr = self.cluster_local_cluster_addr
+        return self.publish_relation_data({'cluster-address': addr},
+                                          relation_id=relation_id)
+
+    @property
+    def cluster_remote_cluster_addrs(self):
+        """Remote addresses for Raft cluster traffic.
+
+        Units that did not publish a separate cluster address are reached on
+        their ``bound-address``.
+
+        :returns: Formatted addresses
+        :rtype: List[str]
+        """
+        return [unit.cluster_address or unit.formatted_address
+                for unit in self.relation_snapshot.units
+                if unit.cluster_address or unit.valid]
+
+    @property
+    def db_nb_cluster_connection_strs(self):
+        return self.db_connection_strs(self.cluster_remote_cluster_addrs,
+                                       self.db_nb_cluster_port)
+
+    @property
+    def db_sb_cluster_connection_strs(self):
+        return self.db_connection_strs(self.cluster_remote_cluster_addrs,
+                                       self.db_sb_cluster_port)
+
+    @property
+    def _availability_policy_key(self):
+        return '{}.{}.availability-policy'.format(ovsdb.CACHE_NAMESPACE,
+                                                  self.endpoint_name)
+
+    def set_availability_policy(self, policy, minimum=None):
+        """Set when the ``{endpoint_name}.available`` flag is set.
+
+        ``AVAILABILITY_ALL``, the default, requires all expected peers to have
+        joined and published their address, ``AVAILABILITY_MAJORITY`` a Raft
+        majority of the cluster and ``AVAILABILITY_MINIMUM`` at least
+        ``minimum`` members, the local unit included.  The policy is kept in
+        the unit kv store and applies to subsequent hooks.
+
+        :param policy: One of ``ovsdb.AVAILABILITY_POLICIES``
+        :type policy: str
+        :param minimum: Number of members for ``AVAILABILITY_MINIMUM``
+        :type minimum: Optional[int]
+        :raises: ValueError
+        """
+        if policy not in ovsdb.AVAILABILITY_POLICIES:
+            raise ValueError('Unknown availability policy "{}"'
+                             .format(policy))
+        if policy == ovsdb.AVAILABILITY_MINIMUM:
+            if not isinstance(minimum, int) or minimum < 1:
+                raise ValueError('Minimum number of members must be a '
+                                 'positive integer, got "{}"'.format(minimum))
+        ch_core.unitdata.kv().set(self._availability_policy_key, {
+            'policy': policy, 'minimum': minimum})
+
+    @property
+    def availability_policy(self):
+        """Availability policy and minimum number of members.
+
+        :returns: Policy and minimum
+        :rtype: Tuple[str, Optional[int]]
+        """
+        data = ch_core.unitdata.kv().get(self._availability_policy_key) or {}
+        return (data.get('policy', ovsdb.AVAILABILITY_ALL),
+                data.get('minimum'))
+
+    @instrumentation.instrumented
+    def peer_availability(self):
+        """Number of expected, joined and published cluster members.
+
+        The local unit is counted as published once it has published its
+        own ``bound-address``, which it does not before the leader settings
+        are ready.
+
+        :returns: Member counts, the local unit included
+        :rtype: ovsdb.PeerAvailability
+        """
+        joined_units = set(unit.unit_name for unit in self.all_joined_units)
+        published = self.published_units_count(joined_units)
+        if self.local_addr_published():
+            published += 1
+        return ovsdb.PeerAvailability(
+            len(list(ch_core.hookenv.expected_peer_units())) + 1,
+            len(joined_units) + 1,
+            published)
+
     def expected_peers_available(self):
-        if len(self.all_joined_units) == len(
-                list(ch_core.hookenv.expected_peer_units())):
-            for relation in self.relations:
-                for unit in relation.units:
-                    if not unit.received.get('bound-address'):
-                        return False
-            return True
-        return False
+        return self.peer_availability().full
+
+    def update_availability(self):
+        """Update availability flags according to the availability policy."""
+        availability = self.peer_availability()
+        reactive.toggle_flag(
+            self.expand_name('{endpoint_name}.quorum-available'),
+            availability.quorum)
+        reactive.toggle_flag(
+            self.expand_name('{endpoint_name}.fully-available'),
+            availability.full)
+        policy, minimum = self.availability_policy
+        reactive.toggle_flag(
+            self.expand_name('{endpoint_name}.available'),
+            availability.available(policy, minimum=minimum))
 
     @when('endpoint.{endpoint_name}.joined')
     def joined(self):
         super().joined()
         if reactive.is_flag_set('leadership.set.ready'):
-            self.publish_cluster_local_addr()
-        if self.expected_peers_available():
-            reactive.set_flag(self.expand_name('{endpoint_name}.available'))
+            relation_id = None
+            if ch_core.hookenv.hook_name().endswith('-relation-joined'):
+                relation_id = self.hook_relation_id()
+            self.publish_cluster_local_addr(relation_id=relation_id)
+            self.publish_cluster_local_cluster_addr(relation_id=relation_id)
+        self.update_published_units()
+        self.update_availability()
+        self.update_query_state()
+
+    @when('endpoint.{endpoint_name}.changed.bound-address')
+    def bound_address_changed(self):
+        super().bound_address_changed()
+        self.update_availability()
+        self.update_query_state()
+        reactive.set_flag(self.expand_name('{endpoint_name}.servers-changed'))
+
+    @when('endpoint.{endpoint_name}.departed')
+    def departed(self):
+        departed = super().departed()
+        self.update_availability()
+        self.update_query_state()
+        if departed:
+            reactive.set_flag(
+                self.expand_name('{endpoint_name}.servers-changed'))
 
     @when('endpoint.{endpoint_name}.broken')
     def broken(self):
         super().broken()
+        reactive.clear_flag(
+            self.expand_name('{endpoint_name}.quorum-available'))
+        reactive.clear_flag(
+            self.expand_name('{endpoint_name}.fully-available'))
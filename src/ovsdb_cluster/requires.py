@@ -12,8 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import inspect
-
 import charmhelpers.core as ch_core
 
 # the reactive framework unfortunately does not grok `import as` in conjunction
@@ -33,9 +31,13 @@ class OVSDBClusterRequires(ovsdb.OVSDB):
         ch_core.hookenv.log('{}: {} -> {}'
                             .format(self._endpoint_name,
                                     type(self).__name__,
-                                    inspect.currentframe().f_code.co_name),
+                                    'joined'),
                             level=ch_core.hookenv.INFO)
 
+    @when('endpoint.{endpoint_name}.departed')
+    def departed(self):
+        super().departed()
+
     @when('endpoint.{endpoint_name}.broken')
     def broken(self):
         super().broken()
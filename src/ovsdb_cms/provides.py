@@ -16,8 +16,6 @@
 # with decorators on class instance methods, so we have to revert to `from ...`
 # imports
 
-import inspect
-
 import charmhelpers.core as ch_core
 
 from charms.reactive import (
@@ -34,10 +32,32 @@ class OVSDBCMSProvides(ovsdb.OVSDB):
         ch_core.hookenv.log('{}: {} -> {}'
                             .format(self._endpoint_name,
                                     type(self).__name__,
-                                    inspect.currentframe().f_code.co_name),
+                                    'joined'),
                             level=ch_core.hookenv.INFO)
         super().joined()
 
+    @when('endpoint.{endpoint_name}.departed')
+    def departed(self):
+        super().departed()
+
     @when('endpoint.{endpoint_name}.broken')
     def broken(self):
         super().broken()
+
+    def publish_relay(self, upstream_sb_connection_strs):
+        """Announce this unit as an OVSDB relay server for the SB database.
+
+        The relay is reached on the address published by
+        ``publish_cluster_local_addr``.  The SB connection strings of the
+        Raft cluster it relays are published for clients to fall back to.
+
+        :param upstream_sb_connection_strs: SB connection strings of the
+                                            Raft cluster, e.g. from
+                                            ``db_sb_connection_strs`` of the
+                                            requires side
+        :type upstream_sb_connection_strs: Iterable[str]
+        :returns: Number of skipped writes
+        :rtype: int
+        """
+        return self.publish_relation_data({'ovsdb-relay': {
+            'sb-upstream': list(upstream_sb_connection_strs)}})
@@ -16,8 +16,6 @@
 # with decorators on class instance methods, so we have to revert to `from ...`
 # imports
 
-import inspect
-
 import charmhelpers.core as ch_core
 
 import charms.reactive as reactive
@@ -36,12 +34,50 @@ class OVSDBCMSRequires(ovsdb.OVSDB):
         ch_core.hookenv.log('{}: {} -> {}'
                             .format(self._endpoint_name,
                                     type(self).__name__,
-                                    inspect.currentframe().f_code.co_name),
+                                    'joined'),
                             level=ch_core.hookenv.INFO)
         super().joined()
-        if self.expected_units_available():
-            reactive.set_flag(self.expand_name('{endpoint_name}.available'))
+        self.update_published_units()
+        reactive.toggle_flag(self.expand_name('{endpoint_name}.available'),
+                             self.expected_units_available())
+        self.update_query_state()
+
+    @when('endpoint.{endpoint_name}.changed.bound-address')
+    def bound_address_changed(self):
+        super().bound_address_changed()
+        reactive.toggle_flag(self.expand_name('{endpoint_name}.available'),
+                             self.expected_units_available())
+        self.update_query_state()
+        reactive.set_flag(self.expand_name('{endpoint_name}.servers-changed'))
+
+    @when('endpoint.{endpoint_name}.changed.raft-status')
+    def raft_status_changed(self):
+        super().raft_status_changed()
+
+    @when('endpoint.{endpoint_name}.departed')
+    def departed(self):
+        departed = super().departed()
+        reactive.toggle_flag(self.expand_name('{endpoint_name}.available'),
+                             self.expected_units_available())
+        self.update_query_state()
+        if departed:
+            reactive.set_flag(
+                self.expand_name('{endpoint_name}.servers-changed'))
 
     @when('endpoint.{endpoint_name}.broken')
     def broken(self):
         super().broken()
+
+    @property
+    def relay_units(self):
+        """Remote units serving as OVSDB relay for the SB database.
+
+        ``db_sb_connection_strs`` puts these first, followed by the Raft
+        cluster members and the SB connection strings published by the
+        relays as fallback.
+
+        :returns: Units
+        :rtype: List[ovsdb.UnitRecord]
+        """
+        return [unit for unit in self.relation_snapshot.units
+                if unit.valid and unit.is_relay]
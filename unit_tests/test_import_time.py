@@ -0,0 +1,66 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import unittest
+
+# Modules that must not be loaded by merely loading the interfaces, with each
+# its own copy of the shared library as in a built charm.  Those already
+# loaded by the reactive framework before it loads the interfaces are not
+# accounted for.
+DEFERRED_MODULES = ('asyncio', 'concurrent.futures', 'hashlib', 'inspect',
+                    'ipaddress', 'subprocess', 'tempfile')
+
+# Modules of the shared library only needed when processing relation data
+DEFERRED_LIB_MODULES = ('capture', 'probe', 'query', 'raft', 'tuning')
+
+INTERFACES = ('ovsdb', 'ovsdb_cms', 'ovsdb_cluster')
+ROLES = ('provides', 'requires', 'peers')
+
+
+class TestImportTime(unittest.TestCase):
+
+    def setUp(self):
+        import charms.reactive  # noqa
+        self.modules = set(sys.modules.keys())
+
+    def tearDown(self):
+        for name in set(sys.modules.keys()) - self.modules:
+            del sys.modules[name]
+
+    def import_interface(self, interface):
+        name = 'import_time_{}'.format(interface)
+        spec = importlib.machinery.ModuleSpec(name, None, is_package=True)
+        spec.submodule_search_locations = [os.path.join('src', interface)]
+        sys.modules[name] = importlib.util.module_from_spec(spec)
+        for role in ROLES:
+            if os.path.exists(os.path.join('src', interface,
+                                           '{}.py'.format(role))):
+                importlib.import_module('{}.{}'.format(name, role))
+        return name
+
+    def test_deferred_imports(self):
+        deferred = set(DEFERRED_MODULES) - self.modules
+        for interface in INTERFACES:
+            name = self.import_interface(interface)
+            deferred.update('{}.lib.{}'.format(name, module)
+                            for module in DEFERRED_LIB_MODULES)
+        loaded = sorted(deferred.intersection(sys.modules.keys()))
+        self.assertEqual(loaded, [],
+                         'Loading interfaces loaded {}'
+                         .format(', '.join(loaded)))
@@ -0,0 +1,110 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import stat
+import tempfile
+
+import mock
+
+from lib import capture
+
+import charms_openstack.test_utils as test_utils
+
+
+class TestCapture(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(capture.ch_core.hookenv, 'cache', new={})
+        self.patch_object(capture.ch_core.hookenv, 'atexit')
+        self.patch_object(capture.ch_core.hookenv, 'local_unit',
+                          return_value='ovn-chassis/0')
+        self.patch_object(capture.ch_core.hookenv, 'hook_name',
+                          return_value='ovsdb-relation-changed')
+        self.patch_object(capture.ch_core.hookenv, 'relation_id',
+                          return_value='ovsdb:42')
+        self.patch_object(capture.ch_core.hookenv, 'remote_unit',
+                          return_value='ovn-central/0')
+        self.patch_object(capture.ch_core.hookenv, 'goal_state',
+                          return_value={'units': {'ovn-chassis/0': {}}})
+
+    def test_enable_disable(self):
+        self.assertIsNone(capture.get_capture())
+        recorder = capture.enable('/some/path')
+        self.assertEquals(capture.get_capture(), recorder)
+        self.atexit.assert_called_once_with(recorder.report)
+        self.assertEquals(capture.enable('/other/path'), recorder)
+        self.assertEquals(recorder.path, '/other/path')
+        self.atexit.assert_called_once_with(recorder.report)
+        capture.disable()
+        self.assertIsNone(capture.get_capture())
+        self.assertIsNone(recorder.path)
+
+    def test_dump(self):
+        relation = mock.MagicMock()
+        relation.relation_id = 'ovsdb:42'
+        relation.application_name = 'ovn-central'
+        relation.received_app_raw = {'connection-str-generation': '1'}
+        unit = mock.MagicMock()
+        unit.unit_name = 'ovn-central/0'
+        unit.received_raw = {'bound-address': '"10.0.0.1"'}
+        relation.units = [unit]
+        recorder = capture.Capture('/some/path')
+        recorder.record_relations('ovsdb', [relation],
+                                  endpoint_class='OVSDBProvides')
+        recorder.record_network('ovsdb', None, {'bind-addresses': []})
+        self.assertEquals(recorder.dump(), {
+            'v': capture.CAPTURE_VERSION,
+            'local_unit': 'ovn-chassis/0',
+            'hook': 'ovsdb-relation-changed',
+            'relation_id': 'ovsdb:42',
+            'remote_unit': 'ovn-central/0',
+            'goal_state_units': ['ovn-chassis/0'],
+            'endpoints': {'ovsdb': 'OVSDBProvides'},
+            'relations': {
+                'ovsdb': {
+                    'ovsdb:42': {
+                        'ovn-central/0': {'bound-address': '"10.0.0.1"'},
+                    },
+                },
+            },
+            'apps': {
+                'ovsdb': {
+                    'ovsdb:42': {
+                        'ovn-central': {'connection-str-generation': '1'},
+                    },
+                },
+            },
+            'networks': {'ovsdb': {'': {'bind-addresses': []}}},
+        })
+        self.goal_state.side_effect = NotImplementedError
+        self.assertIsNone(recorder.dump()['goal_state_units'])
+
+    def test_report(self):
+        self.patch_object(capture.ch_core.hookenv, 'log')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'capture.json')
+            recorder = capture.Capture(path)
+            recorder.report()
+            with open(path) as f:
+                self.assertEquals(json.load(f), recorder.dump())
+            self.assertEquals(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            self.assertEquals(os.listdir(tmpdir), ['capture.json'])
+            recorder.path = os.path.join(tmpdir, 'missing', 'capture.json')
+            recorder.report()
+            self.log.assert_called_once_with(mock.ANY, level=mock.ANY)
+        recorder.path = None
+        recorder.report()
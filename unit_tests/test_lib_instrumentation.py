@@ -0,0 +1,108 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+
+import mock
+
+from lib import instrumentation
+
+import charms_openstack.test_utils as test_utils
+
+
+class FakeEndpoint(object):
+    endpoint_name = 'some-relation'
+
+    @instrumentation.instrumented
+    def some_method(self):
+        return instrumentation.ch_core.hookenv.relation_get(
+            unit='some-unit/0', rid='some-relation:42')
+
+
+class TestInstrumentation(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(instrumentation.ch_core.hookenv, 'cache', new={})
+        for name in instrumentation.HOOK_TOOLS.keys():
+            self.patch_object(instrumentation.ch_core.hookenv, name)
+        self.patch_object(instrumentation.ch_core.hookenv, 'atexit')
+        self.patch_object(instrumentation.ch_core.hookenv, 'local_unit',
+                          return_value='some-unit/0')
+        self.patch_object(instrumentation.ch_core.hookenv, 'hook_name',
+                          return_value='update-status')
+
+    def test_histogram(self):
+        histogram = instrumentation.Histogram()
+        histogram.observe(0.002)
+        histogram.observe(20)
+        self.assertEquals(histogram.count, 2)
+        self.assertEquals(histogram.sum, 20.002)
+        self.assertEquals(histogram.buckets[0], 0)
+        self.assertEquals(histogram.buckets[1], 1)
+        self.assertEquals(histogram.buckets[-1], 1)
+
+    def test_disabled(self):
+        self.relation_get.return_value = {'bound-address': '"192.0.2.1"'}
+        self.assertEquals(FakeEndpoint().some_method(),
+                          {'bound-address': '"192.0.2.1"'})
+        self.assertIsNone(instrumentation.get_recorder())
+
+    def test_enable_disable(self):
+        relation_get = self.relation_get
+        recorder = instrumentation.enable()
+        self.assertIs(instrumentation.enable(), recorder)
+        self.atexit.assert_called_once_with(recorder.report)
+        self.assertIsNot(instrumentation.ch_core.hookenv.relation_get,
+                         relation_get)
+        FakeEndpoint().some_method()
+        instrumentation.ch_core.hookenv.network_get('other-relation')
+        instrumentation.ch_core.hookenv.relation_set(
+            'other-relation:1', {'some-key': 'some-value'})
+        relation_get.assert_called_once_with(
+            unit='some-unit/0', rid='some-relation:42')
+        self.assertEquals(
+            list(recorder.histograms.keys()),
+            [('some-relation', 'some_method', 'relation-get'),
+             ('other-relation', '-', 'network-get'),
+             ('other-relation', '-', 'relation-set')])
+        instrumentation.disable()
+        self.assertIs(instrumentation.ch_core.hookenv.relation_get,
+                      relation_get)
+        self.assertIsNone(instrumentation.get_recorder())
+
+    def test_report(self):
+        self.patch_object(instrumentation.ch_core.hookenv, 'log')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            textfile = os.path.join(tmpdir, 'ovsdb.prom')
+            recorder = instrumentation.Recorder(textfile=textfile)
+            recorder.observe('network-get', 0.2, endpoint='some-relation')
+            recorder.report()
+            self.log.assert_called_once_with(
+                'hook tool calls: some-relation - network-get: 1 calls, '
+                '0.200s', level=mock.ANY)
+            with open(textfile) as f:
+                metrics = f.read().splitlines()
+            self.assertEquals(os.listdir(tmpdir), ['ovsdb.prom'])
+        labels = ('unit="some-unit/0",hook="update-status",'
+                  'endpoint="some-relation",method="-",tool="network-get"')
+        self.assertIn('# TYPE {} histogram'.format(instrumentation.METRIC),
+                      metrics)
+        self.assertIn('{}_bucket{{{},le="0.1"}} 0'
+                      .format(instrumentation.METRIC, labels), metrics)
+        self.assertIn('{}_bucket{{{},le="0.25"}} 1'
+                      .format(instrumentation.METRIC, labels), metrics)
+        self.assertIn('{}_count{{{}}} 1'
+                      .format(instrumentation.METRIC, labels), metrics)
@@ -12,9 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import ipaddress
+import socket
+import threading
+
 import mock
 
 from lib import ovsdb
+from lib import probe
+from lib import query
+from lib import raft
+from lib import tuning
 
 import charms_openstack.test_utils as test_utils
 
@@ -29,6 +38,7 @@ class TestOVSDBLib(test_utils.PatchHelper):
         self.target = ovsdb.OVSDB('some-relation', [])
         self._patches = {}
         self._patches_start = {}
+        self.patch_object(ovsdb.ch_core.hookenv, 'cache', new={})
 
     def tearDown(self):
         self.target = None
@@ -46,13 +56,70 @@ class TestOVSDBLib(test_utils.PatchHelper):
         self._patches_start[attr] = started
         setattr(self, attr, started)
 
-    def patch_topublish(self):
-        self.patch_target('_relations')
-        relation = mock.MagicMock()
-        to_publish = mock.PropertyMock()
-        type(relation).to_publish = to_publish
-        self._relations.__iter__.return_value = [relation]
-        return relation.to_publish
+    def test_network_get(self):
+        self.patch_object(ovsdb.ch_core.hookenv, 'network_get')
+        self.network_get.return_value = {'bind-addresses': []}
+        self.assertEquals(
+            ovsdb.network_get('some-relation', relation_id='some-relation:42'),
+            {'bind-addresses': []})
+        self.assertEquals(
+            ovsdb.network_get('some-relation', relation_id='some-relation:42'),
+            {'bind-addresses': []})
+        self.network_get.assert_called_once_with(
+            'some-relation', relation_id='some-relation:42')
+        ovsdb.network_get('some-relation', relation_id='some-relation:51')
+        ovsdb.network_get('other-relation', relation_id='other-relation:1')
+        self.assertEquals(self.network_get.call_count, 3)
+
+    def test_invalidate_network_get(self):
+        self.patch_object(ovsdb.ch_core.hookenv, 'network_get')
+        ovsdb.network_get('some-relation', relation_id='some-relation:42')
+        ovsdb.network_get('other-relation', relation_id='other-relation:1')
+        ovsdb.invalidate_network_get(binding='some-relation')
+        ovsdb.network_get('some-relation', relation_id='some-relation:42')
+        ovsdb.network_get('other-relation', relation_id='other-relation:1')
+        self.assertEquals(self.network_get.call_count, 3)
+        ovsdb.invalidate_network_get()
+        ovsdb.network_get('other-relation', relation_id='other-relation:1')
+        self.assertEquals(self.network_get.call_count, 4)
+
+    def test_addr_cache(self):
+        cache = ovsdb.AddrCache(maxsize=2)
+        self.assertEquals(cache.parse('192.0.2.1'),
+                          (ipaddress.ip_address('192.0.2.1'), '192.0.2.1'))
+        self.assertEquals(cache.parse('2001:db8::1'),
+                          (ipaddress.ip_address('2001:db8::1'),
+                           '[2001:db8::1]'))
+        self.assertEquals(cache.info(), ovsdb.AddrCacheInfo(0, 2, 2, 2))
+        cache.parse('192.0.2.1')
+        self.assertEquals(cache.info(), ovsdb.AddrCacheInfo(1, 2, 2, 2))
+        # least recently used is evicted, invalid addresses are cached
+        self.assertIsNone(cache.parse('bogus'))
+        self.assertIsNone(cache.parse('bogus'))
+        self.assertEquals(cache.info(), ovsdb.AddrCacheInfo(2, 3, 2, 2))
+        cache.parse('2001:db8::1')
+        cache.parse('192.0.2.1')
+        self.assertEquals(cache.info(), ovsdb.AddrCacheInfo(2, 5, 2, 2))
+        self.assertIsNone(cache.parse(['192.0.2.1']))
+        cache.clear()
+        self.assertEquals(cache.info(), ovsdb.AddrCacheInfo(0, 0, 2, 0))
+
+    def test_parse_addr(self):
+        self.assertEquals(ovsdb.parse_addr('192.0.2.1')[1], '192.0.2.1')
+        with self.assertRaises(ValueError):
+            ovsdb.parse_addr('bogus')
+        with self.assertRaises(ValueError):
+            ovsdb.parse_addr('bogus')
+        self.assertEquals(self.target.addr_cache_info.hits, 1)
+        self.assertEquals(self.target.addr_cache_info.misses, 2)
+
+    def test_parse_addrs(self):
+        self.assertEquals(
+            ovsdb.parse_addrs(['192.0.2.1', 'bogus']),
+            [(ipaddress.ip_address('192.0.2.1'), '192.0.2.1'), None])
+        self.assertEquals(
+            ovsdb.format_addrs(['192.0.2.1', '', '2001:db8::1']),
+            ['192.0.2.1', '[2001:db8::1]'])
 
     def test_cluster_local_addr(self):
         relation = mock.MagicMock()
@@ -80,22 +147,936 @@ class TestOVSDBLib(test_utils.PatchHelper):
             'ingress-addresses': ['42.42.42.42'],
         }
         self.assertEquals(self.target.cluster_local_addr, '42.42.42.42')
+        self.assertEquals(self.target.cluster_local_addr, '42.42.42.42')
         self.network_get.assert_called_once_with(
             'some-relation', relation_id='some-endpoint:42')
 
+    def patch_units(self, bound_addresses):
+        relation = mock.MagicMock()
+        relation.relation_id = 'some-relation:42'
+        units = []
+        for n, bound_address in enumerate(bound_addresses):
+            unit = mock.MagicMock()
+            unit.unit_name = 'some-unit/{}'.format(n)
+            if isinstance(bound_address, dict):
+                unit.received = bound_address
+            else:
+                unit.received = {'bound-address': bound_address}
+            units.append(unit)
+        relation.units = units
+        self.patch_target('_relations')
+        self._relations.__iter__.return_value = [relation]
+        return units
+
+    def test_prefetch_received(self):
+        self.patch_object(ovsdb.reactive.endpoints, 'JSONUnitDataView',
+                          side_effect=lambda data: data)
+        lock = threading.Lock()
+        calls = {'in_flight': 0, 'peak': 0, 'barrier': None}
+
+        # stand-in for the hook tool keeping track of calls in flight
+        def relation_get(unit=None, rid=None):
+            with lock:
+                calls['in_flight'] += 1
+                calls['peak'] = max(calls['peak'], calls['in_flight'])
+            try:
+                if calls['barrier']:
+                    # hold calls until as many as workers are in flight
+                    calls['barrier'].wait()
+                return {'bound-address': unit}
+            finally:
+                with lock:
+                    calls['in_flight'] -= 1
+
+        self.patch_object(ovsdb.ch_core.hookenv, 'relation_get',
+                          side_effect=relation_get)
+
+        def make_units():
+            units = []
+            for n in range(16):
+                unit = mock.MagicMock()
+                unit.unit_name = 'some-unit/{}'.format(n)
+                unit.relation.relation_id = 'some-relation:42'
+                unit._data = None
+                units.append(unit)
+            return units
+
+        for max_workers in (1, 4):
+            units = make_units()
+            calls['peak'] = 0
+            if max_workers > 1:
+                calls['barrier'] = threading.Barrier(max_workers, timeout=10)
+            self.assertEquals(
+                ovsdb.prefetch_received(units, max_workers=max_workers), 16)
+            self.assertEquals(calls['peak'], max_workers)
+            self.assertEquals([unit._data for unit in units],
+                              [{'bound-address': 'some-unit/{}'.format(n)}
+                               for n in range(16)])
+        self.assertEquals(self.relation_get.call_count, 32)
+        self.assertEquals(ovsdb.prefetch_received(units), 0)
+        self.assertEquals(self.relation_get.call_count, 32)
+
+    def test_relation_snapshot(self):
+        self.patch_units(['192.0.2.1', '2001:db8::1', 'bogus', ''])
+        snapshot = self.target.relation_snapshot
+        self.assertIs(snapshot, self.target.relation_snapshot)
+        self.assertEquals(len(snapshot.units), 4)
+        self.assertEquals(snapshot.units[0], ovsdb.UnitRecord(
+            'some-relation:42', 'some-unit/0', '192.0.2.1',
+            ipaddress.ip_address('192.0.2.1'), '192.0.2.1', True,
+            addresses=(ovsdb.UnitAddress(
+                None, ipaddress.ip_address('192.0.2.1'), '192.0.2.1',
+                None),)))
+        self.assertEquals(snapshot.units[2], ovsdb.UnitRecord(
+            'some-relation:42', 'some-unit/2', 'bogus', None, None, False))
+        self.assertEquals(snapshot.remote_addrs,
+                          ('192.0.2.1', '[2001:db8::1]'))
+        with self.assertRaises(AttributeError):
+            snapshot.units = ()
+        self.target.invalidate_relation_snapshot()
+        self.assertIsNot(snapshot, self.target.relation_snapshot)
+
+    def test_relation_snapshot_addresses(self):
+        self.patch_units([
+            {'addresses': {'v': 1,
+                           'a': [['eth0', '192.0.2.1', '192.0.2.0/24'],
+                                 ['eth0', '2001:db8::1', '2001:db8::/64'],
+                                 ['eth1', 'bogus', ''], 'bogus'],
+                           'p': {'nb': 6641, 'sb': 6642}}},
+            {'bound-address': '192.0.2.2',
+             'addresses': {'v': 2, 'a': [['eth0', '2001:db8::2', '']]}},
+        ])
+        units = self.target.relation_snapshot.units
+        self.assertEquals(units[0].bound_address, '192.0.2.1')
+        self.assertEquals(units[0].addresses, (
+            ovsdb.UnitAddress('eth0', ipaddress.ip_address('192.0.2.1'),
+                              '192.0.2.1', '192.0.2.0/24'),
+            ovsdb.UnitAddress('eth0', ipaddress.ip_address('2001:db8::1'),
+                              '[2001:db8::1]', '2001:db8::/64'),
+        ))
+        self.assertEquals(units[0].ports, {'nb': 6641, 'sb': 6642})
+        self.assertEquals(units[1].addresses, (
+            ovsdb.UnitAddress(None, ipaddress.ip_address('192.0.2.2'),
+                              '192.0.2.2', None),
+        ))
+        self.assertIsNone(units[1].ports)
+        self.assertEquals(self.target.ordered_remote_addrs,
+                          ['192.0.2.1', '192.0.2.2'])
+        with self.assertRaises(ValueError):
+            self.target.set_address_family(5)
+        self.target.set_address_family(6)
+        self.assertEquals(self.target.ordered_remote_addrs,
+                          ['[2001:db8::1]', '192.0.2.2'])
+
+    def test_published_ports(self):
+        self.patch_units([
+            {'addresses': {'v': 1, 'a': [['eth0', '192.0.2.1', '']],
+                           'p': {'nb': 16641, 'sb': 'bogus'}}},
+            {'addresses': {'v': 1, 'a': [['eth0', '192.0.2.2', '']],
+                           'p': {'nb': True, 'sb': 16642}}},
+            {'bound-address': '192.0.2.3'},
+        ])
+        units = self.target.relation_snapshot.units
+        self.assertEquals(units[0].ports, {'nb': 16641})
+        self.assertEquals(units[1].ports, {'sb': 16642})
+        # units that did not publish a port are connected to on the default
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:192.0.2.1:16641', 'ssl:192.0.2.2:6641',
+                           'ssl:192.0.2.3:6641'])
+        self.assertEquals(list(self.target.db_sb_connection_strs),
+                          ['ssl:192.0.2.1:6642', 'ssl:192.0.2.2:16642',
+                           'ssl:192.0.2.3:6642'])
+
+    def test_relation_snapshot_cluster_address(self):
+        self.patch_units([
+            {'bound-address': '192.0.2.1', 'cluster-address': '198.51.100.1'},
+            {'bound-address': '192.0.2.2', 'cluster-address': 'bogus'},
+            {'bound-address': '192.0.2.3'},
+        ])
+        self.assertEquals(
+            [unit.cluster_address
+             for unit in self.target.relation_snapshot.units],
+            ['198.51.100.1', None, None])
+
+    def test_cluster_remote_addrs(self):
+        self.patch_units(['192.0.2.1', 'bogus', '2001:db8::1'])
+        self.assertEquals(list(self.target.cluster_remote_addrs),
+                          ['192.0.2.1', '[2001:db8::1]'])
+        self.assertEquals(list(self.target.db_sb_connection_strs),
+                          ['ssl:192.0.2.1:6642', 'ssl:[2001:db8::1]:6642'])
+
+    def test_published_connection_strs(self):
+        self.patch_units(['192.0.2.1', '192.0.2.2', '192.0.2.3'])
+        relation = self._relations.__iter__.return_value[0]
+        relation.received_app = {
+            'nb-connection-str': ('ssl:192.0.2.1:6641,ssl:192.0.2.2:6641,'
+                                  'ssl:192.0.2.9:6641'),
+            'sb-connection-str': ('ssl:192.0.2.1:6642,ssl:192.0.2.2:6642,'
+                                  'ssl:192.0.2.9:6642'),
+            'connection-str-generation': 3,
+        }
+        # strings of servers that are not remote units are left out
+        self.assertEquals(
+            self.target.published_connection_strs,
+            ovsdb.ConnectionStrs(
+                'some-relation:42', 3,
+                ('ssl:192.0.2.1:6641', 'ssl:192.0.2.2:6641'),
+                ('ssl:192.0.2.1:6642', 'ssl:192.0.2.2:6642')))
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:192.0.2.1:6641', 'ssl:192.0.2.2:6641'])
+        self.assertEquals(list(self.target.db_sb_connection_strs),
+                          ['ssl:192.0.2.1:6642', 'ssl:192.0.2.2:6642'])
+        # as are those of a unit departing in this hook
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.invalidate_relation_snapshot()
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:192.0.2.1:6641'])
+        self.patch_object(ovsdb.reactive.helpers, 'data_changed',
+                          return_value=True)
+        self.assertTrue(self.target.connection_strs_changed())
+        self.data_changed.assert_called_once_with(
+            'some-relation.connection-str-generations',
+            [('some-relation:42', 3, ['some-unit/0', 'some-unit/2'])])
+        # other orders need the individual addresses
+        self.target.set_connection_order(self.target.ORDER_LOCALITY)
+        self.assertIsNone(self.target.published_connection_strs)
+
+    def test_published_connection_strs_subset_address_family(self):
+        self.patch_units(['192.0.2.1', '192.0.2.2', '192.0.2.3'])
+        relation = self._relations.__iter__.return_value[0]
+        relation.received_app = {
+            'nb-connection-str': ('ssl:192.0.2.1:6641,ssl:192.0.2.2:6641,'
+                                  'ssl:192.0.2.3:6641'),
+            'connection-str-generation': 1,
+        }
+        self.assertIsNotNone(self.target.published_connection_strs)
+        # a subset or another address family needs the individual addresses
+        self.target.set_connection_order(self.target.ORDER_RELATION,
+                                         subset=2)
+        self.assertIsNone(self.target.published_connection_strs)
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:192.0.2.1:6641', 'ssl:192.0.2.2:6641'])
+        self.target.set_connection_order(self.target.ORDER_RELATION)
+        self.target.set_address_family(6)
+        self.assertIsNone(self.target.published_connection_strs)
+
+    def test_connection_strs_changed_reads_no_unit_data(self):
+        units = self.patch_units(['192.0.2.1', '192.0.2.2'])
+        for unit in units:
+            unit.received = mock.MagicMock()
+        relation = self._relations.__iter__.return_value[0]
+        relation.received_app = {'connection-str-generation': 1}
+        self.patch_hook('update-status')
+        self.patch_object(ovsdb.reactive.helpers, 'data_changed',
+                          return_value=False)
+        self.assertFalse(self.target.connection_strs_changed())
+        for unit in units:
+            self.assertFalse(unit.received.get.called)
+
+    def test_publish_connection_strs(self):
+        self.patch_object(ovsdb.ch_core.hookenv, 'is_leader',
+                          return_value=False)
+        relations = []
+        for n in range(2):
+            relation = mock.MagicMock()
+            relation.relation_id = 'some-relation:{}'.format(n)
+            relation.to_publish_app = {}
+            relations.append(relation)
+        self.patch_target('_relations')
+        self._relations.__iter__.return_value = relations
+        self.assertIsNone(
+            self.target.publish_connection_strs(['ssl:192.0.2.1:6641'],
+                                                ['ssl:192.0.2.1:6642']))
+        self.assertEquals(relations[0].to_publish_app, {})
+        self.is_leader.return_value = True
+        # generation is kept in the relation data, a new leader continues
+        # where the previous one left off
+        relations[1].to_publish_app.update({
+            'nb-connection-str': 'ssl:192.0.2.2:6641',
+            'sb-connection-str': 'ssl:192.0.2.2:6642',
+            'connection-str-generation': 4,
+        })
+        self.assertEquals(
+            self.target.publish_connection_strs(['ssl:192.0.2.1:6641'],
+                                                ['ssl:192.0.2.1:6642']),
+            5)
+        self.assertEquals(relations[0].to_publish_app, {
+            'nb-connection-str': 'ssl:192.0.2.1:6641',
+            'sb-connection-str': 'ssl:192.0.2.1:6642',
+            'connection-str-generation': 1,
+        })
+        self.assertEquals(relations[1].to_publish_app, {
+            'nb-connection-str': 'ssl:192.0.2.1:6641',
+            'sb-connection-str': 'ssl:192.0.2.1:6642',
+            'connection-str-generation': 5,
+        })
+        self.assertEquals(
+            self.target.publish_connection_strs(['ssl:192.0.2.1:6641'],
+                                                ['ssl:192.0.2.1:6642']),
+            5)
+        self.assertEquals(
+            relations[0].to_publish_app['connection-str-generation'], 1)
+
+    def patch_kv(self):
+        store = {}
+        kv = mock.MagicMock()
+        kv.get.side_effect = lambda key, default=None: store.get(key, default)
+        kv.set.side_effect = store.__setitem__
+        kv.unset.side_effect = lambda key: store.pop(key, None)
+        self.patch_object(ovsdb.ch_core.unitdata, 'kv', return_value=kv)
+        return store
+
+    def patch_hook(self, hook_name, relation_id=None, remote_unit=None):
+        # patch once per test, patching an attribute twice would leak the
+        # first patch into other tests
+        if not getattr(self, '_hook_patched', False):
+            self.patch_object(ovsdb.ch_core.hookenv, 'hook_name')
+            self.patch_object(ovsdb.ch_core.hookenv, 'relation_id')
+            self.patch_object(ovsdb.ch_core.hookenv, 'remote_unit')
+            self._hook_patched = True
+        self.hook_name.return_value = hook_name
+        self.relation_id.return_value = relation_id
+        self.remote_unit.return_value = remote_unit
+
+    def test_locality_key(self):
+        addrs = [ipaddress.ip_address(addr) for addr in (
+            '2001:db8::1', '10.0.2.1', '10.0.3.1', '10.0.1.200', '10.0.1.2')]
+        key = ovsdb.locality_key(
+            ipaddress.ip_address('10.0.1.1'),
+            local_network=ipaddress.ip_network('10.0.1.0/24'),
+            zones=ovsdb.parse_zones({
+                '10.0.1.0/24': 'rack1',
+                '10.0.3.0/24': 'rack1',
+                '10.0.2.0/24': 'rack2',
+            }))
+        self.assertEquals(
+            [str(addr) for addr in sorted(addrs, key=key)],
+            ['10.0.1.2', '10.0.1.200', '10.0.3.1', '10.0.2.1', '2001:db8::1'])
+
+    def test_rendezvous_key(self):
+        servers = ['ovn-central/{}'.format(n) for n in range(5)]
+        clients = ['ovn-chassis/{}'.format(n) for n in range(10000)]
+        first = {client: min(servers, key=ovsdb.rendezvous_key(client))
+                 for client in clients}
+        key = ovsdb.rendezvous_key(clients[0])
+        self.assertEquals(sorted(servers, key=key),
+                          sorted(reversed(servers), key=key))
+        # spread evenly, expected 2000 clients per server
+        counts = collections.Counter(first.values())
+        self.assertEquals(sorted(counts.keys()), servers)
+        self.assertLess(max(counts.values()) - min(counts.values()), 300)
+        # only clients of removed server move
+        remaining = servers[:2] + servers[3:]
+        moved = set(client for client in clients
+                    if first[client] != min(
+                        remaining, key=ovsdb.rendezvous_key(client)))
+        self.assertEquals(moved, set(client for client in clients
+                                     if first[client] == servers[2]))
+        # about a sixth of clients move to an added server
+        added = servers + ['ovn-central/5']
+        moved = [client for client in clients
+                 if first[client] != min(
+                     added, key=ovsdb.rendezvous_key(client))]
+        self.assertLess(abs(len(moved) - len(clients) / 6), 300)
+
+    def test_ordered_remote_addrs_rendezvous(self):
+        self.patch_units(['10.0.1.1', '10.0.1.2', '10.0.1.3'])
+        self.patch_object(ovsdb.ch_core.hookenv, 'local_unit',
+                          return_value='ovn-chassis/0')
+        with self.assertRaises(ValueError):
+            self.target.set_connection_order(
+                self.target.ORDER_RENDEZVOUS, subset=0)
+        self.target.set_connection_order(self.target.ORDER_RENDEZVOUS)
+        key = ovsdb.rendezvous_key('ovn-chassis/0')
+        expect = [unit.formatted_address for unit in sorted(
+            self.target.relation_snapshot.units,
+            key=lambda unit: key(unit.unit_name))]
+        self.assertEquals(self.target.ordered_remote_addrs, expect)
+        self.target.set_connection_order(self.target.ORDER_RENDEZVOUS,
+                                         subset=2)
+        self.assertEquals(self.target.ordered_remote_addrs, expect[:2])
+
+    def test_set_connection_order(self):
+        with self.assertRaises(ValueError):
+            self.target.set_connection_order('bogus')
+        with self.assertRaises(ValueError):
+            self.target.set_connection_order(
+                self.target.ORDER_LOCALITY, zones={'bogus': 'rack1'})
+
+    def test_ordered_remote_addrs(self):
+        self.patch_units(['10.0.2.1', '10.0.1.2', 'bogus', '10.0.1.3'])
+        self.patch_target('_cluster_local_bind_addr')
+        self._cluster_local_bind_addr.return_value = {
+            'address': '10.0.1.1', 'cidr': '10.0.1.0/24'}
+        self.assertEquals(self.target.ordered_remote_addrs,
+                          ['10.0.2.1', '10.0.1.2', '10.0.1.3'])
+        self.target.set_connection_order(self.target.ORDER_LOCALITY)
+        self.assertEquals(self.target.ordered_remote_addrs,
+                          ['10.0.1.2', '10.0.1.3', '10.0.2.1'])
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:10.0.1.2:6641', 'ssl:10.0.1.3:6641',
+                           'ssl:10.0.2.1:6641'])
+
+    def test_probe_db_connection_strs(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(16)
+        port = sock.getsockname()[1]
+        store = self.patch_kv()
+        self.patch_units(['127.0.0.2', 'bogus', '127.0.0.1'])
+        self.assertEquals(self.target.probe_db_connection_strs(port),
+                          ['ssl:127.0.0.1:{}'.format(port)])
+        self.assertEquals(
+            sorted(store['charm-interface-ovsdb.some-relation.probe-results']),
+            ['127.0.0.1:{}'.format(port), '127.0.0.2:{}'.format(port)])
+        prober = mock.MagicMock()
+        self.assertEquals(
+            self.target.probe_db_connection_strs(port, proto='tcp',
+                                                 prober=prober),
+            ['tcp:127.0.0.1:{}'.format(port)])
+        self.assertFalse(prober.probe.called)
+        prober.probe.return_value = [
+            probe.ProbeResult('127.0.0.2', port, 0.002),
+            probe.ProbeResult('127.0.0.1', port, 0.001),
+        ]
+        self.assertEquals(
+            self.target.probe_db_connection_strs(port, ttl=0, prober=prober),
+            ['ssl:127.0.0.1:{}'.format(port), 'ssl:127.0.0.2:{}'.format(port)])
+        prober.probe.assert_called_once_with(
+            [[('127.0.0.2', port)], [('127.0.0.1', port)]])
+
+    def test_probe_db_connection_strs_dual_stack(self):
+        self.patch_kv()
+        self.patch_units([
+            {'addresses': {'v': 1,
+                           'a': [['eth0', '192.0.2.1', ''],
+                                 ['eth0', '2001:db8::1', '']]}},
+            {'addresses': {'v': 1,
+                           'a': [['eth0', '192.0.2.2', ''],
+                                 ['eth0', '2001:db8::2', '']]}},
+        ])
+        prober = mock.MagicMock()
+        prober.probe.return_value = [
+            probe.ProbeResult('2001:db8::1', 6642, 0.001),
+            None,
+        ]
+        # all addresses of a unit race, the one that won is connected to
+        self.assertEquals(
+            self.target.probe_db_connection_strs(6642, prober=prober),
+            ['ssl:[2001:db8::1]:6642'])
+        prober.probe.assert_called_once_with([
+            [('192.0.2.1', 6642), ('2001:db8::1', 6642)],
+            [('192.0.2.2', 6642), ('2001:db8::2', 6642)],
+        ])
+        prober.probe.reset_mock()
+        self.assertEquals(
+            self.target.probe_db_connection_strs(6642, prober=prober),
+            ['ssl:[2001:db8::1]:6642'])
+        self.assertFalse(prober.probe.called)
+
+    def test_connection_profile(self):
+        self.patch_units([
+            {'bound-address': '10.0.1.2',
+             'connection-profile': {'protocols': ['unix', 'ssl'],
+                                    'unix-sockets': {
+                                        'nb': '/run/ovn/ovnnb_db.sock'}}},
+            {'bound-address': '10.0.1.1',
+             'connection-profile': {'protocols': ['unix', 'tcp', 'ssl'],
+                                    'unix-sockets': {
+                                        'nb': '/run/ovn/ovnnb_db.sock',
+                                        'bogus': '/bogus'}}},
+            {'bound-address': '10.0.1.3', 'connection-profile': 'bogus'},
+        ])
+        self.patch_target('_cluster_local_bind_addr')
+        self._cluster_local_bind_addr.return_value = {
+            'address': '10.0.1.1', 'cidr': '10.0.1.0/24'}
+        snapshot = self.target.relation_snapshot
+        self.assertEquals(snapshot.units[1].profile, ovsdb.ConnectionProfile(
+            ('unix', 'tcp', 'ssl'), {'nb': '/run/ovn/ovnnb_db.sock'}))
+        self.assertIsNone(snapshot.units[2].profile)
+        self.assertEquals(self.target.colocated_unit.unit_name, 'some-unit/1')
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:10.0.1.2:6641', 'unix:/run/ovn/ovnnb_db.sock',
+                           'ssl:10.0.1.3:6641'])
+        self.assertEquals(list(self.target.db_sb_connection_strs),
+                          ['ssl:10.0.1.2:6642', 'tcp:10.0.1.1:6642',
+                           'ssl:10.0.1.3:6642'])
+        self._cluster_local_bind_addr.return_value = {
+            'address': '10.0.1.4', 'cidr': '10.0.1.0/24'}
+        self.assertIsNone(self.target.colocated_unit)
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:10.0.1.2:6641', 'ssl:10.0.1.1:6641',
+                           'ssl:10.0.1.3:6641'])
+
+    def test_publish_connection_profile(self):
+        self.patch_target('publish_relation_data')
+        with self.assertRaises(ValueError):
+            self.target.publish_connection_profile(
+                unix_sockets={'bogus': '/bogus'})
+        self.target.publish_connection_profile(
+            protocols=('unix', 'ssl'),
+            unix_sockets={'sb': '/run/ovn/ovnsb_db.sock'})
+        self.publish_relation_data.assert_called_once_with(
+            {'connection-profile': {
+                'protocols': ['unix', 'ssl'],
+                'unix-sockets': {'sb': '/run/ovn/ovnsb_db.sock'}}})
+
+    def test_tuning_hints(self):
+        self.patch_units([
+            {'bound-address': '192.0.2.1', 'tuning-hints': 'bogus'},
+            {'bound-address': '192.0.2.2',
+             'tuning-hints': {'v': 1, 'hints': {'max-backoff': 30000}}},
+        ])
+        self.assertEquals(self.target.tuning_hints.max_backoff, 30000)
+        self.target.invalidate_relation_snapshot()
+        self.patch_units(['192.0.2.1'])
+        self.assertEquals(self.target.tuning_hints,
+                          tuning.make_hints())
+
+    def test_publish_tuning_hints(self):
+        self.patch_target('publish_relation_data')
+        with self.assertRaises(ValueError):
+            self.target.publish_tuning_hints(jitter=2)
+        self.target.publish_tuning_hints(jitter=0.25)
+        self.publish_relation_data.assert_called_once_with({
+            'tuning-hints': tuning.to_payload(
+                tuning.make_hints(jitter=0.25))})
+
+    def test_relay_connection_strs(self):
+        self.patch_units([
+            {'bound-address': '10.0.1.1'},
+            {'bound-address': '10.0.2.1',
+             'ovsdb-relay': {'sb-upstream': ['ssl:10.0.1.1:6642',
+                                             'ssl:10.0.1.2:6642']}},
+            {'bound-address': '10.0.2.2', 'ovsdb-relay': {}},
+        ])
+        units = self.target.relation_snapshot.units
+        self.assertFalse(units[0].is_relay)
+        self.assertEquals(units[1].relay_upstream,
+                          ('ssl:10.0.1.1:6642', 'ssl:10.0.1.2:6642'))
+        self.assertEquals(units[2].relay_upstream, ())
+        self.assertEquals(list(self.target.db_sb_connection_strs),
+                          ['ssl:10.0.2.1:6642', 'ssl:10.0.2.2:6642',
+                           'ssl:10.0.1.1:6642', 'ssl:10.0.1.2:6642'])
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:10.0.1.1:6641'])
+        # relays are not Raft cluster members
+        self.assertEquals(list(self.target.cluster_remote_addrs),
+                          ['10.0.1.1'])
+        self.assertEquals(self.target.ordered_remote_addrs, ['10.0.1.1'])
+        prober = mock.MagicMock()
+        prober.probe.return_value = [
+            probe.ProbeResult('10.0.1.1', 6641, 0.001)]
+        self.patch_kv()
+        self.assertEquals(
+            self.target.probe_db_connection_strs(6641, prober=prober),
+            ['ssl:10.0.1.1:6641'])
+        prober.probe.assert_called_once_with([[('10.0.1.1', 6641)]])
+
+    def test_endpoint_state(self):
+        self.patch_kv()
+        units = self.patch_units(['192.0.2.1', '192.0.2.2'])
+        for unit in units:
+            unit.received_raw = dict(unit.received)
+        self.patch_target('_cluster_local_bind_addrs')
+        self._cluster_local_bind_addrs.return_value = [
+            ('eth0', {'address': '192.0.2.10', 'cidr': '192.0.2.0/24'})]
+        self.patch_hook('update-status')
+        self.assertIsNone(self.target.state_cache_hit)
+        expect = ovsdb.EndpointState(
+            '192.0.2.10', ['192.0.2.1', '192.0.2.2'],
+            ['ssl:192.0.2.1:6641', 'ssl:192.0.2.2:6641'],
+            ['ssl:192.0.2.1:6642', 'ssl:192.0.2.2:6642'])
+        self.assertEquals(self.target.endpoint_state(), expect)
+        self.assertFalse(self.target.state_cache_hit)
+        self._cluster_local_bind_addrs.reset_mock()
+        self.target.invalidate_relation_snapshot()
+        self.assertEquals(self.target.endpoint_state(), expect)
+        self.assertTrue(self.target.state_cache_hit)
+        self.assertFalse(self._cluster_local_bind_addrs.called)
+        # data of the remote unit is looked at in relation hooks of the
+        # endpoint, without loading the data of the other units
+        self.patch_hook('some-relation-relation-changed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.patch_target('prefetch_received')
+        units[0].received_raw = mock.MagicMock()
+        self.assertEquals(self.target.endpoint_state(), expect)
+        self.assertTrue(self.target.state_cache_hit)
+        self.assertFalse(self.prefetch_received.called)
+        self.assertFalse(units[0].received_raw.keys.called)
+        self.assertFalse(self._cluster_local_bind_addrs.called)
+        units[0].received_raw = dict(units[0].received)
+        units[1].received = units[1].received_raw = {
+            'bound-address': '192.0.2.3'}
+        self.target.invalidate_relation_snapshot()
+        self.assertEquals(self.target.endpoint_state().remote_addrs,
+                          ['192.0.2.1', '192.0.2.3'])
+        self.assertFalse(self.target.state_cache_hit)
+        # a departing unit is left out straight away
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.invalidate_relation_snapshot()
+        self.assertEquals(self.target.endpoint_state().remote_addrs,
+                          ['192.0.2.1'])
+        self.assertFalse(self.target.state_cache_hit)
+        # network bindings are looked at in hooks that may have changed them
+        self.patch_hook('config-changed')
+        self._cluster_local_bind_addrs.reset_mock()
+        self.target.endpoint_state()
+        self.assertTrue(self._cluster_local_bind_addrs.called)
+        self.assertTrue(self.prefetch_received.called)
+        # joined units and settings are looked at in any hook
+        self.patch_hook('update-status')
+        self.target.set_connection_order(self.target.ORDER_RENDEZVOUS)
+        self.target.endpoint_state()
+        self.assertFalse(self.target.state_cache_hit)
+        # state for other settings is kept, e.g. for the interface handlers
+        # using the defaults alongside a consumer that changed them
+        self._cluster_local_bind_addrs.reset_mock()
+        self.target.set_connection_order(self.target.ORDER_RELATION)
+        self.target.endpoint_state()
+        self.assertTrue(self.target.state_cache_hit)
+        self.target.set_connection_order(self.target.ORDER_RENDEZVOUS)
+        self.target.endpoint_state()
+        self.assertTrue(self.target.state_cache_hit)
+        self.assertFalse(self._cluster_local_bind_addrs.called)
+        for n in range(ovsdb.STATE_CACHE_ENTRIES):
+            self.target.set_connection_order(self.target.ORDER_RELATION,
+                                             subset=n + 1)
+            self.target.endpoint_state()
+        self.target.set_connection_order(self.target.ORDER_RELATION)
+        self.target.endpoint_state()
+        self.assertFalse(self.target.state_cache_hit)
+
+    def test_raft_leaders(self):
+        self.patch_units([
+            {'bound-address': '10.0.1.1',
+             'raft-status': {'nb': {'role': 'follower', 'term': 3},
+                             'sb': {'role': 'leader', 'term': 2}}},
+            {'bound-address': '10.0.1.2',
+             'raft-status': {'nb': {'role': 'leader', 'term': 3},
+                             'sb': {'role': 'leader', 'term': 1}}},
+            {'bound-address': '10.0.1.3', 'raft-status': 'bogus'},
+        ])
+        snapshot = self.target.relation_snapshot
+        self.assertEquals(snapshot.units[0].raft['sb'],
+                          raft.RaftStatus('leader', 2))
+        self.assertIsNone(snapshot.units[2].raft)
+        leaders = self.target.raft_leaders
+        self.assertEquals(leaders['nb'].unit_name, 'some-unit/1')
+        self.assertEquals(leaders['sb'].unit_name, 'some-unit/0')
+        self.target.set_connection_order(self.target.ORDER_LEADER)
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:10.0.1.2:6641', 'ssl:10.0.1.1:6641',
+                           'ssl:10.0.1.3:6641'])
+        self.assertEquals(list(self.target.db_sb_connection_strs),
+                          ['ssl:10.0.1.1:6642', 'ssl:10.0.1.2:6642',
+                           'ssl:10.0.1.3:6642'])
+        self.patch_object(ovsdb.reactive.helpers, 'data_changed',
+                          return_value=True)
+        self.patch_object(ovsdb.reactive, 'set_flag')
+        self.target.update_leader_changed()
+        self.data_changed.assert_called_once_with(
+            'some-relation.raft-leaders',
+            {'nb': ('some-unit/1', 3), 'sb': ('some-unit/0', 2)})
+        self.set_flag.assert_called_once_with('some-relation.leader-changed')
+
+    def test_raft_status_changed(self):
+        self.patch_target('update_leader_changed')
+        self.patch_object(ovsdb.reactive, 'clear_flag')
+        self.target.raft_status_changed()
+        self.update_leader_changed.assert_called_once_with()
+        self.clear_flag.assert_called_once_with(
+            'endpoint.some-relation.changed.raft-status')
+
+    def test_raft_leaders_address_family(self):
+        # the leader is put first when units are connected to on an address
+        # of the preferred family
+        self.patch_units([
+            {'addresses': {'v': 1,
+                           'a': [['eth0', '10.0.1.1', ''],
+                                 ['eth0', '2001:db8::1', '']]},
+             'raft-status': {'nb': {'role': 'follower', 'term': 3}}},
+            {'addresses': {'v': 1,
+                           'a': [['eth0', '10.0.1.2', ''],
+                                 ['eth0', '2001:db8::2', '']]},
+             'raft-status': {'nb': {'role': 'leader', 'term': 3}}},
+        ])
+        self.target.set_address_family(6)
+        self.target.set_connection_order(self.target.ORDER_LEADER)
+        self.assertEquals(list(self.target.db_nb_connection_strs),
+                          ['ssl:[2001:db8::2]:6641', 'ssl:[2001:db8::1]:6641'])
+
+    def test_publish_raft_status(self):
+        self.patch_target('publish_relation_data')
+        self.target.publish_raft_status(probe=raft.StaticRaftProbe({
+            'nb': raft.RaftStatus('leader', 4)}))
+        self.publish_relation_data.assert_called_once_with(
+            {'raft-status': {'nb': {'role': 'leader', 'term': 4}}})
+
+    def test_peer_availability(self):
+        availability = ovsdb.PeerAvailability(5, 4, 3)
+        self.assertEquals(availability.majority, 3)
+        self.assertTrue(availability.quorum)
+        self.assertFalse(availability.full)
+        self.assertFalse(availability.available())
+        self.assertTrue(availability.available(ovsdb.AVAILABILITY_MAJORITY))
+        self.assertTrue(availability.available(ovsdb.AVAILABILITY_MINIMUM,
+                                               minimum=3))
+        self.assertFalse(availability.available(ovsdb.AVAILABILITY_MINIMUM,
+                                                minimum=4))
+        self.assertFalse(ovsdb.PeerAvailability(4, 4, 2).quorum)
+        self.assertTrue(ovsdb.PeerAvailability(3, 3, 3).available())
+        self.assertFalse(ovsdb.PeerAvailability(3, 4, 4).full)
+
+    def test_expected_units_available(self):
+        self.patch_kv()
+        self.patch_object(ovsdb.ch_core.hookenv, 'expected_related_units')
+        self.expected_related_units.return_value = ['some-unit/0',
+                                                    'some-unit/1']
+        units = self.patch_units(['192.0.2.1', ''])
+        self.target._all_joined_units = units
+        self.assertFalse(self.target.expected_units_available())
+        self.expected_related_units.return_value = ['some-unit/0']
+        self.assertFalse(self.target.expected_units_available())
+
+    def test_update_published_units(self):
+        store = self.patch_kv()
+        self.patch_object(ovsdb.ch_core.hookenv, 'expected_related_units')
+        self.expected_related_units.return_value = ['some-unit/0',
+                                                    'some-unit/1']
+        units = self.patch_units(['192.0.2.1', ''])
+        self.target._all_joined_units = units
+        relation = mock.MagicMock()
+        relation.units = {unit.unit_name: unit for unit in units}
+        self.target._relations.__getitem__.return_value = relation
+        self.patch_hook('some-relation-relation-changed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        # first call does a full rescan
+        self.target.update_published_units()
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-units'],
+            {'units': ['some-unit/0'],
+             'joined': ['some-unit/0', 'some-unit/1']})
+        self.assertFalse(self.target.expected_units_available())
+        # further calls only look at the remote unit
+        units[0].received = {}
+        units[1].received = {'bound-address': '192.0.2.2'}
+        self.target.update_published_units()
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-units'],
+            {'units': ['some-unit/0', 'some-unit/1'],
+             'joined': ['some-unit/0', 'some-unit/1']})
+        self.assertTrue(self.target.expected_units_available())
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/0')
+        self.target.update_published_units()
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-units'],
+            {'units': ['some-unit/1'], 'joined': ['some-unit/1']})
+        # tracked units of a different set of joined units results in rescan
+        self.patch_hook('update-status')
+        self.target.invalidate_relation_snapshot()
+        self.assertFalse(self.target.expected_units_available())
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-units'],
+            {'units': ['some-unit/1'],
+             'joined': ['some-unit/0', 'some-unit/1']})
+
+    def test_published_units_count_undercount(self):
+        store = self.patch_kv()
+        units = self.patch_units(['192.0.2.1', '192.0.2.2'])
+        # a unit joined and published in a hook tracking did not run in
+        store['charm-interface-ovsdb.some-relation.published-units'] = {
+            'units': ['some-unit/0'], 'joined': ['some-unit/0']}
+        joined_units = set(unit.unit_name for unit in units)
+        self.assertEquals(self.target.published_units_count(joined_units), 2)
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-units'],
+            {'units': ['some-unit/0', 'some-unit/1'],
+             'joined': ['some-unit/0', 'some-unit/1']})
+        units[1].received = mock.MagicMock()
+        self.assertEquals(self.target.published_units_count(joined_units), 2)
+        self.assertFalse(units[1].received.get.called)
+
+    def test_bound_address_changed(self):
+        store = self.patch_kv()
+        self.patch_object(ovsdb.reactive, 'clear_flag')
+        units = self.patch_units(['192.0.2.1', ''])
+        relation = mock.MagicMock()
+        relation.units = {unit.unit_name: unit for unit in units}
+        self.target._relations.__getitem__.return_value = relation
+        self.patch_hook('update-status')
+        self.assertEquals(self.target.bound_address_changed(),
+                          ['some-unit/0'])
+        self.clear_flag.assert_called_once_with(
+            'endpoint.some-relation.changed.bound-address')
+        units[1].received = {'bound-address': '192.0.2.2'}
+        units[0].received = mock.MagicMock()
+        self.patch_hook('some-relation-relation-changed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.assertEquals(self.target.bound_address_changed(),
+                          ['some-unit/1'])
+        self.assertFalse(units[0].received.get.called)
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-units'],
+            {'units': ['some-unit/0', 'some-unit/1'],
+             'joined': ['some-unit/0', 'some-unit/1']})
+
+    def test_update_published_units_other_endpoint(self):
+        store = self.patch_kv()
+        self.patch_hook('other-relation-relation-changed',
+                        relation_id='other-relation:1',
+                        remote_unit='other-unit/0')
+        self.target.update_published_units()
+        self.assertEquals(store, {})
+
+    def test_publish_relation_data(self):
+        store = self.patch_kv()
+        relations = []
+        for n in range(2):
+            relation = mock.MagicMock()
+            relation.relation_id = 'some-relation:{}'.format(n)
+            relation.to_publish = {}
+            relations.append(relation)
+        self.patch_target('_relations')
+        self._relations.__iter__.return_value = relations
+        self.assertEquals(
+            self.target.publish_relation_data({'some-key': 'some-value'}), 0)
+        self.assertEquals(relations[0].to_publish,
+                          {'some-key': 'some-value'})
+        self.assertEquals(relations[1].to_publish,
+                          {'some-key': 'some-value'})
+        relations[1].to_publish = {}
+        self.assertEquals(
+            self.target.publish_relation_data({'some-key': 'some-value'}), 2)
+        self.assertEquals(relations[1].to_publish, {})
+        self.assertEquals(
+            self.target.publish_relation_data({'some-key': 'other-value'},
+                                              relation_id='some-relation:1'),
+            0)
+        self.assertEquals(relations[0].to_publish,
+                          {'some-key': 'some-value'})
+        self.assertEquals(relations[1].to_publish,
+                          {'some-key': 'other-value'})
+        self._relations.__iter__.return_value = relations[1:]
+        self.target.publish_relation_data({})
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.published-data'],
+            {'some-relation:1': {'some-key': '"other-value"'}})
+
+    def test_local_addr_published(self):
+        self.patch_kv()
+        self.patch_units([])
+        self.assertFalse(self.target.local_addr_published())
+        self.target.publish_relation_data({'bound-address': None})
+        self.assertFalse(self.target.local_addr_published())
+        self.target.publish_relation_data({'bound-address': '192.0.2.1'})
+        self.assertTrue(self.target.local_addr_published())
+        self._relations.__iter__.return_value = []
+        self.assertFalse(self.target.local_addr_published())
+
     def test_publish_cluster_local_addr(self):
-        to_publish = self.patch_topublish()
-        self.target.publish_cluster_local_addr()
-        to_publish.__setitem__.assert_called_once_with('bound-address', None)
+        self.patch_target('publish_relation_data')
+        self.target.publish_cluster_local_addr(addr='192.0.2.1')
+        self.publish_relation_data.assert_called_once_with({
+            'bound-address': '192.0.2.1',
+            'addresses': {'v': 1, 'a': [['', '192.0.2.1', '']],
+                          'p': {'nb': 6641, 'sb': 6642}},
+        }, relation_id=None)
+        self.publish_relation_data.reset_mock()
+        self.patch_target('_cluster_local_bind_addrs')
+        self._cluster_local_bind_addrs.return_value = [
+            ('eth0', {'address': '192.0.2.1', 'cidr': '192.0.2.0/24'}),
+            ('eth0', {'address': '2001:db8::1', 'cidr': '2001:db8::/64'}),
+        ]
+        self.target.publish_cluster_local_addr(relation_id='some-relation:1')
+        self.publish_relation_data.assert_called_once_with({
+            'bound-address': '192.0.2.1',
+            'addresses': {'v': 1,
+                          'a': [['eth0', '192.0.2.1', '192.0.2.0/24'],
+                                ['eth0', '2001:db8::1', '2001:db8::/64']],
+                          'p': {'nb': 6641, 'sb': 6642}},
+        }, relation_id='some-relation:1')
 
     def test_joined(self):
         self.patch_object(ovsdb.reactive, 'set_flag')
         self.target.joined()
         self.set_flag.assert_called_once_with('some-relation.connected')
 
+    def test_relation_snapshot_departing(self):
+        self.patch_units(['192.0.2.1', '192.0.2.2'])
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/0')
+        self.assertEquals(list(self.target.cluster_remote_addrs),
+                          ['192.0.2.2'])
+        self.patch_hook('other-relation-relation-departed',
+                        relation_id='other-relation:1',
+                        remote_unit='some-unit/0')
+        self.target.invalidate_relation_snapshot()
+        self.assertEquals(list(self.target.cluster_remote_addrs),
+                          ['192.0.2.1', '192.0.2.2'])
+
+    def test_departed(self):
+        self.patch_object(ovsdb.reactive, 'clear_flag')
+        self.patch_target('update_published_units')
+        self.patch_target('_all_departed_units')
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target._relation_snapshot = mock.sentinel.snapshot
+        self.assertEquals(self.target.departed(), ['some-unit/1'])
+        self.update_published_units.assert_called_once_with()
+        self.assertIsNone(self.target._relation_snapshot)
+        # the flag and departed units are left to the consumer
+        self.assertFalse(self._all_departed_units.clear.called)
+        self.assertFalse(self.clear_flag.called)
+        # in later hooks the handler runs in nothing departs
+        self.update_published_units.reset_mock()
+        self.target._relation_snapshot = mock.sentinel.snapshot
+        self.patch_hook('update-status')
+        self.assertEquals(self.target.departed(), [])
+        self.assertFalse(self.update_published_units.called)
+        self.assertEquals(self.target._relation_snapshot,
+                          mock.sentinel.snapshot)
+        self.patch_hook('other-relation-relation-departed',
+                        relation_id='other-relation:1',
+                        remote_unit='other-unit/0')
+        self.assertEquals(self.target.departed(), [])
+
+    def test_update_query_state(self):
+        self.patch_target('endpoint_state')
+        self.endpoint_state.return_value = ovsdb.EndpointState(
+            '192.0.2.10', ['192.0.2.1'], ['ssl:192.0.2.1:6641'],
+            ['ssl:192.0.2.1:6642'])
+        self.patch_object(ovsdb.reactive, 'is_flag_set', return_value=True)
+        self.patch_object(query, 'update', return_value=True)
+        self.assertTrue(self.target.update_query_state(path='/some/path'))
+        self.is_flag_set.assert_called_once_with('some-relation.available')
+        self.update.assert_called_once_with('some-relation', {
+            'cluster_local_addr': '192.0.2.10',
+            'remote_addrs': ['192.0.2.1'],
+            'nb_connection_strs': ['ssl:192.0.2.1:6641'],
+            'sb_connection_strs': ['ssl:192.0.2.1:6642'],
+            'availability': {'available': True},
+        }, path='/some/path')
+
     def test_broken(self):
         self.patch_object(ovsdb.reactive, 'clear_flag')
+        self.patch_target('reset_published_units')
+        self.patch_object(query, 'remove')
         self.target.broken()
+        self.reset_published_units.assert_called_once_with()
+        self.remove.assert_called_once_with('some-relation')
         self.clear_flag.assert_has_calls([
             mock.call('some-relation.available'),
             mock.call('some-relation.connected'),
@@ -0,0 +1,80 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import time
+import unittest
+
+from lib import probe
+
+
+def listening_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(16)
+    return sock
+
+
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.sock = listening_socket()
+        self.addCleanup(self.sock.close)
+        self.port = self.sock.getsockname()[1]
+
+    def test_interleave_families(self):
+        self.assertEquals(
+            probe.interleave_families([('2001:db8::1', 1), ('2001:db8::2', 1),
+                                       ('192.0.2.1', 1), ('2001:db8::3', 1)]),
+            [('2001:db8::1', 1), ('192.0.2.1', 1), ('2001:db8::2', 1),
+             ('2001:db8::3', 1)])
+
+    def test_probe(self):
+        prober = probe.Prober(timeout=1)
+        results = prober.probe([
+            [('127.0.0.1', self.port)],
+            [('127.0.0.1', closed_port())],
+        ])
+        self.assertEquals(results[0].address, '127.0.0.1')
+        self.assertEquals(results[0].port, self.port)
+        self.assertGreaterEqual(results[0].rtt, 0)
+        self.assertIsNone(results[1])
+        self.assertEquals(prober.probe([]), [])
+
+    def test_probe_race(self):
+        prober = probe.Prober(timeout=1, stagger=0.05)
+        result, = prober.probe([[('127.0.0.1', closed_port()),
+                                 ('127.0.0.1', self.port)]])
+        self.assertEquals(result.port, self.port)
+
+    def test_probe_race_failed(self):
+        # a refused attempt starts the next one without waiting for the
+        # stagger timer, which would take a minute
+        prober = probe.Prober(timeout=1, stagger=60)
+        start = time.monotonic()
+        result, = prober.probe([[('127.0.0.1', closed_port()),
+                                 ('127.0.0.1', self.port)]])
+        self.assertEquals(result.port, self.port)
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEquals(prober.probe([[('127.0.0.1', closed_port()),
+                                         ('127.0.0.1', closed_port())]]),
+                          [None])
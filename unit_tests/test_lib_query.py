@@ -0,0 +1,114 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import mock
+
+from lib import query
+
+STATE = {
+    'cluster_local_addr': '192.0.2.10',
+    'remote_addrs': ['192.0.2.1', '192.0.2.2'],
+    'nb_connection_strs': ['ssl:192.0.2.1:6641', 'ssl:192.0.2.2:6641'],
+    'sb_connection_strs': ['ssl:192.0.2.1:6642', 'ssl:192.0.2.2:6642'],
+    'availability': {'available': True},
+}
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, query.STATE_FILE)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_default_path(self):
+        env = {'JUJU_CHARM_DIR': '/var/lib/juju/agents/unit-a-0/charm'}
+        with mock.patch.dict(os.environ, env):
+            self.assertEquals(
+                query.default_path(),
+                '/var/lib/juju/agents/unit-a-0/charm/{}'
+                .format(query.STATE_FILE))
+
+    def test_update_remove(self):
+        self.assertEquals(query.load(self.path), {})
+        self.assertTrue(query.update('ovsdb', STATE, path=self.path))
+        self.assertFalse(query.update('ovsdb', STATE, path=self.path))
+        self.assertTrue(query.update('ovsdb-cms', STATE, path=self.path))
+        self.assertEquals(query.load(self.path),
+                          {'ovsdb': STATE, 'ovsdb-cms': STATE})
+        self.assertTrue(query.remove('ovsdb', path=self.path))
+        self.assertFalse(query.remove('ovsdb', path=self.path))
+        self.assertEquals(query.load(self.path), {'ovsdb-cms': STATE})
+        self.assertEquals(os.listdir(self.tmpdir.name), [query.STATE_FILE])
+
+    def test_load_unknown_version(self):
+        with open(self.path, 'w') as f:
+            json.dump({'v': query.STATE_VERSION + 1,
+                       'endpoints': {'ovsdb': STATE}}, f)
+        self.assertEquals(query.load(self.path), {})
+
+    def test_main(self):
+        query.update('ovsdb', STATE, path=self.path)
+        out = io.StringIO()
+        self.assertEquals(query.main(
+            ['connection-strs', '--db', 'nb', '--state', self.path], out), 0)
+        self.assertEquals(out.getvalue(),
+                          'ssl:192.0.2.1:6641\nssl:192.0.2.2:6641\n')
+        out = io.StringIO()
+        query.main(['availability', '--state', self.path], out)
+        self.assertEquals(out.getvalue(), 'available: true\n')
+        query.update('ovsdb-cms', STATE, path=self.path)
+        out = io.StringIO()
+        query.main(['addresses', '--state', self.path, '--format', 'json'],
+                   out)
+        self.assertEquals(json.loads(out.getvalue()), {
+            'ovsdb': STATE['remote_addrs'],
+            'ovsdb-cms': STATE['remote_addrs'],
+        })
+        out = io.StringIO()
+        query.main(['addresses', '--state', self.path], out)
+        self.assertEquals(out.getvalue(),
+                          'ovsdb:\n  192.0.2.1\n  192.0.2.2\n'
+                          'ovsdb-cms:\n  192.0.2.1\n  192.0.2.2\n')
+        with mock.patch.object(sys, 'stderr'):
+            self.assertEquals(query.main(
+                ['--state', self.path, '--endpoint', 'missing'], out), 1)
+
+    def test_script_does_not_import_reactive(self):
+        query.update('ovsdb', STATE, path=self.path)
+        output = subprocess.check_output(
+            [sys.executable, '-c',
+             'import runpy, sys; sys.argv = ["query", "--state", {!r}]; '
+             'runpy.run_path({!r}, run_name="__main__")'
+             .format(self.path, query.__file__)],
+            universal_newlines=True)
+        self.assertIn('remote_addrs', output)
+        output = subprocess.check_output(
+            [sys.executable, '-c',
+             'import sys; sys.path.insert(0, {!r}); import query; '
+             'print(sorted(m for m in sys.modules '
+             'if m.split(".")[0] in ("charms", "charmhelpers")))'
+             .format(os.path.dirname(query.__file__))],
+            universal_newlines=True)
+        self.assertEquals(output.strip(), '[]')
@@ -0,0 +1,64 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+
+import mock
+
+from lib import raft
+
+import charms_openstack.test_utils as test_utils
+
+CLUSTER_STATUS = '''\
+e0a4
+Name: OVN_Southbound
+Cluster ID: 4a9d (4a9d5ae1-2e3b-4b06-9ad9-e1a4a0e33c66)
+Server ID: e0a4 (e0a4d2a4-d1e1-4c68-8c1e-4c1b9a5f2f71)
+Address: ssl:10.0.1.1:6644
+Status: cluster member
+Role: leader
+Term: 7
+Leader: self
+Vote: self
+'''
+
+
+class TestRaft(test_utils.PatchHelper):
+
+    def test_parse_cluster_status(self):
+        status = raft.parse_cluster_status(CLUSTER_STATUS)
+        self.assertEquals(status, raft.RaftStatus('leader', 7))
+        self.assertTrue(status.is_leader)
+        self.assertIsNone(raft.parse_cluster_status('Role: follower\n'))
+        self.assertIsNone(raft.parse_cluster_status('Term: bogus\n'))
+
+    def test_raft_probe(self):
+        with self.assertRaises(TypeError):
+            raft.RaftProbe()
+        self.assertIsInstance(raft.StaticRaftProbe({}), raft.RaftProbe)
+
+    def test_appctl_raft_probe(self):
+        self.patch_object(subprocess, 'check_output',
+                          return_value=CLUSTER_STATUS)
+        probe = raft.AppctlRaftProbe()
+        self.assertEquals(probe.status('sb'), raft.RaftStatus('leader', 7))
+        self.check_output.assert_called_once_with(
+            ['ovs-appctl', '-t', '/var/run/ovn/ovnsb_db.ctl',
+             'cluster/status', 'OVN_Southbound'],
+            stderr=mock.ANY, universal_newlines=True)
+        self.check_output.side_effect = subprocess.CalledProcessError(
+            1, 'ovs-appctl')
+        self.assertIsNone(probe.status('nb'))
+        self.check_output.side_effect = OSError
+        self.assertIsNone(probe.status('nb'))
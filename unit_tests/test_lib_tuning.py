@@ -0,0 +1,57 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from lib import tuning
+
+
+class TestTuning(unittest.TestCase):
+
+    def test_make_hints(self):
+        hints = tuning.make_hints(remote_probe_interval=30000, jitter=1)
+        self.assertEquals(hints, tuning.TuningHints(
+            remote_probe_interval=30000, inactivity_probe=5000,
+            max_backoff=8000, jitter=1.0, monitor_cond_since=True))
+        self.assertIsInstance(hints.jitter, float)
+        self.assertEquals(tuning.make_hints(inactivity_probe=0)
+                          .inactivity_probe, 0)
+        for kwargs in ({'bogus': 1},
+                       {'remote_probe_interval': 500},
+                       {'max_backoff': '8000'},
+                       {'max_backoff': True},
+                       {'jitter': 1.5},
+                       {'monitor_cond_since': 1}):
+            with self.assertRaises(ValueError):
+                tuning.make_hints(**kwargs)
+
+    def test_payload(self):
+        hints = tuning.make_hints(max_backoff=30000, jitter=0.5)
+        payload = tuning.to_payload(hints)
+        self.assertEquals(payload, {'v': 1, 'hints': {
+            'remote-probe-interval': 5000,
+            'inactivity-probe': 5000,
+            'max-backoff': 30000,
+            'jitter': 0.5,
+            'monitor-cond-since': True,
+        }})
+        self.assertEquals(tuning.from_payload(payload), hints)
+        self.assertEquals(
+            tuning.from_payload({'v': 1, 'hints': {'max-backoff': 30000,
+                                                   'future-hint': 1}}),
+            tuning.make_hints(max_backoff=30000))
+        self.assertIsNone(tuning.from_payload(None))
+        self.assertIsNone(tuning.from_payload({'v': 2, 'hints': {}}))
+        self.assertIsNone(
+            tuning.from_payload({'v': 1, 'hints': {'jitter': 'bogus'}}))
@@ -12,73 +12,295 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# import mock
-
-# from x import peers
-
-# import charms_openstack.test_utils as test_utils
-
-
-# _hook_args = {}
-
-
-# class TestOVSDBPeers(test_utils.PatchHelper):
-
-#     def setUp(self):
-#         super().setUp()
-#         self.target = ovsdb.OVSDB('some-relation', [])
-#         self._patches = {}
-#         self._patches_start = {}
-
-#     def tearDown(self):
-#         self.target = None
-#         for k, v in self._patches.items():
-#             v.stop()
-#             setattr(self, k, None)
-#         self._patches = None
-#         self._patches_start = None
-
-#     def patch_target(self, attr, return_value=None):
-#         mocked = mock.patch.object(self.target, attr)
-#         self._patches[attr] = mocked
-#         started = mocked.start()
-#         started.return_value = return_value
-#         self._patches_start[attr] = started
-#         setattr(self, attr, started)
-
-#     def test_expected_peers_available(self):
-#         # self.patch_target('_all_joined_units')
-#         self.patch_object(ovsdb.ch_core.hookenv, 'expected_peer_units')
-#         self.patch_target('_relations')
-#         self.target._all_joined_units = ['aFakeUnit']
-#         self.expected_peer_units.return_value = ['aFakeUnit']
-#         relation = mock.MagicMock()
-#         unit = mock.MagicMock()
-#         relation.units.__iter__.return_value = [unit]
-#         self._relations.__iter__.return_value = [relation]
-#         unit.received.get.return_value = '127.0.0.1'
-#         self.assertTrue(self.target.expected_peers_available())
-#         unit.received.get.assert_called_once_with('bound-address')
-#         unit.received.get.return_value = ''
-#         self.assertFalse(self.target.expected_peers_available())
-#         self.expected_peer_units.return_value = ['firstFakeUnit',
-#                                                  'secondFakeUnit']
-#         unit.received.get.return_value = '127.0.0.1'
-#         self.assertFalse(self.target.expected_peers_available())
-
-#     def test_joined(self):
-#         self.patch_object(ovsdb.reactive, 'set_flag')
-#         self.patch_target('publish_cluster_local_addr')
-#         self.patch_target('expected_peers_available')
-#         self.expected_peers_available.__bool__.return_value = False
-#         self.target.joined()
-#         self.expected_peers_available.__bool__.assert_called_once_with()
-#         self.set_flag.assert_called_once_with('some-relation.connected')
-#         self.publish_cluster_local_addr.assert_called_once_with()
-#         self.set_flag.reset_mock()
-#         self.expected_peers_available.__bool__.return_value = True
-#         self.target.joined()
-#         self.set_flag.assert_has_calls([
-#             mock.call('some-relation.connected'),
-#             mock.call('some-relation.available'),
-#         ])
+import mock
+
+from ovsdb_cluster import peers
+
+import charms_openstack.test_utils as test_utils
+
+
+class TestOVSDBClusterPeer(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.target = peers.OVSDBClusterPeer('some-relation', [])
+        self._patches = {}
+        self._patches_start = {}
+        self.patch_object(peers.ovsdb.ch_core.hookenv, 'cache', new={})
+
+    def tearDown(self):
+        self.target = None
+        for k, v in self._patches.items():
+            v.stop()
+            setattr(self, k, None)
+        self._patches = None
+        self._patches_start = None
+
+    def patch_target(self, attr, return_value=None):
+        mocked = mock.patch.object(self.target, attr)
+        self._patches[attr] = mocked
+        started = mocked.start()
+        started.return_value = return_value
+        self._patches_start[attr] = started
+        setattr(self, attr, started)
+
+    def patch_kv(self):
+        store = {}
+        kv = mock.MagicMock()
+        kv.get.side_effect = lambda key, default=None: store.get(key, default)
+        kv.set.side_effect = store.__setitem__
+        self.patch_object(peers.ch_core.unitdata, 'kv', return_value=kv)
+        return store
+
+    def patch_units(self, received):
+        relation = mock.MagicMock()
+        relation.relation_id = 'some-relation:42'
+        units = []
+        for n, data in enumerate(received):
+            unit = mock.MagicMock()
+            unit.unit_name = 'some-unit/{}'.format(n)
+            unit.received = data
+            units.append(unit)
+        relation.units = units
+        self.patch_target('_relations')
+        self._relations.__iter__.return_value = [relation]
+        return units
+
+    def patch_peers(self, expected, joined, published, local_published):
+        # patch once per test, patching an attribute twice would leak the
+        # first patch into other tests
+        if not getattr(self, '_peers_patched', False):
+            self.patch_object(peers.ch_core.hookenv, 'expected_peer_units')
+            self.patch_target('published_units_count')
+            self.patch_target('local_addr_published')
+            self._peers_patched = True
+        self.expected_peer_units.return_value = [
+            'some-unit/{}'.format(n) for n in range(expected)]
+        units = []
+        for n in range(joined):
+            unit = mock.MagicMock()
+            unit.unit_name = 'some-unit/{}'.format(n)
+            units.append(unit)
+        self.target._all_joined_units = units
+        self.published_units_count.return_value = published
+        self.local_addr_published.return_value = local_published
+
+    def test_set_cluster_binding(self):
+        store = self.patch_kv()
+        self.assertIsNone(self.target.cluster_binding)
+        self.target.set_cluster_binding('cluster')
+        self.assertEquals(self.target.cluster_binding, 'cluster')
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.cluster-binding'],
+            'cluster')
+        self.target.set_cluster_binding()
+        self.assertIsNone(self.target.cluster_binding)
+
+    def test_cluster_local_cluster_addr(self):
+        self.patch_kv()
+        self.patch_object(peers.ovsdb.OVSDB, 'cluster_local_addr',
+                          new_callable=mock.PropertyMock,
+                          return_value='192.0.2.1')
+        self.patch_object(peers.ch_core.hookenv, 'network_get')
+        self.network_get.return_value = {
+            'bind-addresses': [
+                {'addresses': [{'address': '2001:db8::1',
+                                'cidr': '2001:db8::/64'}]},
+            ],
+        }
+        # without a separate binding the client address is used
+        self.assertEquals(self.target.cluster_local_cluster_addr,
+                          '192.0.2.1')
+        self.assertFalse(self.network_get.called)
+        self.target.set_cluster_binding('cluster')
+        self.assertEquals(self.target.cluster_local_cluster_addr,
+                          '[2001:db8::1]')
+        self.network_get.assert_called_once_with('cluster', relation_id=None)
+
+    def test_publish_cluster_local_cluster_addr(self):
+        self.patch_kv()
+        self.patch_target('publish_relation_data', return_value=0)
+        self.target.publish_cluster_local_cluster_addr()
+        self.publish_relation_data.assert_called_once_with(
+            {'cluster-address': None}, relation_id=None)
+        self.publish_relation_data.reset_mock()
+        self.target.set_cluster_binding('cluster')
+        self.patch_object(peers.OVSDBClusterPeer,
+                          'cluster_local_cluster_addr',
+                          new_callable=mock.PropertyMock,
+                          return_value='198.51.100.1')
+        self.target.publish_cluster_local_cluster_addr(
+            relation_id='some-relation:42')
+        self.publish_relation_data.assert_called_once_with(
+            {'cluster-address': '198.51.100.1'},
+            relation_id='some-relation:42')
+
+    def test_db_cluster_connection_strs(self):
+        self.patch_units([
+            {'bound-address': '192.0.2.1', 'cluster-address': '198.51.100.1'},
+            {'bound-address': '192.0.2.2'},
+            {'bound-address': 'bogus'},
+        ])
+        self.assertEquals(self.target.cluster_remote_cluster_addrs,
+                          ['198.51.100.1', '192.0.2.2'])
+        self.assertEquals(list(self.target.db_nb_cluster_connection_strs),
+                          ['ssl:198.51.100.1:6643', 'ssl:192.0.2.2:6643'])
+        self.assertEquals(list(self.target.db_sb_cluster_connection_strs),
+                          ['ssl:198.51.100.1:6644', 'ssl:192.0.2.2:6644'])
+
+    def test_peer_availability(self):
+        self.patch_peers(2, 2, 1, True)
+        self.assertEquals(self.target.peer_availability(),
+                          peers.ovsdb.PeerAvailability(3, 3, 2))
+        self.published_units_count.assert_called_once_with(
+            set(['some-unit/0', 'some-unit/1']))
+        self.assertFalse(self.target.expected_peers_available())
+        self.patch_peers(2, 2, 2, True)
+        self.assertTrue(self.target.expected_peers_available())
+
+    def test_peer_availability_local_unpublished(self):
+        # the local unit does not publish before the leader settings are
+        # ready, and does not count as published until it did
+        self.patch_peers(2, 2, 2, False)
+        self.assertEquals(self.target.peer_availability(),
+                          peers.ovsdb.PeerAvailability(3, 3, 2))
+        self.assertFalse(self.target.expected_peers_available())
+
+    def test_set_availability_policy(self):
+        store = self.patch_kv()
+        self.assertEquals(self.target.availability_policy,
+                          (peers.ovsdb.AVAILABILITY_ALL, None))
+        self.target.set_availability_policy(
+            peers.ovsdb.AVAILABILITY_MINIMUM, minimum=2)
+        self.assertEquals(self.target.availability_policy,
+                          (peers.ovsdb.AVAILABILITY_MINIMUM, 2))
+        self.assertEquals(
+            store['charm-interface-ovsdb.some-relation.availability-policy'],
+            {'policy': peers.ovsdb.AVAILABILITY_MINIMUM, 'minimum': 2})
+        self.target.set_availability_policy(peers.ovsdb.AVAILABILITY_MAJORITY)
+        self.assertEquals(self.target.availability_policy,
+                          (peers.ovsdb.AVAILABILITY_MAJORITY, None))
+        with self.assertRaises(ValueError):
+            self.target.set_availability_policy('bogus')
+        with self.assertRaises(ValueError):
+            self.target.set_availability_policy(
+                peers.ovsdb.AVAILABILITY_MINIMUM)
+        with self.assertRaises(ValueError):
+            self.target.set_availability_policy(
+                peers.ovsdb.AVAILABILITY_MINIMUM, minimum=0)
+        self.assertEquals(self.target.availability_policy,
+                          (peers.ovsdb.AVAILABILITY_MAJORITY, None))
+
+    def test_update_availability(self):
+        self.patch_kv()
+        self.patch_object(peers.reactive, 'toggle_flag')
+        # two of three members published, a majority but not all of them
+        self.patch_peers(2, 2, 1, True)
+        self.target.update_availability()
+        self.toggle_flag.assert_has_calls([
+            mock.call('some-relation.quorum-available', True),
+            mock.call('some-relation.fully-available', False),
+            mock.call('some-relation.available', False),
+        ])
+        self.toggle_flag.reset_mock()
+        self.target.set_availability_policy(peers.ovsdb.AVAILABILITY_MAJORITY)
+        self.target.update_availability()
+        self.toggle_flag.assert_called_with('some-relation.available', True)
+        # only the local unit published, availability is withdrawn
+        self.toggle_flag.reset_mock()
+        self.patch_peers(2, 2, 0, True)
+        self.target.update_availability()
+        self.toggle_flag.assert_has_calls([
+            mock.call('some-relation.quorum-available', False),
+            mock.call('some-relation.fully-available', False),
+            mock.call('some-relation.available', False),
+        ])
+        self.toggle_flag.reset_mock()
+        self.target.set_availability_policy(peers.ovsdb.AVAILABILITY_MINIMUM,
+                                            minimum=1)
+        self.target.update_availability()
+        self.toggle_flag.assert_called_with('some-relation.available', True)
+
+    def test_update_availability_full(self):
+        self.patch_kv()
+        self.patch_object(peers.reactive, 'toggle_flag')
+        self.patch_peers(2, 2, 2, True)
+        self.target.update_availability()
+        self.toggle_flag.assert_has_calls([
+            mock.call('some-relation.quorum-available', True),
+            mock.call('some-relation.fully-available', True),
+            mock.call('some-relation.available', True),
+        ])
+
+    def test_joined(self):
+        self.patch_object(peers.reactive, 'set_flag')
+        self.patch_object(peers.reactive, 'is_flag_set', return_value=False)
+        self.patch_object(peers.ch_core.hookenv, 'hook_name',
+                          return_value='some-relation-relation-joined')
+        self.patch_target('hook_relation_id',
+                          return_value='some-relation:42')
+        self.patch_target('publish_cluster_local_addr')
+        self.patch_target('publish_cluster_local_cluster_addr')
+        self.patch_target('update_published_units')
+        self.patch_target('update_availability')
+        self.patch_target('update_query_state')
+        self.target.joined()
+        self.set_flag.assert_called_once_with('some-relation.connected')
+        self.is_flag_set.assert_called_once_with('leadership.set.ready')
+        self.assertFalse(self.publish_cluster_local_addr.called)
+        self.assertFalse(self.publish_cluster_local_cluster_addr.called)
+        self.update_published_units.assert_called_once_with()
+        self.update_availability.assert_called_once_with()
+        self.update_query_state.assert_called_once_with()
+        self.is_flag_set.return_value = True
+        self.target.joined()
+        self.publish_cluster_local_addr.assert_called_once_with(
+            relation_id='some-relation:42')
+        self.publish_cluster_local_cluster_addr.assert_called_once_with(
+            relation_id='some-relation:42')
+        self.publish_cluster_local_addr.reset_mock()
+        self.hook_name.return_value = 'update-status'
+        self.target.joined()
+        self.publish_cluster_local_addr.assert_called_once_with(
+            relation_id=None)
+
+    def test_bound_address_changed(self):
+        self.patch_object(peers.ovsdb.OVSDB, 'bound_address_changed')
+        self.patch_object(peers.reactive, 'set_flag')
+        self.patch_target('update_availability')
+        self.patch_target('update_query_state')
+        self.target.bound_address_changed()
+        self.bound_address_changed.assert_called_once_with()
+        self.update_availability.assert_called_once_with()
+        self.update_query_state.assert_called_once_with()
+        self.set_flag.assert_called_once_with(
+            'some-relation.servers-changed')
+
+    def test_departed(self):
+        self.patch_object(peers.ovsdb.OVSDB, 'departed',
+                          return_value=['some-unit/1'])
+        self.patch_object(peers.reactive, 'set_flag')
+        self.patch_target('update_availability')
+        self.patch_target('update_query_state')
+        self.target.departed()
+        self.departed.assert_called_once_with()
+        self.update_availability.assert_called_once_with()
+        self.update_query_state.assert_called_once_with()
+        self.set_flag.assert_called_once_with(
+            'some-relation.servers-changed')
+        # the handler keeps running until the consumer clears the flag,
+        # servers only changed in the hook the unit departed in
+        self.set_flag.reset_mock()
+        self.departed.return_value = []
+        self.target.departed()
+        self.assertFalse(self.set_flag.called)
+
+    def test_broken(self):
+        self.patch_object(peers.ovsdb.OVSDB, 'broken')
+        self.patch_object(peers.reactive, 'clear_flag')
+        self.target.broken()
+        self.broken.assert_called_once_with()
+        self.clear_flag.assert_has_calls([
+            mock.call('some-relation.quorum-available'),
+            mock.call('some-relation.fully-available'),
+        ])
@@ -0,0 +1,208 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from ovsdb_cms import requires
+
+import charms_openstack.test_utils as test_utils
+
+
+class TestOVSDBCMSRequires(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.target = requires.OVSDBCMSRequires('some-relation', [])
+        self._patches = {}
+        self._patches_start = {}
+        self.patch_object(requires.ovsdb.ch_core.hookenv, 'cache', new={})
+
+    def tearDown(self):
+        self.target = None
+        for k, v in self._patches.items():
+            v.stop()
+            setattr(self, k, None)
+        self._patches = None
+        self._patches_start = None
+
+    def patch_target(self, attr, return_value=None):
+        mocked = mock.patch.object(self.target, attr)
+        self._patches[attr] = mocked
+        started = mocked.start()
+        started.return_value = return_value
+        self._patches_start[attr] = started
+        setattr(self, attr, started)
+
+    def patch_units(self, received):
+        relation = mock.MagicMock()
+        relation.relation_id = 'some-relation:42'
+        units = []
+        for n, data in enumerate(received):
+            unit = mock.MagicMock()
+            unit.unit_name = 'some-unit/{}'.format(n)
+            unit.received = data
+            units.append(unit)
+        relation.units = units
+        self.patch_target('_relations')
+        self._relations.__iter__.return_value = [relation]
+        return units
+
+    def patch_kv(self):
+        store = {}
+        kv = mock.MagicMock()
+        kv.get.side_effect = lambda key, default=None: store.get(key, default)
+        kv.set.side_effect = store.__setitem__
+        self.patch_object(requires.ch_core.unitdata, 'kv', return_value=kv)
+        return store
+
+    def patch_hook(self, hook_name, relation_id=None, remote_unit=None):
+        # patch once per test, patching an attribute twice would leak the
+        # first patch into other tests
+        if not getattr(self, '_hook_patched', False):
+            self.patch_object(requires.ch_core.hookenv, 'hook_name')
+            self.patch_object(requires.ch_core.hookenv, 'relation_id')
+            self.patch_object(requires.ch_core.hookenv, 'remote_unit')
+            self._hook_patched = True
+        self.hook_name.return_value = hook_name
+        self.relation_id.return_value = relation_id
+        self.remote_unit.return_value = remote_unit
+
+    def patch_published(self, received):
+        """Two expected units, tracked as published in an earlier hook."""
+        self.patch_kv()
+        self.patch_object(requires.ch_core.hookenv, 'expected_related_units',
+                          return_value=['some-unit/0', 'some-unit/1'])
+        self.patch_object(requires.reactive, 'set_flag')
+        self.patch_object(requires.reactive, 'clear_flag')
+        self.patch_object(requires.reactive, 'toggle_flag')
+        self.patch_target('update_query_state')
+        units = self.patch_units(received)
+        self.target._all_joined_units = units
+        relation = mock.MagicMock()
+        relation.units = {unit.unit_name: unit for unit in units}
+        self._relations.__getitem__.return_value = relation
+        self.target._save_published_units(
+            set(['some-unit/0', 'some-unit/1']),
+            set(['some-unit/0', 'some-unit/1']))
+        return units
+
+    def test_joined(self):
+        self.patch_published([{'bound-address': '192.0.2.1'},
+                              {'bound-address': '192.0.2.2'}])
+        self.patch_hook('update-status')
+        self.target.joined()
+        self.set_flag.assert_called_once_with('some-relation.connected')
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 True)
+        self.update_query_state.assert_called_once_with()
+
+    def test_joined_withdrawn(self):
+        # availability is withdrawn by the joined handler too, which runs in
+        # the same hook as the bound-address changed handler
+        units = self.patch_published([{'bound-address': '192.0.2.1'},
+                                      {'bound-address': '192.0.2.2'}])
+        units[1].received = {'bound-address': ''}
+        self.patch_hook('some-relation-relation-changed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.joined()
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 False)
+
+    def test_bound_address_changed(self):
+        self.patch_published([{'bound-address': '192.0.2.1'},
+                              {'bound-address': '192.0.2.2'}])
+        self.patch_hook('some-relation-relation-changed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.bound_address_changed()
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 True)
+        self.clear_flag.assert_called_once_with(
+            'endpoint.some-relation.changed.bound-address')
+        self.set_flag.assert_called_once_with(
+            'some-relation.servers-changed')
+        self.update_query_state.assert_called_once_with()
+
+    def test_bound_address_withdrawn(self):
+        units = self.patch_published([{'bound-address': '192.0.2.1'},
+                                      {'bound-address': '192.0.2.2'}])
+        units[1].received = {'bound-address': ''}
+        self.patch_hook('some-relation-relation-changed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.bound_address_changed()
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 False)
+        self.set_flag.assert_called_once_with(
+            'some-relation.servers-changed')
+
+    def test_departed(self):
+        units = self.patch_published([{'bound-address': '192.0.2.1'},
+                                      {'bound-address': '192.0.2.2'}])
+        # the departing unit is no longer listed in its departed hook
+        self.target._all_joined_units = units[:1]
+        self.expected_related_units.return_value = ['some-unit/0']
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.departed()
+        self.assertEquals(self.target._load_published_units(),
+                          (set(['some-unit/0']), set(['some-unit/0'])))
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 True)
+        self.set_flag.assert_called_once_with(
+            'some-relation.servers-changed')
+        self.update_query_state.assert_called_once_with()
+
+    def test_departed_expected(self):
+        # the departing unit is still expected, e.g. while it is replaced
+        units = self.patch_published([{'bound-address': '192.0.2.1'},
+                                      {'bound-address': '192.0.2.2'}])
+        self.target._all_joined_units = units[:1]
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.departed()
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 False)
+        self.set_flag.assert_called_once_with(
+            'some-relation.servers-changed')
+
+    def test_departed_other_hook(self):
+        # the departed flag is left set, the handler keeps running in later
+        # hooks without raising servers-changed again
+        self.patch_published([{'bound-address': '192.0.2.1'},
+                              {'bound-address': '192.0.2.2'}])
+        self.patch_hook('update-status')
+        self.target.departed()
+        self.toggle_flag.assert_called_once_with('some-relation.available',
+                                                 True)
+        self.assertFalse(self.set_flag.called)
+        self.update_query_state.assert_called_once_with()
+
+    def test_relay_units(self):
+        self.patch_units([
+            {'bound-address': '10.0.1.1'},
+            {'bound-address': '10.0.2.1',
+             'ovsdb-relay': {'sb-upstream': ['ssl:10.0.1.1:6642']}},
+            {'bound-address': 'bogus',
+             'ovsdb-relay': {'sb-upstream': ['ssl:10.0.1.1:6642']}},
+            {'bound-address': '10.0.2.2', 'ovsdb-relay': {}},
+        ])
+        self.assertEquals(
+            [unit.unit_name for unit in self.target.relay_units],
+            ['some-unit/1', 'some-unit/3'])
+        self.assertEquals(self.target.relay_units[0].relay_upstream,
+                          ('ssl:10.0.1.1:6642',))
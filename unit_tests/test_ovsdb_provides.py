@@ -0,0 +1,89 @@
+# Copyright 2019 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+# the interface package name is shadowed by the ``ovsdb`` module in src/lib
+from src.ovsdb import provides
+
+import charms_openstack.test_utils as test_utils
+
+
+class TestOVSDBProvides(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.target = provides.OVSDBProvides('some-relation', [])
+        self._patches = {}
+        self._patches_start = {}
+        self.patch_object(provides.ovsdb.ch_core.hookenv, 'cache', new={})
+
+    def tearDown(self):
+        self.target = None
+        for k, v in self._patches.items():
+            v.stop()
+            setattr(self, k, None)
+        self._patches = None
+        self._patches_start = None
+
+    def patch_target(self, attr, return_value=None):
+        mocked = mock.patch.object(self.target, attr)
+        self._patches[attr] = mocked
+        started = mocked.start()
+        started.return_value = return_value
+        self._patches_start[attr] = started
+        setattr(self, attr, started)
+
+    def patch_kv(self):
+        store = {}
+        kv = mock.MagicMock()
+        kv.get.side_effect = lambda key, default=None: store.get(key, default)
+        kv.set.side_effect = store.__setitem__
+        self.patch_object(provides.ch_core.unitdata, 'kv', return_value=kv)
+        return store
+
+    def patch_hook(self, hook_name, relation_id=None, remote_unit=None):
+        self.patch_object(provides.ch_core.hookenv, 'hook_name',
+                          return_value=hook_name)
+        self.patch_object(provides.ch_core.hookenv, 'relation_id',
+                          return_value=relation_id)
+        self.patch_object(provides.ch_core.hookenv, 'remote_unit',
+                          return_value=remote_unit)
+
+    def test_departed(self):
+        self.patch_kv()
+        self.patch_target('invalidate_relation_snapshot')
+        self.target._save_published_units(
+            set(['some-unit/0', 'some-unit/1']),
+            set(['some-unit/0', 'some-unit/1']))
+        self.patch_hook('some-relation-relation-departed',
+                        relation_id='some-relation:42',
+                        remote_unit='some-unit/1')
+        self.target.departed()
+        self.assertEquals(self.target._load_published_units(),
+                          (set(['some-unit/0']), set(['some-unit/0'])))
+        self.invalidate_relation_snapshot.assert_called_once_with()
+
+    def test_departed_other_hook(self):
+        self.patch_kv()
+        self.patch_target('invalidate_relation_snapshot')
+        self.target._save_published_units(
+            set(['some-unit/0', 'some-unit/1']),
+            set(['some-unit/0', 'some-unit/1']))
+        self.patch_hook('update-status')
+        self.target.departed()
+        self.assertEquals(self.target._load_published_units(),
+                          (set(['some-unit/0', 'some-unit/1']),
+                           set(['some-unit/0', 'some-unit/1'])))
+        self.assertFalse(self.invalidate_relation_snapshot.called)